@@ -1,37 +1,154 @@
+import logging
 import os
 from dotenv import load_dotenv
-from groq import Groq
+from groq import AsyncGroq, Groq
+from metrics import LLM_ERRORS, observe_usage
+from response_cache import history_key
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Start of the reply returned in place of an answer when the LLM call fails
+ERROR_PREFIX = "Error generating response: "
+
+class LLMStreamError(Exception):
+    # Raised by stream_tutoring_response when the LLM call fails, possibly
+    # after part of the reply was yielded; that part is not an answer
+    pass
+
+def build_completion_request(prompt, progress_context, stream, history=None):
+    # history: earlier turns of the conversation as chat messages, from
+    # ConversationMemory.context()
+    return dict(
+        messages=[
+            {
+                "role": "system",
+                "content": f"You are a tutoring AI. {progress_context} Strictly follow the path restrictions in the context. Refuse to answer questions that do not match the specified path rules."
+            },
+            *(history or []),
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        model="llama3-8b-8192",
+        temperature=0.5,
+        max_tokens=1024,
+        top_p=1,
+        stop=None,
+        stream=stream,
+    )
+
+def _chunk_usage(chunk):
+    # Groq reports token usage on the final stream chunk, under x_groq
+    x_groq = getattr(chunk, "x_groq", None)
+    return getattr(x_groq, "usage", None) or getattr(chunk, "usage", None)
+
+def _llm_failed(error):
+    LLM_ERRORS.inc()
+    logger.error("Groq request failed", extra={"error": str(error)})
+
+def _api_key():
+    api_key = os.environ.get('GROQ_API_KEY')  # Fetch API key from environment
+    if not api_key:
+        raise ValueError("GROQ_API_KEY is not set in the environment")
+    return api_key
+
 class GroqClient:
-    def __init__(self):
-        api_key = os.environ.get('GROQ_API_KEY')  # Fetch API key from environment
-        if not api_key:
-            raise ValueError("GROQ_API_KEY is not set in the environment")
-        self.client = Groq(api_key=api_key)
+    def __init__(self, cache=None):
+        # Optional ResponseCache; callers opt in per request with cache_key
+        self.cache = cache
+        self.client = Groq(api_key=_api_key())
+
+    def _create_completion(self, prompt, progress_context, stream, history=None):
+        return self.client.chat.completions.create(
+            **build_completion_request(prompt, progress_context, stream, history)
+        )
+
+    # An answer that builds on earlier turns only fits that conversation, so
+    # questions asked with history are cached under their history window too
+    # (history_key)
+    def _cached(self, cache_key, history=None):
+        if self.cache is None or cache_key is None:
+            return None
+        return self.cache.get(history_key(cache_key, history))
+
+    def _store(self, cache_key, response, history=None):
+        if self.cache is not None and cache_key is not None and response:
+            self.cache.put(history_key(cache_key, history), response)
+
+    def get_tutoring_response(self, prompt, progress_context, cache_key=None, history=None):
+        cached = self._cached(cache_key, history)
+        if cached is not None:
+            return cached
+        try:
+            chat_completion = self._create_completion(prompt, progress_context, stream=False, history=history)
+            response = chat_completion.choices[0].message.content
+            observe_usage(chat_completion.usage)
+        except Exception as e:
+            _llm_failed(e)
+            # Never cached: the next identical question should retry the LLM
+            return f"{ERROR_PREFIX}{str(e)}"
+        self._store(cache_key, response, history)
+        return response
+
+    def stream_tutoring_response(self, prompt, progress_context, cache_key=None, history=None):
+        # Yields the reply in token chunks as the model generates them.
+        # Raises LLMStreamError if the LLM call fails.
+        cached = self._cached(cache_key, history)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        try:
+            for chunk in self._create_completion(prompt, progress_context, stream=True, history=history):
+                observe_usage(_chunk_usage(chunk))
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    chunks.append(content)
+                    yield content
+        except Exception as e:
+            _llm_failed(e)
+            raise LLMStreamError(f"{ERROR_PREFIX}{str(e)}") from e
+        self._store(cache_key, "".join(chunks), history)
+
+class AsyncGroqClient(GroqClient):
+    # Same behaviour and cache handling on top of the asyncio Groq client, for
+    # async_app.py
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.client = AsyncGroq(api_key=_api_key())
+
+    async def get_tutoring_response(self, prompt, progress_context, cache_key=None, history=None):
+        cached = self._cached(cache_key, history)
+        if cached is not None:
+            return cached
+        try:
+            chat_completion = await self._create_completion(prompt, progress_context, stream=False, history=history)
+            response = chat_completion.choices[0].message.content
+            observe_usage(chat_completion.usage)
+        except Exception as e:
+            _llm_failed(e)
+            return f"{ERROR_PREFIX}{str(e)}"
+        self._store(cache_key, response, history)
+        return response
 
-    def get_tutoring_response(self, prompt, progress_context):
+    async def stream_tutoring_response(self, prompt, progress_context, cache_key=None, history=None):
+        cached = self._cached(cache_key, history)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are a tutoring AI. {progress_context} Strictly follow the path restrictions in the context. Refuse to answer questions that do not match the specified path rules."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model="llama3-8b-8192",
-                temperature=0.5,
-                max_tokens=1024,
-                top_p=1,
-                stop=None,
-                stream=False,
-            )
-            return chat_completion.choices[0].message.content
+            async for chunk in await self._create_completion(prompt, progress_context, stream=True, history=history):
+                observe_usage(_chunk_usage(chunk))
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    chunks.append(content)
+                    yield content
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            _llm_failed(e)
+            raise LLMStreamError(f"{ERROR_PREFIX}{str(e)}") from e
+        self._store(cache_key, "".join(chunks), history)
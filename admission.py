@@ -0,0 +1,554 @@
+import asyncio
+import errno
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from response_cache import normalize_prompt
+
+try:
+    import fcntl
+except ImportError:  # Windows: no record locks, and no pre-forked workers either
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between tries for a student's lane held by another process
+LANE_POLL_INTERVAL = 0.05
+# Shared rows written between sweeps of the stale ones
+SWEEP_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    address TEXT PRIMARY KEY,
+    full_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lessons (
+    address TEXT PRIMARY KEY,
+    lessons INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lessons_updated ON lessons (updated_at);
+"""
+
+
+def flight_key(data):
+    # Requests with the same key are the same turn: same student, path,
+    # payment and (normalized) prompt. None for requests that will fail
+    # validation anyway.
+    student_address, prompt = data.get("student_address"), data.get("prompt")
+    if not isinstance(student_address, str) or not isinstance(prompt, str) or not student_address or not prompt:
+        return None
+    return (student_address.lower(), str(data.get("path", "0")), str(data.get("eth_amount", "0")),
+            normalize_prompt(prompt))
+
+
+def rate_limited(retry_after):
+    # (body, status) for a request over the student's rate limit; the apps
+    # turn retry_after into a Retry-After header
+    return {"error": "Too many requests", "retry_after": math.ceil(retry_after)}, 429
+
+
+def _lane_offset(address):
+    # Byte of the lanes file standing for the student's lane
+    return int.from_bytes(hashlib.sha256(address.encode()).digest()[:7], "big")
+
+
+class AdmissionStore:
+    # Admission state shared by the worker processes of one host, e.g. the
+    # gunicorn workers of a deployment: the students' rate buckets and the
+    # lessons count of their last turn in a SQLite file, and their lanes as
+    # record locks on one byte each of <path>.lanes.
+    #
+    # Record locks belong to the process, not the thread, and the kernel
+    # drops them when the process exits. Threads of one process are kept
+    # apart by StudentLanes' own locks. The lanes file is opened once per
+    # process and never closed: closing any descriptor of it would drop all
+    # of the process's locks on it.
+
+    def __init__(self, path, max_students=100000):
+        self.path = path
+        self.max_students = max_students
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lanes_fd = os.open(f"{path}.lanes", os.O_RDWR | os.O_CREAT, 0o600)
+        self.writes = 0
+
+    def _write(self, change):
+        # change() runs in one write transaction; every SWEEP_EVERY writes
+        # rows that no longer matter are dropped too
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = change()
+                self.writes += 1
+                if self.writes % SWEEP_EVERY == 0:
+                    self._sweep()
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return result
+
+    def _sweep(self):
+        # A full bucket is the same as no bucket. Lessons counts beyond the
+        # max_students most recent are dropped.
+        self.db.execute("DELETE FROM buckets WHERE full_at < ?", (time.time(),))
+        self.db.execute(
+            "DELETE FROM lessons WHERE updated_at < "
+            "(SELECT updated_at FROM lessons ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+            (self.max_students,),
+        )
+
+    def take_token(self, address, rate, burst):
+        # RateLimiter.acquire on the shared bucket. A bucket is stored as the
+        # time it is full again, which gives its tokens at any later time.
+        def change():
+            now = time.time()
+            row = self.db.execute("SELECT full_at FROM buckets WHERE address = ?", (address,)).fetchone()
+            tokens = burst if row is None else min(burst, burst - (row[0] - now) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            self.db.execute(
+                "INSERT OR REPLACE INTO buckets (address, full_at) VALUES (?, ?)",
+                (address, now + (burst - tokens + 1) / rate),
+            )
+            return 0
+        return self._write(change)
+
+    def lessons(self, address):
+        with self.lock:
+            row = self.db.execute("SELECT lessons FROM lessons WHERE address = ?", (address,)).fetchone()
+        return row[0] if row else None
+
+    def store_lessons(self, address, lessons):
+        self._write(lambda: self.db.execute(
+            "INSERT OR REPLACE INTO lessons (address, lessons, updated_at) VALUES (?, ?, ?)",
+            (address, lessons, time.time()),
+        ))
+
+    def try_lock(self, address):
+        # Takes the student's lane for this process; False if another process has it
+        if fcntl is None:
+            return True
+        try:
+            fcntl.lockf(self.lanes_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, _lane_offset(address))
+        except OSError as e:
+            if e.errno in (errno.EACCES, errno.EAGAIN):
+                return False
+            raise
+        return True
+
+    def unlock(self, address):
+        if fcntl is not None:
+            fcntl.lockf(self.lanes_fd, fcntl.LOCK_UN, 1, _lane_offset(address))
+
+
+class RateLimiter:
+    # Token bucket per student address: up to `burst` turns at once, refilled
+    # at `rate` turns per second. Only the least recently seen max_students
+    # buckets are kept; any bucket idle for burst / rate seconds is full
+    # again anyway. A rate of 0 turns the limit off. With an AdmissionStore
+    # the buckets are the store's, shared by all its processes.
+
+    def __init__(self, rate, burst, max_students=100000, store=None):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_students = max_students
+        self.store = store
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # address -> (tokens, monotonic time of last update)
+        self.admitted = 0
+        self.limited = 0
+
+    def acquire(self, address):
+        # Takes a token. Returns 0 if admitted, else seconds until a token is free.
+        if self.rate <= 0:
+            return 0
+        if self.store is not None:
+            wait = self.store.take_token(address, self.rate, self.burst)
+            with self.lock:
+                if wait:
+                    self.limited += 1
+                else:
+                    self.admitted += 1
+            return wait
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.pop(address, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+                self.admitted += 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.limited += 1
+            self.buckets[address] = (tokens, now)
+            while len(self.buckets) > self.max_students:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class _Lane:
+    __slots__ = ("address", "lock", "users", "lessons")
+
+    def __init__(self, address, lock):
+        self.address = address
+        self.lock = lock
+        self.users = 0  # holder and waiters
+        self.lessons = None  # progress written by the student's last turn here
+
+
+class StudentLanes:
+    # One lane per student: a lock a turn holds from its stats read until
+    # its progress is recorded, so two turns of one student never both read
+    # lessons = n and both write n + 1. The lane also remembers the lessons
+    # count its last turn wrote; in write-behind mode that write may not be
+    # mined yet when the next turn reads the chain.
+    #
+    # Idle lanes are kept for their lessons count, up to max_students; the
+    # least recently used idle ones go first.
+    #
+    # With an AdmissionStore the lane is also held across processes: after
+    # the process's own lane lock, a turn takes the student's record lock in
+    # the store, and the lessons count is read from and written to the store.
+
+    def __init__(self, max_students=100000, store=None):
+        self.max_students = max_students
+        self.store = store
+        self.lock = threading.Lock()
+        self.lanes = OrderedDict()  # address -> _Lane
+        self.queued = 0  # turns that had to wait for another turn of the same student
+        self.timeouts = 0
+
+    def _new_lock(self):
+        return threading.Lock()
+
+    def _join(self, address):
+        with self.lock:
+            lane = self.lanes.get(address)
+            if lane is None:
+                lane = self.lanes[address] = _Lane(address, self._new_lock())
+            else:
+                self.lanes.move_to_end(address)
+            if lane.users:
+                self.queued += 1
+            lane.users += 1
+            excess = len(self.lanes) - self.max_students
+            if excess > 0:
+                idle = []
+                for other, other_lane in self.lanes.items():
+                    if len(idle) == excess:
+                        break
+                    if not other_lane.users:
+                        idle.append(other)
+                for other in idle:
+                    del self.lanes[other]
+            return lane
+
+    def _leave(self, lane, timed_out=False):
+        with self.lock:
+            lane.users -= 1
+            if timed_out:
+                self.timeouts += 1
+
+    def acquire(self, address, timeout):
+        # The student's lane, locked; None if the lane stayed busy for timeout seconds
+        deadline = time.monotonic() + timeout
+        lane = self._join(address)
+        if not lane.lock.acquire(timeout=timeout):
+            self._leave(lane, timed_out=True)
+            return None
+        if self.store is None:
+            return lane
+        try:
+            while not self.store.try_lock(address):
+                if time.monotonic() >= deadline:
+                    lane.lock.release()
+                    self._leave(lane, timed_out=True)
+                    return None
+                time.sleep(LANE_POLL_INTERVAL)
+            lane.lessons = self._shared_lessons(lane)
+        except BaseException:
+            self.release(lane, shared=False)
+            raise
+        return lane
+
+    def _shared_lessons(self, lane):
+        try:
+            return self.store.lessons(lane.address)
+        except BaseException:
+            self.store.unlock(lane.address)
+            raise
+
+    def _release_shared(self, lane, lessons):
+        try:
+            if lessons is not None:
+                self.store.store_lessons(lane.address, lessons)
+        except Exception as e:
+            logger.warning("Failed to share the lessons count", extra={"student": lane.address, "error": str(e)})
+        finally:
+            self.store.unlock(lane.address)
+
+    def release(self, lane, shared=True):
+        if self.store is not None and shared:
+            self._release_shared(lane, lane.lessons)
+        lane.lock.release()
+        self._leave(lane)
+
+    def counters(self):
+        with self.lock:
+            return {
+                "students": len(self.lanes),
+                "busy": sum(1 for lane in self.lanes.values() if lane.users),
+                "queued": self.queued,
+                "timeouts": self.timeouts,
+            }
+
+
+class AsyncStudentLanes(StudentLanes):
+    # StudentLanes for the asyncio app: waiting for a lane suspends the
+    # coroutine instead of blocking the event loop. asyncio.Lock wakes
+    # waiters in arrival order. The store's SQLite reads and writes run in
+    # the default executor; the process's lane stays locked until they are
+    # done, so the record lock (held by the process, not the coroutine) is
+    # never taken over early.
+
+    def _new_lock(self):
+        return asyncio.Lock()
+
+    async def acquire(self, address, timeout):
+        deadline = time.monotonic() + timeout
+        lane = self._join(address)
+        try:
+            await asyncio.wait_for(lane.lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._leave(lane, timed_out=True)
+            return None
+        except BaseException:
+            self._leave(lane)
+            raise
+        if self.store is None:
+            return lane
+        try:
+            while not self.store.try_lock(address):
+                if time.monotonic() >= deadline:
+                    lane.lock.release()
+                    self._leave(lane, timed_out=True)
+                    return None
+                await asyncio.sleep(LANE_POLL_INTERVAL)
+            lane.lessons = await asyncio.to_thread(self._shared_lessons, lane)
+        except BaseException:
+            StudentLanes.release(self, lane, shared=False)
+            raise
+        return lane
+
+    def release(self, lane, shared=True):
+        if self.store is None or not shared:
+            return StudentLanes.release(self, lane, shared)
+        done = asyncio.get_running_loop().run_in_executor(None, self._release_shared, lane, lane.lessons)
+        done.add_done_callback(lambda _: StudentLanes.release(self, lane, shared=False))
+
+
+class _Flight:
+    __slots__ = ("done", "result")
+
+    def __init__(self, done):
+        self.done = done
+        self.result = None
+
+
+class SingleFlight:
+    # Turns in flight by flight_key. The first request for a key (the
+    # leader) runs the turn; identical requests arriving before it finishes
+    # (a double-clicked submit, a client retrying on a slow answer) wait for
+    # and share its (body, status) instead of calling the LLM and writing to
+    # the chain again.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> _Flight
+        self.coalesced = 0
+
+    def _new_event(self):
+        return threading.Event()
+
+    def join(self, key):
+        # (flight, True) for the leader, (flight, False) for a follower
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self.flights[key] = _Flight(self._new_event())
+            return flight, True
+
+    def finish(self, key, flight, result):
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        flight.result = result
+        flight.done.set()
+
+    def wait(self, flight):
+        flight.done.wait()
+        return flight.result
+
+    def counters(self):
+        with self.lock:
+            return {"in_flight": len(self.flights), "coalesced": self.coalesced}
+
+
+class AsyncSingleFlight(SingleFlight):
+    def _new_event(self):
+        return asyncio.Event()
+
+    async def wait(self, flight):
+        await flight.done.wait()
+        return flight.result
+
+
+class Ticket:
+    # One /tutor request's pass through admission control. If result is set
+    # the turn must not run and result is the (body, status) to answer with:
+    # a shared answer for a follower, or a 429. Otherwise run the turn and
+    # call finish() with its (body, status) exactly once; finish() publishes
+    # it to followers and frees the student's lane.
+
+    def __init__(self, admission, key=None, flight=None, result=None):
+        self.admission = admission
+        self.key = key
+        self.flight = flight
+        self.lane = None
+        self.result = result
+        self.finished = flight is None
+
+    def current_stats(self, stats):
+        # Stats with the lessons count of the student's last turn (in this
+        # process, or in any with an AdmissionStore), if the chain is still
+        # behind it
+        if self.lane is None or self.lane.lessons is None or self.lane.lessons <= stats[0]:
+            return stats
+        return [self.lane.lessons, *stats[1:]]
+
+    def finish(self, result):
+        if self.finished:
+            return
+        self.finished = True
+        body, status = result
+        if self.lane is not None:
+            if status == 200 and "progress" in body:
+                self.lane.lessons = body["progress"]
+            self.admission.lanes.release(self.lane)
+            self.lane = None
+        self.admission.flights.finish(self.key, self.flight, result)
+
+
+class Admission:
+    # Per-student admission control for tutoring turns, in front of the LLM
+    # call and the chain writes:
+    # - identical requests in flight are coalesced (SingleFlight)
+    # - each student gets `rate` turns per second with bursts of `burst`
+    #   (RateLimiter); more get a 429 with Retry-After
+    # - a student's turns run one at a time (StudentLanes), waiting at most
+    #   lane_timeout seconds for the previous one
+    # Coalescing is per worker process. Rate limits and lanes are too, unless
+    # an AdmissionStore shares them between the processes of the host.
+
+    def __init__(self, rate, burst, lane_timeout, max_students=100000, store=None):
+        self.limiter = RateLimiter(rate, burst, max_students, store)
+        self.lanes = self._lanes(max_students, store)
+        self.flights = self._flights()
+        self.lane_timeout = lane_timeout
+
+    def _lanes(self, max_students, store):
+        return StudentLanes(max_students, store)
+
+    def _flights(self):
+        return SingleFlight()
+
+    def _lead(self, data):
+        # (ticket, None) for a leader; (None, flight) for a follower. A leader
+        # ticket without a key (an invalid request) is finished already.
+        key = flight_key(data)
+        if key is None:
+            return Ticket(self), None
+        flight, leader = self.flights.join(key)
+        if not leader:
+            return None, flight
+        return Ticket(self, key, flight), None
+
+    def _rate_limited(self, ticket, retry_after):
+        if retry_after:
+            ticket.result = rate_limited(retry_after)
+            ticket.finish(ticket.result)
+        return ticket.finished
+
+    def _lane_busy(self, ticket):
+        ticket.result = ({"error": "Another request for this student is still running"}, 429)
+        ticket.finish(ticket.result)
+        return ticket
+
+    def enter(self, data):
+        # Blocks while a follower waits for its leader, or a leader for the lane
+        ticket, flight = self._lead(data)
+        if flight is not None:
+            return Ticket(self, result=self.flights.wait(flight))
+        if ticket.finished:
+            return ticket
+        try:
+            if self._rate_limited(ticket, self.limiter.acquire(ticket.key[0])):
+                return ticket
+            ticket.lane = self.lanes.acquire(ticket.key[0], self.lane_timeout)
+        except BaseException:
+            # Followers get an answer even if the shared store failed
+            ticket.finish(({"error": "Server error"}, 500))
+            raise
+        if ticket.lane is None:
+            return self._lane_busy(ticket)
+        return ticket
+
+    def counters(self):
+        return {
+            "admitted": self.limiter.admitted,
+            "rate_limited": self.limiter.limited,
+            **self.flights.counters(),
+            **{f"lane_{name}": value for name, value in self.lanes.counters().items()},
+        }
+
+
+class AsyncAdmission(Admission):
+    def _lanes(self, max_students, store):
+        return AsyncStudentLanes(max_students, store)
+
+    def _flights(self):
+        return AsyncSingleFlight()
+
+    async def enter(self, data):
+        ticket, flight = self._lead(data)
+        if flight is not None:
+            return Ticket(self, result=await self.flights.wait(flight))
+        if ticket.finished:
+            return ticket
+        try:
+            if self.limiter.store is None:
+                retry_after = self.limiter.acquire(ticket.key[0])
+            else:
+                retry_after = await asyncio.to_thread(self.limiter.acquire, ticket.key[0])
+            if self._rate_limited(ticket, retry_after):
+                return ticket
+            ticket.lane = await self.lanes.acquire(ticket.key[0], self.lane_timeout)
+        except BaseException:
+            ticket.finish(({"error": "Request cancelled, please retry"}, 503))
+            raise
+        if ticket.lane is None:
+            return self._lane_busy(ticket)
+        return ticket
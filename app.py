@@ -1,144 +1,37 @@
-from flask import Flask, request, jsonify, send_from_directory
-from GroqClient import GroqClient
-from blockchain_client import BlockchainClient
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from config import Config
+from GroqClient import LLMStreamError
+from services import get_services
+from prompt_classifier import PATH_CONTEXT
+from turns import (
+    parse_turn_request, build_turn, turn_record, anchored_turn, turn_writes, turn_result, stats_result, history_result,
+    parse_stats_batch, remember_turn, request_error, llm_error,
+)
+from logging_config import configure_logging
+import metrics
+from metrics import stage
 import json
-import datetime
-import traceback
+import logging
+import time
+
+configure_logging(Config.LOG_LEVEL)
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder="./frontend", static_url_path="")
-groq_client = GroqClient()
-blockchain = BlockchainClient()
-
-# In-memory chat history storage (for demo, reset on restart)
-chat_history = {}  # {student_address: {path: [messages]}}
-
-# Helper function to check if prompt matches the path
-def validate_prompt_for_path(prompt, path):
-    prompt_lower = prompt.lower()
-
-    # Normalize prompt by removing extra spaces for better matching
-    prompt_normalized = " ".join(prompt_lower.split())
-    
-    if path == 1:  # DSA only
-        dsa_keywords = [
-    "data structure", "algorithm", "binary search", "sorting", "graph", "tree", "linked list", 
-    "stack", "queue", "hash", "hashing", "hashmap", "hashtable", "set", "map", "array", "matrix",
-    "dp", "dynamic programming", "greedy", "divide and conquer", "backtracking", "recursion", 
-    "iterative", "bfs", "dfs", "breadth first search", "depth first search", "topological sort", 
-    "shortest path", "dijkstra", "bellman-ford", "floyd-warshall", "kruskal", "prim", "mst", 
-    "minimum spanning tree", "union find", "disjoint set", "trie", "segment tree", "fenwick tree", 
-    "binary indexed tree", "heap", "priority queue", "binary tree", "bst", "binary search tree", 
-    "avl tree", "red-black tree", "b tree", "b+ tree", "suffix tree", "suffix array", "knapsack", 
-    "lcs", "longest common subsequence", "lis", "longest increasing subsequence", "edit distance", 
-    "string matching", "kmp", "knuth-morris-pratt", "rabin-karp", "two pointers", "sliding window", 
-    "merge sort", "quick sort", "heap sort", "bubble sort", "insertion sort", "selection sort", 
-    "radix sort", "bucket sort", "counting sort", "big o", "time complexity", "space complexity", 
-    "asymptotic notation", "recurrence relation", "master theorem", "floyd cycle", "tortoise hare", 
-    "kadane", "maximum subarray", "n queen", "sudoku", "permutation", "combination", "bit manipulation", 
-    "bitmask", "xor", "and operation", "or operation", "bitwise", "graph traversal", "cycle detection", 
-    "connected components", "strongly connected components", "tarjan", "kosaraju", "articulation point", 
-    "bridge edge", "eulerian path", "hamiltonian path", "flow network", "max flow", "min cut", 
-    "ford-fulkerson", "bipartite graph", "matching", "hungarian algorithm"
-]
-        if not any(keyword in prompt_lower for keyword in dsa_keywords):
-            return False, "Please ask a DSA-related question (e.g., about sorting, graphs, or dynamic programming)."
-    
-    elif path == 2:  # Programming
-        programming_keywords = [
-    "code", "coding", "programming", "debug", "debugging", "syntax", "function", "variable", "loop", 
-    "class", "object", "javascript", "java", "c++", "cpp", "ruby", "sql", "html", "css", "python", 
-    "go", "golang", "rust", "typescript", "php", "swift", "kotlin", "scala", "perl", "r language", 
-    "matlab", "shell", "bash", "powershell", "perl", "lua", "dart", "assembly", "asm", "c#", "csharp", 
-    "vb", "visual basic", "f#", "erlang", "elixir", "haskell", "clojure", "lisp", "fortran", "cobol", 
-    "pascal", "delphi", "ada", "ocaml", "prolog", "script", "program", "compile", "compiler", "interpret", 
-    "interpreter", "runtime", "exception", "error handling", "try catch", "throw", "finally", "stack trace", 
-    "memory leak", "pointer", "reference", "dereference", "memory management", "garbage collection", 
-    "heap memory", "stack memory", "thread", "multithreading", "concurrency", "parallel", "async", 
-    "asynchronous", "promise", "callback", "event loop", "closure", "scope", "lexical scope", "hoisting", 
-    "inheritance", "polymorphism", "encapsulation", "abstraction", "interface", "abstract class", "method", 
-    "constructor", "destructor", "getter", "setter", "property", "static method", "instance", "singleton", 
-    "factory pattern", "observer pattern", "strategy pattern", "decorator pattern", "mvc", "model view controller", 
-    "rest api", "graphql", "http request", "json", "xml", "yaml", "database", "query", "orm", "object relational mapping", 
-    "crud", "create read update delete", "regex", "regular expression", "unit test", "testing", "tdd", 
-    "test driven development", "mock", "stub", "framework", "library", "package", "module", "import", 
-    "export", "dependency", "pip", "npm", "yarn", "maven", "gradle", "docker", "container", "virtual machine", 
-    "devops", "ci cd", "continuous integration", "continuous deployment", "git", "version control", "commit", 
-    "branch", "merge", "pull request", "repository", "frontend", "backend", "full stack", "web development", 
-    "mobile development", "app development", "cross platform", "ide", "integrated development environment", 
-    "vscode", "visual studio", "eclipse", "intellij", "pycharm", "sublime", "atom", "jupyter", "notebook"
-]
-        if not any(keyword in prompt_lower for keyword in programming_keywords):
-            return False, "Please ask a programming-related question (e.g., about coding, debugging, or syntax)."
-    
-    elif path == 3:  # BlockChain
-        blockchain_keywords = ["blockchain", "ethereum", "smart contract", "crypto", "bitcoin", "decentralized", "ledger", "token", "web3", "dapp"]
-        if not any(keyword in prompt_lower for keyword in blockchain_keywords):
-            return False, "Please ask a blockchain-related question (e.g., about Ethereum, smart contracts, or decentralization)."
-    
-    elif path == 4:  # Non Tech field (Aerospace, Mechanical, Electrical)
-        non_tech_keywords = [
-    "aerospace", "mechanical", "electrical", "aerodynamics", "thermodynamics", "robotics", "circuits", 
-    "motors", "avionics", "engineering", "aeronautical", "astronautical", "flight dynamics", "lift", "drag", 
-    "thrust", "propulsion", "jet engine", "turbine", "rocket", "spacecraft", "satellite", "orbit", "trajectory", 
-    "reentry", "thermal protection", "guidance system", "navigation", "control system", "aerofoil", "wing", 
-    "fuselage", "empennage", "stability", "control surface", "flaps", "ailerons", "rudder", "elevator", 
-    "wind tunnel", "computational fluid dynamics", "cfd", "mach number", "supersonic", "hypersonic", 
-    "transonic", "laminar flow", "turbulent flow", "boundary layer", "nozzle", "combustion", "fuel system", 
-    "mechanical design", "cad", "computer aided design", "solidworks", "autodesk", "finite element analysis", 
-    "fea", "stress analysis", "strain", "material science", "mechanics", "statics", "dynamics", "kinematics", 
-    "vibration", "fatigue", "fracture mechanics", "manufacturing", "cnc", "machining", "3d printing", 
-    "additive manufacturing", "welding", "fabrication", "assembly", "gear", "bearing", "shaft", "lever", 
-    "pulley", "cam", "spring", "piston", "crankshaft", "flywheel", "hydraulics", "pneumatics", "pump", 
-    "valve", "actuator", "sensor", "control engineering", "pid controller", "feedback loop", "servo", 
-    "stepper motor", "dc motor", "ac motor", "induction motor", "synchronous motor", "transformer", 
-    "capacitor", "resistor", "inductor", "diode", "transistor", "mosfet", "bjt", "op amp", "operational amplifier", 
-    "circuit design", "pcb", "printed circuit board", "schematic", "breadboard", "multimeter", "oscilloscope", 
-    "signal processing", "filter", "amplifier", "rectifier", "inverter", "converter", "power supply", "ac dc", 
-    "dc ac", "voltage", "current", "resistance", "ohm's law", "kirchhoff's law", "thevenin", "norton", 
-    "superposition", "maxwell's equations", "electromagnetism", "magnetic field", "electric field", "faraday's law", 
-    "induction", "generator", "alternator", "battery", "solar panel", "renewable energy", "power electronics", 
-    "microcontroller", "arduino", "raspberry pi", "embedded system", "iot", "internet of things", "automation", 
-    "plc", "programmable logic controller", "scada", "supervisory control", "relay", "switchgear", "fuse", 
-    "circuit breaker", "grounding", "earthing", "lightning protection", "hvac", "heating ventilation", "air conditioning"
-]
-        if not any(keyword in prompt_lower for keyword in non_tech_keywords):
-            return False, "Please ask a question related to Aerospace, Mechanical, or Electrical fields (e.g., about aerodynamics, circuits, or robotics)."
-    
-    elif path == 5:  # Random (no studies/tech)
-        study_tech_keywords = [
-    "study", "learn", "code", "coding", "programming", "blockchain", "dsa", "data structure", "algorithm", 
-    "python", "javascript", "ethereum", "java", "c++", "cpp", "ruby", "sql", "html", "css", "go", "golang", 
-    "rust", "typescript", "php", "swift", "kotlin", "scala", "perl", "r language", "matlab", "shell", "bash", 
-    "powershell", "lua", "dart", "assembly", "asm", "c#", "csharp", "vb", "visual basic", "f#", "erlang", 
-    "elixir", "haskell", "clojure", "lisp", "fortran", "cobol", "pascal", "delphi", "ada", "ocaml", "prolog", 
-    "script", "program", "compile", "compiler", "interpret", "interpreter", "runtime", "exception", 
-    "error handling", "debug", "debugging", "syntax", "function", "variable", "loop", "class", "object", 
-    "smart contract", "crypto", "cryptocurrency", "bitcoin", "decentralized", "ledger", "token", "web3", 
-    "dapp", "solidity", "vyper", "truffle", "hardhat", "ganache", "metamask", "wallet", "private key", 
-    "public key", "address", "transaction", "gas", "mining", "proof of work", "proof of stake", "consensus", 
-    "aerospace", "mechanical", "electrical", "aerodynamics", "thermodynamics", "robotics", "circuits", 
-    "motors", "avionics", "engineering", "aeronautical", "astronautical", "flight dynamics", "propulsion", 
-    "jet engine", "rocket", "spacecraft", "satellite", "mechanical design", "cad", "finite element analysis", 
-    "kinematics", "vibration", "manufacturing", "cnc", "hydraulics", "pneumatics", "transformer", "capacitor", 
-    "resistor", "diode", "transistor", "circuit design", "power electronics", "microcontroller", "arduino", 
-    "embedded system", "iot", "automation", "plc", "scada", "math", "mathematics", "algebra", "calculus", 
-    "geometry", "trigonometry", "probability", "statistics", "linear algebra", "differential equations", 
-    "physics", "chemistry", "biology", "science", "experiment", "research", "education", "school", "university", 
-    "college", "exam", "test", "quiz", "homework", "assignment", "project", "lecture", "lesson", "course", 
-    "curriculum", "syllabus", "teacher", "professor", "student", "learn", "learning", "knowledge", "academic", 
-    "study material", "textbook", "paper", "thesis", "dissertation", "software", "hardware", "network", 
-    "database", "server", "client", "api", "rest api", "graphql", "json", "xml", "yaml", "cloud", "aws", 
-    "azure", "gcp", "docker", "kubernetes", "devops", "ci cd", "git", "version control", "machine learning", 
-    "ai", "artificial intelligence", "deep learning", "neural network", "data science", "big data", "analytics", 
-    "cybersecurity", "hacking", " penetration testing", "encryption", "security", "password", "authentication", 
-    "authorization", "oauth", "jwt", "token", "frontend", "backend", "full stack", "web development", 
-    "mobile development", "app development", "ide", "vscode", "visual studio", "eclipse", "intellij"
-]
-        if any(keyword in prompt_lower for keyword in study_tech_keywords):
-            return False, "Please ask a casual, non-study-related question (e.g., about movies, hobbies, or fun topics)."
-    
-    return True, ""
+# Clients, stores and background threads are built per worker process on
+# first use (see services.py); gunicorn.conf.py warms them up after forking.
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are timed up to their headers; the stream itself is
+    # covered by the llm and record stages
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe_request(endpoint, response.status_code, time.perf_counter() - g.request_started)
+    return response
 
 # Serve index.html at the root URL
 @app.route("/")
@@ -147,165 +40,316 @@ def serve_index():
 
 
 
-@app.route("/tutor", methods=["POST"])
-def tutor_session():
-    data = request.json
-    print(f"Raw request data: {data}")
+# (body, status) as a JSON response; a 429 also says when to retry
+def json_response(result):
+    body, status = result
+    response = jsonify(body)
+    response.status_code = status
+    if "retry_after" in body:
+        response.headers["Retry-After"] = str(body["retry_after"])
+    return response
 
-    try:
-        student_address = data.get("student_address")
-        prompt = data.get("prompt")
-        eth_amount_raw = data.get("eth_amount", "0")
-        eth_amount = int(eth_amount_raw) if eth_amount_raw else 0
-        path = int(data.get("path", "0"))  # Default to "0" as string, then convert
-        if path not in [1, 2, 3, 4, 5]:  # Updated path validation
-            path = 1  # Default to No Path if invalid
-        print(f"Parsed path: {path}")
-
-        print(f"Parsed data - student_address: {student_address}, prompt: {prompt}, eth_amount: {eth_amount}, path: {path}")
-
-        if not student_address or not prompt:
-            return jsonify({"error": "Missing student address or prompt"}), 400
-        
-        # Validate prompt against path rules
-        is_valid, error_message = validate_prompt_for_path(prompt, path)
-        if not is_valid:
-            return jsonify({"custom error": error_message}), 400
-
-        stats = blockchain.get_stats(student_address)
-        lessons, score, sessions, balance, badge_ids, current_path, challenges = stats
-        print(f"Current stats: lessons={lessons}, score={score}, sessions={sessions}, balance={balance}, badges={badge_ids}, path={current_path}, challenges={challenges}")
-
-        if eth_amount > 0:
-            print(f"Attempting payment of {eth_amount} wei for {student_address}")
-            student_private_key = Config.STUDENT_PRIVATE_KEY
-            if not student_private_key:
-                return jsonify({"error": "Student private key not configured in .env"}), 400
-
-            tx = blockchain.pay_for_session(student_address, eth_amount)
-            print(f"Transaction built: {tx}")
-            signed_tx = blockchain.w3.eth.account.sign_transaction(tx, student_private_key)
-            print(f"Transaction signed with student key")
-            try:
+# Everything a tutoring turn needs before the LLM call: parse and validate the
+# request, read stats and take the optional payment. Returns (turn, None) or
+# (None, (error_body, status)).
+def start_turn(data, ticket):
+    services = get_services()
+    blockchain = services.blockchain
+    with stage("validate"):
+        fields, error = parse_turn_request(data)
+    if error:
+        return None, error
+    student_address, eth_amount = fields["student_address"], fields["eth_amount"]
+
+    with stage("get_stats"):
+        stats = ticket.current_stats(blockchain.get_stats(student_address))
+
+    if eth_amount > 0:
+        logger.info("Taking session payment", extra={"student": student_address, "amount_wei": eth_amount})
+        student_private_key = Config.STUDENT_PRIVATE_KEY
+        if not student_private_key:
+            return None, ({"error": "Student private key not configured in .env"}, 400)
+
+        try:
+            with stage("payment"):
+                tx = blockchain.pay_for_session(student_address, eth_amount)
+                signed_tx = blockchain.w3.eth.account.sign_transaction(tx, student_private_key)
                 tx_hash = blockchain.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
                 receipt = blockchain.w3.eth.wait_for_transaction_receipt(tx_hash)
-                print(f"Payment tx hash: {tx_hash.hex()}, Receipt: {receipt}")
-            except Exception as e:
-                print(f"Transaction failed: {str(e)}")
-                return jsonify({"error": f"Payment failed: {str(e)}"}), 400
-
-        # Get AI response with path context
-        # Define path-specific context
-        path_context = {
-            1: "DSA only - Answer questions strictly about Data Structures and Algorithms (e.g., sorting, graphs, dynamic programming). Refuse to answer non-DSA questions.",
-            2: "Programming - Answer questions strictly about programming (e.g., coding, debugging, syntax, any language). Refuse to answer non-programming questions.",
-            3: "BlockChain - Answer questions strictly about blockchain (e.g., Ethereum, smart contracts, decentralization). Refuse to answer non-blockchain questions.",
-            4: "Non Tech field - Answer questions strictly about Aerospace, Mechanical, or Electrical fields (e.g., aerodynamics, circuits, robotics). Refuse to answer questions outside these fields.",
-            5: "Random - Engage in casual conversation only (e.g., about movies, hobbies, fun topics). Refuse to answer any study-related or tech-related questions."
-        }
-        # Get AI response with path-specific context
-        context = f"Lessons completed: {lessons}, Path: {path_context[path]}"
-        response = groq_client.get_tutoring_response(prompt, context)
-        question_complexity = min(len(prompt) // 10, 10)
-
-        # Update progress with path
-        blockchain.update_progress(student_address, lessons + 1, question_complexity, path)
-
-        # Simulate a challenge (e.g., every 3rd lesson)
-        if (lessons + 1) % 3 == 0:
-            blockchain.complete_challenge(student_address, (lessons + 1) // 3)
-
-        # Store chat history
-        # if student_address not in chat_history:
-        #     chat_history[student_address] = {}
-        # if path not in chat_history[student_address]:
-        #     chat_history[student_address][path] = []
-        # chat_history[student_address][path].append({
-        #     "prompt": prompt,
-        #     "response": response,
-        #     "timestamp": str(datetime.datetime.now()),
-        #     "path": path
-        # })
-        # print(f"Storing chat for path: {path}")
-        # print(f"Chat history for {student_address}, path {path}: {chat_history[student_address][path]}")
-
-        # Store chat history on-chain
-        timestamp = int(datetime.datetime.now().timestamp())
-        # print(f"Before storing chat message: student={student_address}, prompt={prompt}, response={response}, path={path}, timestamp={timestamp}")
-        # blockchain.store_chat_message(student_address, prompt, response, path, timestamp)
-        # print(f"Chat message stored successfully for {student_address}, path {path}")
-        print(f"Attempting to store chat message: student={student_address}, prompt={prompt}, response={response}, path={path}, timestamp={timestamp}")
+            blockchain.stats_cache.invalidate(student_address, receipt["blockNumber"])
+            logger.debug("Payment mined", extra={"tx_hash": tx_hash.hex(), "block": receipt["blockNumber"]})
+        except Exception as e:
+            logger.warning("Payment failed", extra={"student": student_address, "error": str(e)})
+            return None, ({"error": f"Payment failed: {str(e)}"}, 400)
+
+    history = None
+    if Config.CONVERSATION_MEMORY:
+        with stage("memory"):
+            history = services.conversation_memory.context(student_address, fields["path"], Config.CONTEXT_TOKEN_BUDGET)
+    return build_turn(fields, stats, history), None
+
+# Records a finished turn on-chain (or queues it in write-behind mode) and
+# returns the JSON body for the client. Raises if the on-chain write fails.
+def finish_turn(turn, response):
+    services = get_services()
+    record = turn_record(turn, response)
+    student_address, path = turn["student_address"], turn["path"]
+    anchored = None
+    if services.chat_store is not None:
+        anchored = anchored_turn(record, services.chat_store.put(turn["prompt"], response))
+
+    if services.tx_queue is not None:
+        # Write-behind: queue the turn and answer with optimistic stats
+        with stage("record"):
+            job_id = services.tx_queue.enqueue(turn_writes(record, anchored))
+        logger.info("Queued on-chain writes", extra={"student": student_address, "path": path, "job_id": job_id})
+        remember_turn(services.conversation_memory, turn, record)
+        return turn_result(turn, record, job_id)
+
+    # Progress, challenge and chat message (or its anchor) go on-chain in one
+    # transaction
+    with stage("record"):
+        if anchored is not None:
+            services.blockchain.record_turns_anchored([anchored])
+        else:
+            services.blockchain.record_turn(*record)
+    logger.info("Turn recorded", extra={"student": student_address, "path": path})
+    remember_turn(services.conversation_memory, turn, record)
+    return turn_result(turn, record)
+
+# One /tutor turn that got through admission control, as (body, status)
+def tutor_turn(data, ticket):
+    groq_client = get_services().groq_client
+    try:
+        turn, error = start_turn(data, ticket)
+        if error:
+            return error
+
+        with stage("llm"):
+            response = groq_client.get_tutoring_response(
+                turn["prompt"], turn["context"], turn["cache_key"], turn["history"]
+            )
+        error = llm_error(response)
+        if error:
+            return error
+
         try:
-            blockchain.store_chat_message(student_address, prompt, response, path, timestamp)
-            print(f"Chat message stored successfully for {student_address}, path {path}")
+            return finish_turn(turn, response), 200
         except Exception as e:
-            print(f"Failed to store chat message: {str(e)}")
-            return jsonify({"error": f"Failed to store chat message: {str(e)}"}), 500
-
-        return jsonify({
-            "response": response,
-            "progress": lessons + 1,
-            "score": score + question_complexity,
-            "sessions": sessions + 1 if eth_amount > 0 else sessions,
-            "balance": (balance + (eth_amount if eth_amount > 0 else 0)) / 10**18,
-            "badges": badge_ids,
-            "path": path,
-            "challenges": challenges
-            # "chat_history_all": chat_history.get(student_address, {})  # Send all paths for sidebar
-        })
+            logger.error("Failed to record turn", extra={"student": turn["student_address"], "error": str(e)})
+            return {"error": f"Failed to record turn: {str(e)}"}, 500
+
+    except Exception as e:
+        logger.exception("Unexpected error in /tutor")
+        return {"error": f"Server error: {str(e)}"}, 500
+
+# A /tutor request body through admission control: (ticket, None), or (None,
+# (error_body, status)) if the body isn't a JSON object or admission fails
+def admit(data):
+    error = request_error(data)
+    if error:
+        return None, error
+    try:
+        return get_services().admission.enter(data), None
+    except Exception as e:
+        logger.exception("Admission failed")
+        return None, ({"error": f"Server error: {str(e)}"}, 500)
+
+@app.route("/tutor", methods=["POST"])
+def tutor_session():
+    # Duplicates of a turn in flight get its answer, and a student over the
+    # rate limit gets a 429 (see admission.py)
+    data = request.get_json(silent=True)
+    ticket, error = admit(data)
+    if error:
+        return json_response(error)
+    if ticket.result is not None:
+        return json_response(ticket.result)
+    result = ({"error": "Server error"}, 500)
+    try:
+        result = tutor_turn(data, ticket)
+    finally:
+        ticket.finish(result)
+    return json_response(result)
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # don't let a reverse proxy buffer the stream
+}
 
+# What a stream's followers get if its client goes away before the turn is recorded
+STREAM_CLOSED = ({"error": "Stream closed before the turn was recorded"}, 500)
+
+# A stream request answered by another request's turn: the whole reply as
+# one chunk, then done. Refusals are plain JSON, as for /tutor.
+def shared_stream(result):
+    body, status = result
+    if status != 200:
+        return json_response(result)
+    events = [sse_event("chunk", {"text": body["response"]}), sse_event("done", body)]
+    return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@app.route("/tutor/stream", methods=["POST"])
+def tutor_session_stream():
+    # Same turn as /tutor, but the reply is sent as Server-Sent Events while the
+    # LLM generates it: "chunk" events carry text, then a final "done" event
+    # carries the same body /tutor returns once the on-chain write is through
+    # (or "error" if the LLM call or the write fails).
+    # The ticket is held until the stream ends, since the turn is only
+    # recorded then.
+    data = request.get_json(silent=True)
+    ticket, error = admit(data)
+    if error:
+        return json_response(error)
+    if ticket.result is not None:
+        return shared_stream(ticket.result)
+    groq_client = get_services().groq_client
+
+    try:
+        turn, error = start_turn(data, ticket)
     except Exception as e:
-        print(f"Unexpected error in /tutor: {str(e)}")
-        print(traceback.format_exc())  # Print stack trace for debugging
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
+        logger.exception("Unexpected error in /tutor/stream")
+        error = ({"error": f"Server error: {str(e)}"}, 500)
+    if error:
+        ticket.finish(error)
+        return json_response(error)
+
+    def generate():
+        result = STREAM_CLOSED
+        try:
+            chunks = []
+            try:
+                with stage("llm"):
+                    for chunk in groq_client.stream_tutoring_response(
+                        turn["prompt"], turn["context"], turn["cache_key"], turn["history"]
+                    ):
+                        chunks.append(chunk)
+                        yield sse_event("chunk", {"text": chunk})
+            except LLMStreamError as e:
+                # A partial reply is neither recorded nor remembered
+                result = llm_error(str(e))
+                yield sse_event("error", result[0])
+                return
+            # Chain writes start only once the whole reply is known
+            try:
+                result = (finish_turn(turn, "".join(chunks)), 200)
+                yield sse_event("done", result[0])
+            except Exception as e:
+                logger.error("Failed to record turn", extra={"student": turn["student_address"], "error": str(e)})
+                result = ({"error": f"Failed to record turn: {str(e)}"}, 500)
+                yield sse_event("error", result[0])
+        finally:
+            ticket.finish(result)
+
+    response = Response(generate(), mimetype="text/event-stream", headers=SSE_HEADERS)
+    # Also frees the lane if the client goes away before the stream starts
+    response.call_on_close(lambda: ticket.finish(STREAM_CLOSED))
+    return response
 
 @app.route("/stats/<student_address>", methods=["GET"])
 def get_student_stats(student_address):
+    blockchain = get_services().blockchain
     try:
-        lessons, score, sessions, balance, badge_ids, path, challenges = blockchain.get_stats(student_address)
-        return jsonify({
-            "lessons": lessons,
-            "score": score,
-            "sessions": sessions,
-            "balance": balance / 10**18,
-            "badges": badge_ids,
-            "path": path,
-            "challenges": challenges,
-            "chat_history_all": chat_history.get(student_address, {})  # Send all paths
-        })
+        with stage("get_stats"):
+            stats = blockchain.get_stats(student_address)
+        result = stats_result(stats)
+        # Recent turns this worker holds for each path
+        memory = get_services().conversation_memory
+        result["chat_history_all"] = {
+            path: history_result(turns) for path in PATH_CONTEXT if (turns := memory.turns(student_address, path))
+        }
+        return jsonify(result)
     except Exception as e:
-        print(f"Error getting stats: {str(e)}")
+        logger.error("Error getting stats", extra={"student": student_address, "error": str(e)})
         return jsonify({"error": f"Stats error: {str(e)}"}), 500
 
+@app.route("/stats/batch", methods=["POST"])
+def get_students_stats():
+    # Stats for many students at once, e.g. a class dashboard
+    blockchain = get_services().blockchain
+    addresses, error = parse_stats_batch(request.get_json(silent=True) or {})
+    if error:
+        return jsonify(error[0]), error[1]
+    try:
+        with stage("get_stats_batch"):
+            stats = blockchain.get_stats_many(addresses)
+        return jsonify({"stats": {address: stats_result(stats[address]) for address in addresses}})
+    except Exception as e:
+        logger.error("Error getting batch stats", extra={"count": len(addresses), "error": str(e)})
+        return jsonify({"error": f"Stats error: {str(e)}"}), 500
+
+@app.route("/leaderboard/<int:path>", methods=["GET"])
+def get_leaderboard(path):
+    # Top students on a path by score (path 0: across all paths)
+    services = get_services()
+    try:
+        limit = min(int(request.args.get("limit", 10)), 100)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    with stage("leaderboard_catch_up"):
+        services.chat_indexer.poll_if_stale()
+    leaderboard = services.leaderboard
+    return jsonify({"path": path, "leaderboard": leaderboard.top(path, limit), "students": leaderboard.size(path)})
+
 @app.route("/chat-history/<student_address>/<int:path>", methods=["GET"])
 def get_chat_history(student_address, path):
+    chat_indexer = get_services().chat_indexer
+    try:
+        limit = min(int(request.args.get("limit", 100)), 500)
+        cursor = request.args.get("cursor")
+        since = request.args.get("since", type=int)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
     try:
-        print(f"Fetching chat history for {student_address}, path {path}")
-        # Query the blockchain for ChatMessage events
-        chat_events = blockchain.contract.events.ChatMessage.create_filter(
-            fromBlock=0,
-            argument_filters={"student": student_address}
-        )
-        # ).get_all_entries()
-        print(f"Chat filter created: {chat_events}")
-        chat_event = chat_events.get_all_entries()
-        print(f"Chat events retrieved: {chat_event}")
-        
-        history = []
-        for event in chat_event:
-            event_path = event['args']['path']
-            if event_path == path:
-                history.append({
-                    "prompt": event['args']['prompt'],
-                    "response": event['args']['response'],
-                    "timestamp": datetime.datetime.fromtimestamp(event['args']['timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
-                    "path": event_path
-                })
-        print(f"Chat history for {student_address}, path {path}: {history}")
-        return jsonify({"chat_history": history})
+        # Pick up anything mined since the background indexer last ran
+        with stage("history_catch_up"):
+            chat_indexer.poll_if_stale()
+        try:
+            with stage("history_query"):
+                messages, next_cursor, has_more = chat_indexer.history(student_address, path, limit, cursor, since)
+        except ValueError:
+            return jsonify({"error": f"Invalid cursor: {cursor}"}), 400
+
+        history = history_result(messages)
+        return jsonify({"chat_history": history, "next_cursor": next_cursor, "has_more": has_more})
     except Exception as e:
-        print(f"Error fetching chat history: {str(e)}")
+        logger.error("Error fetching chat history", extra={"student": student_address, "path": path, "error": str(e)})
         return jsonify({"error": f"Error fetching chat history: {str(e)}"}), 500
 
+@app.route("/cache-stats", methods=["GET"])
+def get_cache_stats():
+    # Hit/miss counters to confirm the caches are saving eth_calls and LLM calls
+    services = get_services()
+    return jsonify({
+        "stats_cache": services.blockchain.stats_cache.counters(),
+        "response_cache": services.response_cache.counters(),
+        "conversation_memory": services.conversation_memory.counters(),
+        "admission": services.admission.counters(),
+    })
+
+@app.route("/rpc-endpoints", methods=["GET"])
+def get_rpc_endpoints():
+    # Health, lag and latency of each node endpoint as seen by this worker
+    return jsonify(get_services().blockchain.rpc_pool.stats())
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route("/tx-status/<job_id>", methods=["GET"])
+def get_tx_status(job_id):
+    tx_queue = get_services().tx_queue
+    if tx_queue is None:
+        return jsonify({"error": "Write-behind mode is not enabled"}), 404
+    status = tx_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(status)
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,412 @@
+import asyncio
+import json
+import logging
+import time
+
+from quart import Quart, Response, g, jsonify, request, send_from_directory
+
+from config import Config
+from GroqClient import LLMStreamError
+from logging_config import configure_logging
+import metrics
+from metrics import stage
+from prompt_classifier import PATH_CONTEXT
+from services import get_services
+from turns import (
+    parse_turn_request, build_turn, turn_record, anchored_turn, turn_writes, turn_result, stats_result, history_result,
+    parse_stats_batch, remember_turn, request_error, llm_error,
+)
+
+# asyncio serving path with the same routes and JSON as app.py. Every request
+# is a coroutine rather than a blocked worker thread, so a single process can
+# keep hundreds of tutoring sessions in flight while they wait on the LLM and
+# the chain. Run with:
+#   hypercorn async_app:app --bind 0.0.0.0:5000
+
+configure_logging(Config.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__, static_folder="./frontend", static_url_path="")
+
+
+def current_services():
+    # This worker's clients, stores and background threads (see services.py)
+    return get_services(use_async=True)
+
+
+@app.before_serving
+async def warm_up():
+    # Build them before the first request and open the node connections
+    services = current_services()
+    await asyncio.to_thread(services.warm_up)
+    await services.warm_up_async()
+
+
+@app.after_serving
+async def close_connections():
+    await current_services().async_blockchain.w3.provider.close()
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe_request(endpoint, response.status_code, time.perf_counter() - g.request_started)
+    return response
+
+
+@app.route("/")
+async def serve_index():
+    return await send_from_directory(app.static_folder, "index_new.html")
+
+
+class TurnRejected(Exception):
+    def __init__(self, body, status):
+        super().__init__(body)
+        self.body = body
+        self.status = status
+
+
+async def pay(student_address, eth_amount):
+    with stage("payment"):
+        return await current_services().async_blockchain.pay_for_session(student_address, eth_amount, Config.STUDENT_PRIVATE_KEY)
+
+
+async def run_turn(data, ticket, llm_call):
+    # Runs independent steps side by side. The payment (send plus receipt
+    # wait, the slowest chain step) runs alongside the stats read and then
+    # the LLM call. The LLM only waits for the stats, because its context
+    # includes the lessons count.
+    # llm_call(turn) starts the LLM work and returns an awaitable.
+    with stage("validate"):
+        fields, error = parse_turn_request(data)
+    if error:
+        raise TurnRejected(*error)
+    student_address, eth_amount = fields["student_address"], fields["eth_amount"]
+
+    payment = None
+    if eth_amount > 0:
+        if not Config.STUDENT_PRIVATE_KEY:
+            raise TurnRejected({"error": "Student private key not configured in .env"}, 400)
+        logger.info("Taking session payment", extra={"student": student_address, "amount_wei": eth_amount})
+        payment = asyncio.ensure_future(pay(student_address, eth_amount))
+
+    services = current_services()
+    try:
+        with stage("get_stats"):
+            stats = ticket.current_stats(await services.async_blockchain.get_stats(student_address))
+        history = None
+        if Config.CONVERSATION_MEMORY:
+            # Usually in memory; a miss reads the chat index
+            with stage("memory"):
+                history = await asyncio.to_thread(
+                    services.conversation_memory.context, student_address, fields["path"], Config.CONTEXT_TOKEN_BUDGET
+                )
+    except Exception:
+        if payment is not None:
+            payment.cancel()
+        raise
+    turn = build_turn(fields, stats, history)
+    llm = llm_call(turn)
+
+    if payment is not None:
+        try:
+            await payment
+        except Exception as e:
+            logger.warning("Payment failed", extra={"student": student_address, "error": str(e)})
+            if asyncio.isfuture(llm):
+                llm.cancel()
+            raise TurnRejected({"error": f"Payment failed: {str(e)}"}, 400)
+    return turn, llm
+
+
+async def finish_turn(turn, response):
+    services = current_services()
+    record = turn_record(turn, response)
+    anchored = None
+    if services.chat_store is not None:
+        anchored = anchored_turn(record, await asyncio.to_thread(services.chat_store.put, turn["prompt"], response))
+    if services.tx_queue is not None:
+        with stage("record"):
+            job_id = await asyncio.to_thread(services.tx_queue.enqueue, turn_writes(record, anchored))
+        logger.info("Queued on-chain writes", extra={"student": turn["student_address"], "path": turn["path"], "job_id": job_id})
+        remember_turn(services.conversation_memory, turn, record)
+        return turn_result(turn, record, job_id)
+    with stage("record"):
+        if anchored is not None:
+            await services.async_blockchain.record_turns_anchored([anchored])
+        else:
+            await services.async_blockchain.record_turn(*record)
+    logger.info("Turn recorded", extra={"student": turn["student_address"], "path": turn["path"]})
+    remember_turn(services.conversation_memory, turn, record)
+    return turn_result(turn, record)
+
+
+async def llm_response(turn):
+    with stage("llm"):
+        return await current_services().groq_client.get_tutoring_response(
+            turn["prompt"], turn["context"], turn["cache_key"], turn["history"]
+        )
+
+
+def json_response(result):
+    # (body, status) as a JSON response; a 429 also says when to retry
+    body, status = result
+    response = jsonify(body)
+    response.status_code = status
+    if "retry_after" in body:
+        response.headers["Retry-After"] = str(body["retry_after"])
+    return response
+
+
+async def tutor_turn(data, ticket):
+    # One /tutor turn that got through admission control, as (body, status)
+    try:
+        turn, llm = await run_turn(data, ticket, lambda turn: asyncio.ensure_future(llm_response(turn)))
+        response = await llm
+        error = llm_error(response)
+        if error:
+            return error
+        try:
+            return await finish_turn(turn, response), 200
+        except Exception as e:
+            logger.error("Failed to record turn", extra={"student": turn["student_address"], "error": str(e)})
+            return {"error": f"Failed to record turn: {str(e)}"}, 500
+    except TurnRejected as e:
+        return e.body, e.status
+    except Exception as e:
+        logger.exception("Unexpected error in /tutor")
+        return {"error": f"Server error: {str(e)}"}, 500
+
+
+async def admit(data):
+    # A /tutor request body through admission control: (ticket, None), or
+    # (None, (error_body, status)) if the body isn't a JSON object or
+    # admission fails
+    error = request_error(data)
+    if error:
+        return None, error
+    try:
+        return await current_services().admission.enter(data), None
+    except Exception as e:
+        logger.exception("Admission failed")
+        return None, ({"error": f"Server error: {str(e)}"}, 500)
+
+
+@app.route("/tutor", methods=["POST"])
+async def tutor_session():
+    # Duplicates of a turn in flight get its answer, and a student over the
+    # rate limit gets a 429 (see admission.py)
+    data = await request.get_json(silent=True)
+    ticket, error = await admit(data)
+    if error:
+        return json_response(error)
+    if ticket.result is not None:
+        return json_response(ticket.result)
+    result = ({"error": "Server error"}, 500)
+    try:
+        result = await tutor_turn(data, ticket)
+    finally:
+        ticket.finish(result)
+    return json_response(result)
+
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+# Streamed turns run as tasks that outlive their request, so the ticket is
+# always finished even if the client goes away before the body is sent
+streaming_turns = set()
+
+
+def shared_stream(result):
+    # A stream request answered by another request's turn: the whole reply
+    # as one chunk, then done. Refusals are plain JSON, as for /tutor.
+    body, status = result
+    if status != 200:
+        return json_response(result)
+    events = [sse_event("chunk", {"text": body["response"]}), sse_event("done", body)]
+    return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+async def stream_turn(turn, chunks, ticket, events):
+    # Puts the turn's SSE events on the events queue, then None
+    result = ({"error": "Server error"}, 500)
+    try:
+        parts = []
+        try:
+            with stage("llm"):
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    events.put_nowait(sse_event("chunk", {"text": chunk}))
+        except LLMStreamError as e:
+            # A partial reply is neither recorded nor remembered
+            result = llm_error(str(e))
+            events.put_nowait(sse_event("error", result[0]))
+            return
+        try:
+            result = (await finish_turn(turn, "".join(parts)), 200)
+            events.put_nowait(sse_event("done", result[0]))
+        except Exception as e:
+            logger.error("Failed to record turn", extra={"student": turn["student_address"], "error": str(e)})
+            result = ({"error": f"Failed to record turn: {str(e)}"}, 500)
+            events.put_nowait(sse_event("error", result[0]))
+    except Exception:
+        logger.exception("Unexpected error in /tutor/stream")
+    finally:
+        ticket.finish(result)
+        events.put_nowait(None)
+
+
+@app.route("/tutor/stream", methods=["POST"])
+async def tutor_session_stream():
+    data = await request.get_json(silent=True)
+    ticket, error = await admit(data)
+    if error:
+        return json_response(error)
+    if ticket.result is not None:
+        return shared_stream(ticket.result)
+    try:
+        # The stream is consumed by stream_turn, so nothing starts early
+        turn, chunks = await run_turn(data, ticket, lambda turn: current_services().groq_client.stream_tutoring_response(
+            turn["prompt"], turn["context"], turn["cache_key"], turn["history"]
+        ))
+    except TurnRejected as e:
+        ticket.finish((e.body, e.status))
+        return jsonify(e.body), e.status
+    except asyncio.CancelledError:
+        ticket.finish(({"error": "Request cancelled, please retry"}, 503))
+        raise
+    except Exception as e:
+        logger.exception("Unexpected error in /tutor/stream")
+        ticket.finish(({"error": f"Server error: {str(e)}"}, 500))
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+    events = asyncio.Queue()
+    task = asyncio.ensure_future(stream_turn(turn, chunks, ticket, events))
+    streaming_turns.add(task)
+    task.add_done_callback(streaming_turns.discard)
+
+    async def generate():
+        while (event := await events.get()) is not None:
+            yield event
+
+    return Response(generate(), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.route("/stats/<student_address>", methods=["GET"])
+async def get_student_stats(student_address):
+    try:
+        with stage("get_stats"):
+            stats = await current_services().async_blockchain.get_stats(student_address)
+        result = stats_result(stats)
+        memory = current_services().conversation_memory
+        result["chat_history_all"] = {
+            path: history_result(turns) for path in PATH_CONTEXT if (turns := memory.turns(student_address, path))
+        }
+        return jsonify(result)
+    except Exception as e:
+        logger.error("Error getting stats", extra={"student": student_address, "error": str(e)})
+        return jsonify({"error": f"Stats error: {str(e)}"}), 500
+
+
+@app.route("/stats/batch", methods=["POST"])
+async def get_students_stats():
+    addresses, error = parse_stats_batch(await request.get_json(silent=True) or {})
+    if error:
+        return jsonify(error[0]), error[1]
+    try:
+        with stage("get_stats_batch"):
+            stats = await current_services().async_blockchain.get_stats_many(addresses)
+        return jsonify({"stats": {address: stats_result(stats[address]) for address in addresses}})
+    except Exception as e:
+        logger.error("Error getting batch stats", extra={"count": len(addresses), "error": str(e)})
+        return jsonify({"error": f"Stats error: {str(e)}"}), 500
+
+
+@app.route("/leaderboard/<int:path>", methods=["GET"])
+async def get_leaderboard(path):
+    services = current_services()
+    try:
+        limit = min(int(request.args.get("limit", 10)), 100)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    with stage("leaderboard_catch_up"):
+        await asyncio.to_thread(services.chat_indexer.poll_if_stale)
+    leaderboard = services.leaderboard
+    return jsonify({"path": path, "leaderboard": leaderboard.top(path, limit), "students": leaderboard.size(path)})
+
+
+@app.route("/chat-history/<student_address>/<int:path>", methods=["GET"])
+async def get_chat_history(student_address, path):
+    chat_indexer = current_services().chat_indexer
+    try:
+        limit = min(int(request.args.get("limit", 100)), 500)
+        cursor = request.args.get("cursor")
+        since = request.args.get("since", type=int)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    try:
+        # SQLite reads and the catch-up poll are blocking, so keep them off the loop
+        with stage("history_catch_up"):
+            await asyncio.to_thread(chat_indexer.poll_if_stale)
+        try:
+            with stage("history_query"):
+                messages, next_cursor, has_more = await asyncio.to_thread(
+                    chat_indexer.history, student_address, path, limit, cursor, since
+                )
+        except ValueError:
+            return jsonify({"error": f"Invalid cursor: {cursor}"}), 400
+        return jsonify({"chat_history": history_result(messages), "next_cursor": next_cursor, "has_more": has_more})
+    except Exception as e:
+        logger.error("Error fetching chat history", extra={"student": student_address, "path": path, "error": str(e)})
+        return jsonify({"error": f"Error fetching chat history: {str(e)}"}), 500
+
+
+@app.route("/cache-stats", methods=["GET"])
+async def get_cache_stats():
+    services = current_services()
+    return jsonify({
+        "stats_cache": services.blockchain.stats_cache.counters(),
+        "response_cache": services.response_cache.counters(),
+        "conversation_memory": services.conversation_memory.counters(),
+        "admission": services.admission.counters(),
+    })
+
+
+@app.route("/rpc-endpoints", methods=["GET"])
+async def get_rpc_endpoints():
+    # Health, lag and latency of each node endpoint as seen by this worker
+    return jsonify(current_services().blockchain.rpc_pool.stats())
+
+
+@app.route("/metrics", methods=["GET"])
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/tx-status/<job_id>", methods=["GET"])
+async def get_tx_status(job_id):
+    tx_queue = current_services().tx_queue
+    if tx_queue is None:
+        return jsonify({"error": "Write-behind mode is not enabled"}), 404
+    status = await asyncio.to_thread(tx_queue.status, job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(status)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+
+from eth_account import Account
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import TimeExhausted
+
+from blockchain_client import GAS_MARGIN, node_pool, owner_nonce_counter
+from config import Config
+from metrics import async_rpc_metrics_middleware, stage
+from nonce_manager import AsyncNonceManager, is_nonce_error
+from rpc_pool import AsyncPooledHTTPProvider, read_after
+from stats_cache import StatsCache
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBlockchainClient:
+    # AsyncWeb3 counterpart of BlockchainClient for async_app.py. It only
+    # covers what the request path needs: stats reads, student payments and
+    # recordTurn. Construction makes no network calls; the chain id is fetched
+    # on first use.
+
+    def __init__(self, stats_cache=None, chat_store=None, rpc_pool=None):
+        # Pass the sync client's pool to share its health checks and stats
+        self.rpc_pool = rpc_pool or node_pool()
+        self.w3 = AsyncWeb3(AsyncPooledHTTPProvider(self.rpc_pool))
+        self.w3.middleware_onion.add(async_rpc_metrics_middleware, "rpc_metrics")
+        self.checksum_address = Web3.to_checksum_address(Config.CONTRACT_ADDRESS)
+        self.contract = self.w3.eth.contract(address=self.checksum_address, abi=Config.CONTRACT_ABI)
+        self.owner_account = Account.from_key(Config.PRIVATE_KEY)
+        self.owner_address = self.owner_account.address
+        self.nonces = AsyncNonceManager(self.w3, self.owner_address, owner_nonce_counter(self.owner_address))
+        # Share the sync client's cache so its event watcher invalidates ours
+        self.stats_cache = stats_cache or StatsCache(Config.STATS_CACHE_SIZE)
+        self.chat_store = chat_store
+        self.chain_id = None
+
+    async def _chain_id(self):
+        if self.chain_id is None:
+            self.chain_id = await self.w3.eth.chain_id
+        return self.chain_id
+
+    async def warm_up(self):
+        await self._chain_id()
+
+    async def get_stats(self, student_address):
+        stats = self.stats_cache.get(student_address)
+        if stats is None:
+            token = self.stats_cache.begin_load()
+            with read_after(self.stats_cache.read_block(student_address)):
+                stats = await self.contract.functions.getStudentStats(student_address).call()
+            self.stats_cache.put(student_address, stats, token)
+        return stats
+
+    async def get_stats_many(self, addresses, chunk=200):
+        found = {}
+        missing = []
+        for address in addresses:
+            stats = self.stats_cache.get(address)
+            if stats is None:
+                missing.append(address)
+            else:
+                found[address] = stats
+        for start in range(0, len(missing), chunk):
+            batch = missing[start:start + chunk]
+            token = self.stats_cache.begin_load()
+            with read_after(self.stats_cache.read_block(*batch)):
+                results = await self.contract.functions.getStudentsStats(
+                    [Web3.to_checksum_address(address) for address in batch]
+                ).call()
+            for address, stats in zip(batch, results):
+                stats = list(stats)
+                self.stats_cache.put(address, stats, token)
+                found[address] = stats
+        return found
+
+    async def pay_for_session(self, student_address, amount_wei, student_private_key):
+        nonce = await self.w3.eth.get_transaction_count(student_address)
+        tx = await self.contract.functions.payForSession().build_transaction({
+            "from": student_address,
+            "value": amount_wei,
+            "nonce": nonce,
+            "chainId": await self._chain_id(),
+            "gas": 200000,
+            "gasPrice": Web3.to_wei("20", "gwei"),
+        })
+        signed_tx = Account.sign_transaction(tx, student_private_key)
+        tx_hash = await self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        receipt = await self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        self.stats_cache.invalidate(student_address, receipt["blockNumber"])
+        return receipt
+
+    async def estimate_gas(self, contract_call):
+        return int(await contract_call.estimate_gas({"from": self.owner_address}) * GAS_MARGIN)
+
+    async def _send_owner_transaction(self, contract_call, gas=None, attempts=3):
+        if gas is None:
+            gas = await self.estimate_gas(contract_call)
+        with stage("tx_send"):
+            for attempt in range(attempts):
+                nonce = await self.nonces.reserve()
+                tx = await contract_call.build_transaction({
+                    "from": self.owner_address,
+                    "nonce": nonce,
+                    "chainId": await self._chain_id(),
+                    "gas": gas,
+                    "gasPrice": Web3.to_wei("20", "gwei"),
+                })
+                signed_tx = Account.sign_transaction(tx, Config.PRIVATE_KEY)
+                try:
+                    return await self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+                except Exception as e:
+                    if not is_nonce_error(e) or attempt == attempts - 1:
+                        await self.nonces.release(nonce)
+                        raise
+                    logger.warning("Nonce rejected, resyncing with node", extra={"nonce": nonce, "error": str(e)})
+                    await self.nonces.resync()
+
+    async def wait_for_receipts(self, tx_hashes, timeout=120):
+        with stage("tx_receipt"):
+            try:
+                return await asyncio.gather(*(
+                    self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout) for tx_hash in tx_hashes
+                ))
+            except TimeExhausted:
+                await self.nonces.resync()
+                raise
+
+    async def record_turn(self, student_address, lessons, score, path, challenge_id, prompt, response, timestamp):
+        self.stats_cache.invalidate(student_address)
+        tx_hash = await self._send_owner_transaction(
+            self.contract.functions.recordTurn(
+                student_address, lessons, score, path, challenge_id, prompt, response, timestamp
+            )
+        )
+        receipts = await self.wait_for_receipts([tx_hash])
+        self.stats_cache.invalidate(student_address, receipts[0]["blockNumber"])
+        return tx_hash
+
+    async def record_turns_anchored(self, turns):
+        # See BlockchainClient.anchored_turns_call
+        students = [turn[0] for turn in turns]
+        for student in students:
+            self.stats_cache.invalidate(student)
+        # SQLite write; keep it off the event loop
+        root = await asyncio.to_thread(self.chat_store.seal, turns)
+        tx_hash = await self._send_owner_transaction(
+            self.contract.functions.recordTurnsAnchored([tuple(turn[:5]) for turn in turns], root)
+        )
+        receipts = await self.wait_for_receipts([tx_hash])
+        for student in students:
+            self.stats_cache.invalidate(student, receipts[0]["blockNumber"])
+        return tx_hash
@@ -0,0 +1,75 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from prompt_classifier import PATH_KEYWORDS, PromptClassifier, validate_prompt_for_path
+
+# Micro-benchmark: the old substring scan from validate_prompt_for_path versus
+# the precompiled classifier, on prompts that look like pasted code.
+# Run with: python benchmarks/bench_prompt_classifier.py
+
+CODE_SNIPPET = '''
+def merge_sort(arr):
+    if len(arr) <= 1:
+        return arr
+    mid = len(arr) // 2
+    left = merge_sort(arr[:mid])
+    right = merge_sort(arr[mid:])
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] < right[j]:
+            result.append(left[i]); i += 1
+        else:
+            result.append(right[j]); j += 1
+    return result + left[i:] + right[j:]
+'''
+
+
+def legacy_validate(prompt, path):
+    # Same logic as the keyword scans that used to live in app.py
+    prompt_lower = prompt.lower()
+    hit = any(keyword in prompt_lower for keyword in PATH_KEYWORDS[path])
+    return not hit if path == 5 else hit
+
+
+def classifier_validate(prompt, path):
+    return validate_prompt_for_path(prompt, path)[0]
+
+
+# Prose whose only keyword is the one make_prompt appends, so every check
+# scans the whole prompt
+FILLER = "Why does the result look wrong when the left half is empty? I expected it to return early. "
+
+
+def make_prompt(size, text=CODE_SNIPPET):
+    body = (text * (size // len(text) + 1))[:size]
+    # Put the only real keyword at the very end so "any()" cannot short-circuit
+    return "Why is this slow?\n" + body + "\nexplain the time complexity"
+
+
+def main():
+    build = timeit.timeit(lambda: PromptClassifier(PATH_KEYWORDS), number=20) / 20
+    print(f"classifier build (once at import): {build * 1000:.2f} ms")
+    for title, text in (("pasted code", CODE_SNIPPET), ("prose, keyword at the end", FILLER)):
+        print()
+        print(title)
+        print(f"{'prompt size':>12} {'path':>5} {'legacy ms':>10} {'classifier ms':>14} {'speedup':>8}")
+        for size in (200, 2000, 10000, 50000):
+            prompt = make_prompt(size, text)
+            for path in sorted(PATH_KEYWORDS):
+                number = max(5, 20000 // size)
+                legacy = timeit.timeit(lambda: legacy_validate(prompt, path), number=number) / number
+                fast = timeit.timeit(lambda: classifier_validate(prompt, path), number=number) / number
+                print(f"{size:>12} {path:>5} {legacy * 1000:>10.3f} {fast * 1000:>14.3f} {legacy / fast:>7.1f}x")
+
+    print()
+    print("accidental substring matches fixed by word boundaries:")
+    for prompt, path in (("what is a good algorithm", 2), ("buy an asset", 1), ("I said hi", 5)):
+        print(f"  path {path} {prompt!r}: legacy={legacy_validate(prompt, path)} classifier={classifier_validate(prompt, path)}")
+
+
+if __name__ == "__main__":
+    main()
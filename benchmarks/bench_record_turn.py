@@ -0,0 +1,95 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from local_chain import connect, deploy
+
+# Gas and throughput of recording tutoring turns three ways:
+#   three-call  updateProgress + completeChallenge (every 3rd) + storeChatMessage
+#   recordTurn  one transaction per turn
+#   recordTurns one transaction per batch of turns across students
+# Run with: python benchmarks/bench_record_turn.py [--turns 60] [--batch 10]
+
+PROMPT = "Explain how binary search works on a sorted array and why it is O(log n). " * 3
+RESPONSE = "Binary search repeatedly halves the search interval. " * 30
+
+
+def make_turns(accounts, count):
+    turns = []
+    lessons = {student: 0 for student in accounts}
+    for i in range(count):
+        student = accounts[i % len(accounts)]
+        lessons[student] += 1
+        challenge_id = lessons[student] // 3 if lessons[student] % 3 == 0 else 0
+        turns.append((student, lessons[student], 5, 1, challenge_id, PROMPT, RESPONSE, 1700000000 + i))
+    return turns
+
+
+def run(w3, contract, owner, send_batches):
+    gas, txs = 0, 0
+    start = time.perf_counter()
+    for calls in send_batches:
+        hashes = [call.transact({"from": owner, "gas": 5000000}) for call in calls]
+        for tx_hash in hashes:
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            assert receipt["status"] == 1
+            gas += receipt["gasUsed"]
+            txs += 1
+    return gas, txs, time.perf_counter() - start
+
+
+def three_call(contract, turns):
+    for student, lessons, score, path, challenge_id, prompt, response, timestamp in turns:
+        calls = [contract.functions.updateProgress(student, lessons, score, path)]
+        if challenge_id:
+            calls.append(contract.functions.completeChallenge(student, challenge_id))
+        calls.append(contract.functions.storeChatMessage(student, prompt, response, path, timestamp))
+        # The old flow waited for each receipt before sending the next write
+        for call in calls:
+            yield [call]
+
+
+def record_turn(contract, turns):
+    for turn in turns:
+        yield [contract.functions.recordTurn(*turn)]
+
+
+def record_turns(contract, turns, batch):
+    for i in range(0, len(turns), batch):
+        yield [contract.functions.recordTurns(turns[i:i + batch])]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--students", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=10)
+    args = parser.parse_args()
+
+    w3 = connect()
+    owner = w3.eth.accounts[0]
+    students = w3.eth.accounts[1:1 + args.students]
+    turns = make_turns(students, args.turns)
+
+    scenarios = [
+        ("three-call", lambda contract: three_call(contract, turns)),
+        ("recordTurn", lambda contract: record_turn(contract, turns)),
+        (f"recordTurns x{args.batch}", lambda contract: record_turns(contract, turns, args.batch)),
+    ]
+    print(f"{args.turns} turns across {len(students)} students")
+    print(f"{'flow':<16} {'txs':>5} {'gas/turn':>10} {'total gas':>12} {'turns/s':>9}")
+    baseline = None
+    for name, batches in scenarios:
+        # Fresh contract per scenario so storage starts cold each time
+        contract = deploy(w3, owner)
+        gas, txs, elapsed = run(w3, contract, owner, batches(contract))
+        baseline = baseline or gas
+        print(f"{name:<16} {txs:>5} {gas // args.turns:>10} {gas:>12} {args.turns / elapsed:>9.1f}"
+              f"   ({100 * gas / baseline:.0f}% of three-call gas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from local_chain import ARTIFACT, SOURCE
+
+# Compiles TutorContract with py-solc-x and writes its ABI and bytecode where
+# the benchmarks and tests look for them (the truffle artifact path), so they
+# run on machines without solc:
+#   python benchmarks/compile_contract.py [--solc 0.8.0] [--out path.json]
+# Downloads solc if that version is not installed yet.
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--solc", default=os.getenv("SOLC_VERSION", "0.8.0"), help="solc version")
+    parser.add_argument("--out", default=ARTIFACT)
+    args = parser.parse_args()
+
+    import solcx
+
+    solcx.install_solc(args.solc)
+    compiled = solcx.compile_files([SOURCE], output_values=["abi", "bin"], solc_version=args.solc)
+    interface = next(value for key, value in compiled.items() if key.endswith(":TutorContract"))
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump({"contractName": "TutorContract", "abi": interface["abi"], "bytecode": "0x" + interface["bin"]}, f)
+    print(f"Wrote {args.out} (solc {args.solc})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Groq chat completions API, so the benchmarks need no
+# API key and see a predictable LLM. Point the app at it with
+# GROQ_BASE_URL=<url> (the groq SDK reads it) and any GROQ_API_KEY.
+#   latency      seconds before the first token (or the whole reply)
+#   token_delay  seconds between streamed tokens
+#   tokens       reply length in tokens
+# Run standalone with: python benchmarks/fake_groq.py --port 8600 --latency 0.5
+
+WORD = "tutor "
+
+
+class FakeGroqServer:
+    def __init__(self, latency=0.5, token_delay=0.01, tokens=150, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-groq", daemon=True).start()
+        return self.url
+
+    def _usage(self, body):
+        prompt_tokens = sum(len(message["content"].split()) for message in body.get("messages", []))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.tokens,
+            "total_tokens": prompt_tokens + self.tokens,
+        }
+
+    def _completion(self, body, completion_id, created):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": WORD * self.tokens},
+                "finish_reason": "stop",
+            }],
+            "usage": self._usage(body),
+        }
+
+    def _chunk(self, body, completion_id, created, content, finish_reason=None, usage=None):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}],
+        }
+        if usage:
+            chunk["x_groq"] = {"id": completion_id, "usage": usage}
+        return chunk
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake.lock:
+                    fake.requests += 1
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                created = int(time.time())
+                time.sleep(fake.latency)
+                if body.get("stream"):
+                    self._stream(body, completion_id, created)
+                else:
+                    self._send_json(fake._completion(body, completion_id, created))
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, completion_id, created):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(fake.tokens):
+                    if i:
+                        time.sleep(fake.token_delay)
+                    self._event(fake._chunk(body, completion_id, created, WORD))
+                self._event(fake._chunk(body, completion_id, created, "", "stop", fake._usage(body)))
+                self._write(b"data: [DONE]\n\n")
+                self._write(b"")
+
+            def _event(self, payload):
+                self._write(f"data: {json.dumps(payload)}\n\n".encode())
+
+            def _write(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=150)
+    args = parser.parse_args()
+    server = FakeGroqServer(args.latency, args.token_delay, args.tokens, port=args.port)
+    print(f"Fake Groq API on {server.url}; export GROQ_BASE_URL={server.url}")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
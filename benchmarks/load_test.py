@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from eth_account import Account
+from web3 import Web3
+
+from fake_groq import FakeGroqServer
+from local_chain import connect, deploy, funded_account, serve_rpc
+
+# End-to-end load test of the backend with no Groq key or hand-started node:
+# deploys TutorContract to an in-process eth-tester chain (or GANACHE_URL),
+# points the app at a local fake Groq API, serves the app on a local port and
+# drives it with concurrent simulated students. Each student runs --turns
+# rounds of POST /tutor, GET /stats and GET /chat-history.
+#
+#   python benchmarks/load_test.py --students 20 --turns 10
+#   python benchmarks/load_test.py --prefill 20000        # large chat log first
+#   python benchmarks/load_test.py --app async --stream   # async_app, /tutor/stream
+#   python benchmarks/load_test.py --replicas 2           # reads on two more endpoints
+#
+# Deploying needs the compiled contract; see local_chain.py.
+#
+# Reports p50/p95/p99 latency and requests/s per endpoint, JSON-RPC calls per
+# request (including the background indexer and invalidator polls) and the
+# mean time per stage from the app's own metrics.
+
+PROMPTS = {
+    1: "Explain binary search on a sorted array",
+    2: "How do python decorators work",
+    3: "What does a smart contract on ethereum do",
+    4: "How do electrical circuits drive robotics",
+    5: "Which movies should I watch this weekend",
+}
+RESPONSE = "Binary search halves the search interval on every step. " * 8
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", choices=["flask", "async"], default="flask")
+    parser.add_argument("--students", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5, help="rounds of tutor/stats/history per student")
+    parser.add_argument("--stream", action="store_true", help="use /tutor/stream instead of /tutor")
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--repeat-prompts", action="store_true", help="let the response cache serve repeats")
+    parser.add_argument("--replicas", type=int, default=0,
+                        help="serve the in-process chain on this many more ports, used as read replicas")
+    parser.add_argument("--prefill", type=int, default=0, help="chat events to record before the run")
+    parser.add_argument("--prefill-batch", type=int, default=25)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-token-delay", type=float, default=0.01)
+    parser.add_argument("--llm-tokens", type=int, default=150)
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if any request failed")
+    return parser.parse_args()
+
+
+def prefill(w3, contract, owner, students, count, batch):
+    # Turns go straight to the chain in recordTurns batches, bypassing the app
+    start = time.perf_counter()
+    nonce = w3.eth.get_transaction_count(owner.address)
+    for first in range(0, count, batch):
+        turns = []
+        for i in range(first, min(count, first + batch)):
+            path = i % 5 + 1
+            turns.append((students[i % len(students)], i // len(students) + 1, 5, path, 0,
+                          f"{PROMPTS[path]}, take {i}", RESPONSE, 1700000000 + i))
+        tx = contract.functions.recordTurns(turns).build_transaction({"from": owner.address, "nonce": nonce})
+        w3.eth.wait_for_transaction_receipt(w3.eth.send_raw_transaction(owner.sign_transaction(tx).raw_transaction))
+        nonce += 1
+    return time.perf_counter() - start
+
+
+def load_app(args, rpc_url, replica_urls, contract, owner, workdir, groq_url):
+    from config import Config
+
+    Config.ETH_NODE_URL = rpc_url
+    Config.ETH_REPLICA_URLS = ",".join(replica_urls)
+    Config.CONTRACT_ADDRESS = contract.address
+    Config.CONTRACT_ABI = contract.abi
+    Config.PRIVATE_KEY = Web3.to_hex(owner.key)
+    Config.WRITE_BEHIND = args.write_behind
+    Config.TX_QUEUE_PATH = os.path.join(workdir, "tx_queue.db")
+    Config.CHAT_INDEX_PATH = os.path.join(workdir, "chat_index.db")
+    Config.RESPONSE_CACHE_PATH = ""
+    Config.LOG_LEVEL = "WARNING"
+    # Simulated students ask faster than real ones
+    Config.RATE_LIMIT_PER_MINUTE = 0
+    # After config.py, whose load_dotenv(override=True) would replace them
+    os.environ["GROQ_BASE_URL"] = groq_url
+    os.environ["GROQ_API_KEY"] = "fake"
+    if args.app == "async":
+        import async_app as module
+    else:
+        import app as module
+    return module
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(args, module):
+    port = free_port()
+    if args.app == "async":
+        from hypercorn.asyncio import serve as hypercorn_serve
+        from hypercorn.config import Config as HypercornConfig
+
+        config = HypercornConfig()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.loglevel = "WARNING"
+
+        async def run():
+            # Without a shutdown trigger hypercorn installs signal handlers,
+            # which only works on the main thread
+            await hypercorn_serve(module.app, config, shutdown_trigger=asyncio.Event().wait)
+
+        threading.Thread(target=asyncio.run, args=(run(),), name="app", daemon=True).start()
+    else:
+        from werkzeug.serving import make_server
+
+        server = make_server("127.0.0.1", port, module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, name="app", daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{base_url}/cache-stats").read()
+            return base_url
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("app did not start")
+
+
+def call(results, endpoint, url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        payload, status = e.read(), e.code
+    except OSError as e:
+        payload, status = str(e).encode(), 0
+    ok = status == 200 and (endpoint != "/tutor/stream" or b"event: done" in payload)
+    results.append((endpoint, ok, time.perf_counter() - start))
+
+
+def student(args, base_url, index, address, results):
+    path = index % 5 + 1
+    tutor = "/tutor/stream" if args.stream else "/tutor"
+    for turn in range(args.turns):
+        prompt = PROMPTS[path] if args.repeat_prompts else f"{PROMPTS[path]}, take {index}-{turn}"
+        call(results, tutor, base_url + tutor, {"student_address": address, "prompt": prompt, "path": path})
+        call(results, "/stats", f"{base_url}/stats/{address}")
+        call(results, "/chat-history", f"{base_url}/chat-history/{address}/{path}?limit=50")
+
+
+def rpc_calls():
+    import metrics
+
+    counts = {}
+    for metric in (metrics.RPC_CALLS, metrics.RPC_ERRORS):
+        for sample in metric.collect()[0].samples:
+            if sample.name.endswith("_total"):
+                counts[(metric, sample.labels["method"])] = sample.value
+    return counts
+
+
+def stage_means():
+    import metrics
+
+    sums, counts = {}, {}
+    for sample in metrics.STAGE_SECONDS.collect()[0].samples:
+        if sample.name.endswith("_sum"):
+            sums[sample.labels["stage"]] = sample.value
+        elif sample.name.endswith("_count"):
+            counts[sample.labels["stage"]] = sample.value
+    return {stage: sums[stage] / counts[stage] for stage in counts if counts[stage]}
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def report(results, elapsed, rpc_delta):
+    import metrics
+
+    by_endpoint = defaultdict(list)
+    for endpoint, ok, seconds in results:
+        by_endpoint[endpoint].append((ok, seconds))
+    by_endpoint["all"] = [(ok, seconds) for _, ok, seconds in results]
+    print(f"\n{'endpoint':<16} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for endpoint, samples in by_endpoint.items():
+        latencies = sorted(seconds * 1000 for _, seconds in samples)
+        errors = sum(1 for ok, _ in samples if not ok)
+        print(f"{endpoint:<16} {len(samples):>6} {errors:>6} {percentile(latencies, 50):>9.1f} "
+              f"{percentile(latencies, 95):>9.1f} {percentile(latencies, 99):>9.1f} {len(samples) / elapsed:>8.1f}")
+
+    calls = {method: n for (metric, method), n in rpc_delta.items() if metric is metrics.RPC_CALLS and n}
+    errors = {method: n for (metric, method), n in rpc_delta.items() if metric is metrics.RPC_ERRORS and n}
+    total = sum(calls.values())
+    print(f"\nJSON-RPC calls: {total:.0f} ({total / len(results):.1f} per request)")
+    for method, n in sorted(calls.items(), key=lambda item: -item[1]):
+        print(f"  {method:<28} {n:>8.0f}  errors {errors.get(method, 0):.0f}")
+
+    print("\nMean time per stage:")
+    for stage, seconds in sorted(stage_means().items(), key=lambda item: -item[1]):
+        print(f"  {stage:<28} {seconds * 1000:>8.1f} ms")
+    return sum(1 for _, ok, _ in results if not ok)
+
+
+def main():
+    args = parse_args()
+    w3 = connect()
+    if os.getenv("GANACHE_URL"):
+        rpc_url = os.getenv("GANACHE_URL")
+        # Other RPC endpoints of the same chain, used for reads
+        replica_urls = [url for url in os.getenv("GANACHE_REPLICA_URLS", "").split(",") if url]
+    else:
+        lock = threading.Lock()
+        _, rpc_url = serve_rpc(w3, lock=lock)
+        replica_urls = [serve_rpc(w3, lock=lock)[1] for _ in range(args.replicas)]
+    owner = funded_account(w3, 1000)
+    contract = deploy(w3, private_key=owner.key)
+    students = [Account.create().address for _ in range(args.students)]
+    print(f"TutorContract at {contract.address}, chain RPC on {rpc_url}")
+
+    if args.prefill:
+        seconds = prefill(w3, contract, owner, students, args.prefill, args.prefill_batch)
+        print(f"Prefilled {args.prefill} chat events in {seconds:.1f}s")
+
+    groq = FakeGroqServer(args.llm_latency, args.llm_token_delay, args.llm_tokens)
+    groq_url = groq.start()
+    workdir = tempfile.mkdtemp(prefix="tutor-load-")
+    module = load_app(args, rpc_url, replica_urls, contract, owner, workdir, groq_url)
+    base_url = serve(args, module)
+
+    # The chat index catches up on the prefilled log once, in the background
+    from services import get_services
+
+    chat_indexer = get_services(use_async=args.app == "async").chat_indexer
+    start = time.perf_counter()
+    head = w3.eth.block_number
+    while (chat_indexer.checkpoint() or (-1,))[0] < head:
+        time.sleep(0.2)
+    print(f"Chat index caught up to block {head} in {time.perf_counter() - start:.1f}s")
+
+    print(f"{args.students} students x {args.turns} turns against the {args.app} app at {base_url}")
+    results = []
+    rpc_before = rpc_calls()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.students) as pool:
+        for future in [pool.submit(student, args, base_url, index, address, results)
+                       for index, address in enumerate(students)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    rpc_after = rpc_calls()
+    rpc_delta = {key: value - rpc_before.get(key, 0) for key, value in rpc_after.items()}
+    failed = report(results, elapsed, rpc_delta)
+    print("\nJSON-RPC endpoints:")
+    for endpoint in get_services().blockchain.rpc_pool.stats()["endpoints"]:
+        print(f"  {endpoint['role']:<8} {endpoint['endpoint']:<28} calls {endpoint['calls']:>7}  "
+              f"errors {endpoint['errors']:>4}  p50 {endpoint['p50_ms']} ms  p95 {endpoint['p95_ms']} ms")
+    print(f"\nFake Groq requests: {groq.requests}")
+    if args.check and failed:
+        sys.exit(f"{failed} requests failed")
+
+
+if __name__ == "__main__":
+    main()
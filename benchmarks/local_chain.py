@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+from collections.abc import Mapping
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_account import Account
+from web3 import Web3
+from web3.datastructures import NamedElementOnion
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+ARTIFACT = os.path.join(ROOT, "blockchain", "build", "contracts", "TutorContract.json")
+SOURCE = os.path.join(ROOT, "blockchain", "contracts", "TutorContract.sol")
+
+# Helpers shared by the benchmarks: a throwaway chain and a freshly deployed
+# TutorContract. Set GANACHE_URL to use a running Ganache instead of the
+# in-process eth-tester chain. serve_rpc() puts the eth-tester chain behind a
+# local JSON-RPC endpoint, so the app can reach it through its normal
+# HTTPProvider.
+#
+# Deploying needs the compiled contract: CONTRACT_ARTIFACT (a JSON file with
+# "abi" and "bytecode"), else the truffle build output, else py-solc-x with
+# an installed solc. compile_contract.py writes the artifact once on a machine
+# with solc, for machines without it.
+
+NO_COMPILER = (
+    "TutorContract is not compiled and no solc is installed. On a machine with "
+    "network access run `python benchmarks/compile_contract.py` (or `truffle "
+    "compile` in blockchain/), then copy blockchain/build/contracts/TutorContract.json "
+    "here or point CONTRACT_ARTIFACT at it."
+)
+
+
+def load_contract_interface():
+    # (abi, bytecode); raises RuntimeError with NO_COMPILER if neither an
+    # artifact nor solc is available
+    path = os.getenv("CONTRACT_ARTIFACT") or ARTIFACT
+    if os.path.exists(path):
+        with open(path) as f:
+            artifact = json.load(f)
+        return artifact["abi"], artifact["bytecode"]
+    import solcx
+
+    try:
+        compiled = solcx.compile_files([SOURCE], output_values=["abi", "bin"], solc_version=os.getenv("SOLC_VERSION"))
+    except solcx.exceptions.SolcNotInstalled as e:
+        raise RuntimeError(NO_COMPILER) from e
+    interface = next(value for key, value in compiled.items() if key.endswith(":TutorContract"))
+    return interface["abi"], interface["bin"]
+
+
+def connect():
+    url = os.getenv("GANACHE_URL")
+    if url:
+        return Web3(Web3.HTTPProvider(url))
+    from web3 import EthereumTesterProvider
+
+    return Web3(EthereumTesterProvider())
+
+
+def deploy(w3, owner=None, private_key=None):
+    # With private_key the deployment is signed locally, so the matching
+    # account owns the contract (as the app's PRIVATE_KEY must)
+    abi, bytecode = load_contract_interface()
+    factory = w3.eth.contract(abi=abi, bytecode=bytecode)
+    if private_key:
+        account = Account.from_key(private_key)
+        tx = factory.constructor().build_transaction({
+            "from": account.address,
+            "nonce": w3.eth.get_transaction_count(account.address),
+        })
+        tx_hash = w3.eth.send_raw_transaction(account.sign_transaction(tx).raw_transaction)
+    else:
+        tx_hash = factory.constructor().transact({"from": owner or w3.eth.accounts[0]})
+    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    return w3.eth.contract(address=receipt["contractAddress"], abi=abi)
+
+
+def funded_account(w3, ether=100):
+    # A fresh key with a balance, paid for by the first unlocked account
+    account = Account.create()
+    tx_hash = w3.eth.send_transaction({
+        "from": w3.eth.accounts[0],
+        "to": account.address,
+        "value": Web3.to_wei(ether, "ether"),
+    })
+    w3.eth.wait_for_transaction_receipt(tx_hash)
+    return account
+
+
+def _to_wire(value):
+    # eth-tester hands back Python values; JSON-RPC wants hex quantities
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return Web3.to_hex(value)
+    if isinstance(value, Mapping):
+        return {key: _to_wire(item) for key, item in value.items()}
+    return [_to_wire(item) for item in value]
+
+
+def serve_rpc(w3, host="127.0.0.1", port=0, lock=None):
+    # Returns (server, url). Requests are serialized because eth-tester is
+    # not thread-safe, which also makes it behave like a single node. Pass
+    # the same lock to serve one chain on several ports, e.g. as a primary
+    # and read replicas that are always in sync.
+    make_request = w3.provider.request_func(w3, NamedElementOnion([]))
+    lock = lock or threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            reply = {"jsonrpc": "2.0", "id": request.get("id")}
+            try:
+                with lock:
+                    response = make_request(request["method"], request.get("params", []))
+                if "error" in response:
+                    reply["error"] = response["error"]
+                else:
+                    reply["result"] = _to_wire(response.get("result"))
+            except Exception as e:
+                reply["error"] = {"code": -32000, "message": str(e)}
+            body = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="local-rpc", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -11,6 +11,7 @@ contract TutorContract {
     mapping(address => uint[]) public badges;        // Array of badge IDs
     mapping(address => uint) public learningPath;    // 0: None, 1: Python, 2: Blockchain
     mapping(address => uint) public challengesCompleted; // Track challenge completions
+    mapping(bytes32 => uint) public chatRoots;       // Anchored chat Merkle root => block number
 
     event SessionPaid(address indexed student, uint amount);
     event ProgressUpdated(address indexed student, uint lessons, uint score);
@@ -23,6 +24,40 @@ contract TutorContract {
         uint path,
         uint timestamp
     ); // New event for chat history
+    event ChatRootAnchored(bytes32 indexed root, uint count);
+    event PathProgress(address indexed student, uint indexed path, uint lessons, uint score); // Feeds the leaderboard
+
+    // One tutoring turn: progress update, optional challenge and chat message
+    struct Turn {
+        address student;
+        uint lessons;
+        uint score;
+        uint path;
+        uint challengeId; // 0 when the turn does not complete a challenge
+        string prompt;
+        string response;
+        uint timestamp;
+    }
+
+    // A turn whose chat message is kept off-chain and anchored by Merkle root
+    struct AnchoredTurn {
+        address student;
+        uint lessons;
+        uint score;
+        uint path;
+        uint challengeId;
+    }
+
+    // getStudentStats for one student, as returned by getStudentsStats
+    struct StudentStats {
+        uint lessons;
+        uint score;
+        uint sessions;
+        uint balance;
+        uint[] badgeIds;
+        uint path;
+        uint challenges;
+    }
 
     constructor() {
         owner = msg.sender;
@@ -38,21 +73,12 @@ contract TutorContract {
 
     function updateProgress(address student, uint lessons, uint score, uint path) external {
         require(msg.sender == owner, "Only owner can update progress");
-        studentProgress[student] = lessons;
-        studentScores[student] += score;
-        if (path > 0 && path <= 2) learningPath[student] = path;
-        emit ProgressUpdated(student, lessons, score);
-        _checkBadges(student);
+        _updateProgress(student, lessons, score, path);
     }
 
     function completeChallenge(address student, uint challengeId) external {
         require(msg.sender == owner, "Only owner can complete challenges");
-        challengesCompleted[student] += 1;
-        if (challengesCompleted[student] % 3 == 0) {
-            badges[student].push(3); // Badge ID 3: 3 Challenges
-            emit BadgeEarned(student, 3);
-        }
-        emit ChallengeCompleted(student, challengeId);
+        _completeChallenge(student, challengeId);
     }
 
     function storeChatMessage(
@@ -66,6 +92,81 @@ contract TutorContract {
         emit ChatMessage(student, prompt, response, path, timestamp);
     }
 
+    // Records a whole turn in one transaction instead of up to three
+    function recordTurn(
+        address student,
+        uint lessons,
+        uint score,
+        uint path,
+        uint challengeId,
+        string memory prompt,
+        string memory response,
+        uint timestamp
+    ) external {
+        require(msg.sender == owner, "Only owner can record turns");
+        _updateProgress(student, lessons, score, path);
+        if (challengeId > 0) _completeChallenge(student, challengeId);
+        emit ChatMessage(student, prompt, response, path, timestamp);
+    }
+
+    // Records a batch of turns, possibly for many students, in one transaction
+    function recordTurns(Turn[] calldata turns) external {
+        require(msg.sender == owner, "Only owner can record turns");
+        for (uint i = 0; i < turns.length; i++) {
+            Turn calldata turn = turns[i];
+            _updateProgress(turn.student, turn.lessons, turn.score, turn.path);
+            if (turn.challengeId > 0) _completeChallenge(turn.student, turn.challengeId);
+            emit ChatMessage(turn.student, turn.prompt, turn.response, turn.path, turn.timestamp);
+        }
+    }
+
+    // Like recordTurns, but the chat messages stay off-chain. chatRoot is the
+    // Merkle root over keccak256(abi.encodePacked(student, path, timestamp,
+    // digest)) leaves, one per turn, where digest is the keccak256 of the
+    // message kept in the off-chain store.
+    function recordTurnsAnchored(AnchoredTurn[] calldata turns, bytes32 chatRoot) external {
+        require(msg.sender == owner, "Only owner can record turns");
+        require(chatRoots[chatRoot] == 0, "Chat root already anchored");
+        for (uint i = 0; i < turns.length; i++) {
+            AnchoredTurn calldata turn = turns[i];
+            _updateProgress(turn.student, turn.lessons, turn.score, turn.path);
+            if (turn.challengeId > 0) _completeChallenge(turn.student, turn.challengeId);
+        }
+        chatRoots[chatRoot] = block.number;
+        emit ChatRootAnchored(chatRoot, turns.length);
+    }
+
+    // True if leaf is part of an anchored chat root. Pairs are hashed in
+    // sorted order, so the proof is just the sibling hashes, bottom up.
+    function verifyChat(bytes32 leaf, bytes32[] calldata proof, bytes32 root) external view returns (bool) {
+        if (chatRoots[root] == 0) return false;
+        bytes32 node = leaf;
+        for (uint i = 0; i < proof.length; i++) {
+            node = node < proof[i]
+                ? keccak256(abi.encodePacked(node, proof[i]))
+                : keccak256(abi.encodePacked(proof[i], node));
+        }
+        return node == root;
+    }
+
+    function _updateProgress(address student, uint lessons, uint score, uint path) internal {
+        studentProgress[student] = lessons;
+        studentScores[student] += score;
+        if (path > 0 && path <= 2) learningPath[student] = path;
+        emit ProgressUpdated(student, lessons, score);
+        emit PathProgress(student, path, lessons, score);
+        _checkBadges(student);
+    }
+
+    function _completeChallenge(address student, uint challengeId) internal {
+        challengesCompleted[student] += 1;
+        if (challengesCompleted[student] % 3 == 0) {
+            badges[student].push(3); // Badge ID 3: 3 Challenges
+            emit BadgeEarned(student, 3);
+        }
+        emit ChallengeCompleted(student, challengeId);
+    }
+
     function _checkBadges(address student) internal {
         if (studentProgress[student] >= 5 && badges[student].length == 0) {
             badges[student].push(1); // Badge ID 1: 5 Lessons
@@ -86,4 +187,13 @@ contract TutorContract {
     function getStudentStats(address student) external view returns (uint lessons, uint score, uint sessions, uint balance, uint[] memory badgeIds, uint path, uint challenges) {
         return (studentProgress[student], studentScores[student], sessionCount[student], balances[student], badges[student], learningPath[student], challengesCompleted[student]);
     }
-}
\ No newline at end of file
+
+    // Stats for many students in one eth_call
+    function getStudentsStats(address[] calldata students) external view returns (StudentStats[] memory stats) {
+        stats = new StudentStats[](students.length);
+        for (uint i = 0; i < students.length; i++) {
+            address student = students[i];
+            stats[i] = StudentStats(studentProgress[student], studentScores[student], sessionCount[student], balances[student], badges[student], learningPath[student], challengesCompleted[student]);
+        }
+    }
+}
@@ -1,24 +1,75 @@
+import logging
+
 from web3 import Web3
+from web3.exceptions import TimeExhausted
 from config import Config
+from nonce_manager import FileNonceCounter, NonceManager, is_nonce_error
+from rpc_pool import EndpointPool, PooledHTTPProvider, read_after, split_urls
+from stats_cache import StatsCache
+from metrics import rpc_metrics_middleware, stage
+
+logger = logging.getLogger(__name__)
+
+# Headroom added on top of eth_estimateGas
+GAS_MARGIN = 1.2
+
+
+def owner_nonce_counter(owner_address):
+    # Shared across worker processes when NONCE_COUNTER_PATH is set, else
+    # None (an in-process counter)
+    if Config.NONCE_COUNTER_PATH:
+        return FileNonceCounter(Config.NONCE_COUNTER_PATH, owner_address)
+    return None
+
+def node_pool():
+    # The configured node endpoints (ETH_NODE_URL, ETH_REPLICA_URLS)
+    return EndpointPool(
+        split_urls(Config.ETH_NODE_URL),
+        split_urls(Config.ETH_REPLICA_URLS),
+        pool_size=Config.RPC_POOL_SIZE,
+        timeout=Config.RPC_TIMEOUT,
+        health_interval=Config.RPC_HEALTH_INTERVAL,
+        max_lag=Config.RPC_MAX_LAG,
+    )
 
 class BlockchainClient:
-    def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(Config.ETH_NODE_URL))
-        # print(f"Connected to Ganache: {self.w3.is_connected()}")
+    # Construction makes no network calls, so a worker boots even while the
+    # node is down. warm_up() does the first round-trips ahead of traffic.
+    # Calls are spread over the node endpoints by rpc_pool; start() runs
+    # its health checks.
+
+    def __init__(self, chat_store=None, rpc_pool=None):
+        self.rpc_pool = rpc_pool or node_pool()
+        self.w3 = Web3(PooledHTTPProvider(self.rpc_pool))
+        self.w3.middleware_onion.add(rpc_metrics_middleware, "rpc_metrics")
         self.checksum_address = self.w3.to_checksum_address(Config.CONTRACT_ADDRESS)
-        # print(f"Contract Address: {self.checksum_address}")
-        bytecode = self.w3.eth.get_code(self.checksum_address).hex()
-        # print(f"Bytecode at address: {bytecode}")
         self.contract = self.w3.eth.contract(address=self.checksum_address, abi=Config.CONTRACT_ABI)
         self.account = self.w3.eth.account.from_key(Config.PRIVATE_KEY)
         self.owner_account = self.w3.eth.account.from_key(Config.PRIVATE_KEY)
         self.owner_address = self.owner_account.address
-        # print(f"Owner Account Address: {self.account.address}")
-        self.ganache_accounts = self.w3.eth.accounts  # List of Ganache accounts
+        self.chain_id = None
+        # Nonce allocator for owner transactions
+        self.nonces = NonceManager(self.w3, self.owner_address, owner_nonce_counter(self.owner_address))
+        # Decoded getStudentStats results, invalidated on writes and events
+        self.stats_cache = StatsCache(Config.STATS_CACHE_SIZE)
+        # Off-chain ChatStore for anchored chat messages (CHAT_STORAGE=anchored)
+        self.chat_store = chat_store
+
+    def _chain_id(self):
+        if self.chain_id is None:
+            self.chain_id = self.w3.eth.chain_id
+        return self.chain_id
+
+    def warm_up(self):
+        # Opens the node connection and fetches what the first transaction
+        # needs, and warns if there is no contract at the configured address
+        self._chain_id()
+        if not self.w3.eth.get_code(self.checksum_address):
+            logger.warning("No contract code at CONTRACT_ADDRESS", extra={"address": self.checksum_address})
 
     def pay_for_session(self, student_address, amount_wei):
         nonce = self.w3.eth.get_transaction_count(student_address)
-        print(f"Nonce for {student_address}: {nonce}")
+        logger.debug("Building session payment", extra={"student": student_address, "nonce": nonce})
         tx = self.contract.functions.payForSession().build_transaction({
             "from": student_address,
             "value": amount_wei,
@@ -28,53 +79,180 @@ class BlockchainClient:
         })
         return tx
 
-    def update_progress(self, student_address, lessons, score, path):
-        tx = self.contract.functions.updateProgress(
-            student_address, lessons, score, path
-        ).build_transaction({
-            "from": self.account.address,
-            "nonce": self.w3.eth.get_transaction_count(self.account.address),
-            "gas": 200000,
-            "gasPrice": self.w3.to_wei("20", "gwei"),
-        })
-        signed_tx = self.w3.eth.account.sign_transaction(tx, Config.PRIVATE_KEY)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-
-    def complete_challenge(self, student_address, challenge_id):
-        tx = self.contract.functions.completeChallenge(
-            student_address, challenge_id
-        ).build_transaction({
-            "from": self.account.address,
-            "nonce": self.w3.eth.get_transaction_count(self.account.address),
-            "gas": 200000,
-            "gasPrice": self.w3.to_wei("20", "gwei"),
-        })
-        signed_tx = self.w3.eth.account.sign_transaction(tx, Config.PRIVATE_KEY)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-
-    def store_chat_message(self, student_address, prompt, response, path, timestamp):
-        nonce = self.w3.eth.get_transaction_count(self.owner_address)
-        print(f"Nonce for owner {self.owner_address}: {nonce}")
-        print(f"Storing chat message for student {student_address}, prompt={prompt}, response={response}, path={path}, timestamp={timestamp}")
-        tx = self.contract.functions.storeChatMessage(
-            student_address, prompt, response, path, timestamp
-        ).build_transaction({
+    def estimate_gas(self, contract_call):
+        # Node estimate plus headroom, instead of a fixed 200000 that is too
+        # much for small writes and too little for long chat messages.
+        return int(contract_call.estimate_gas({"from": self.owner_address}) * GAS_MARGIN)
+
+    def sign_owner_transaction(self, contract_call, gas=None):
+        # Build and sign an owner transaction with a locally reserved nonce.
+        # Without an explicit gas limit the node is asked for an estimate.
+        if gas is None:
+            gas = self.estimate_gas(contract_call)
+        nonce = self.nonces.reserve()
+        tx = contract_call.build_transaction({
             "from": self.owner_address,
             "nonce": nonce,
-            "gas": 200000,
+            "chainId": self._chain_id(),
+            "gas": gas,
             "gasPrice": self.w3.to_wei("20", "gwei"),
         })
+        return nonce, self.w3.eth.account.sign_transaction(tx, Config.PRIVATE_KEY)
+
+    def cancel_owner_transaction(self, nonce):
+        # Replace whatever is pending at nonce with a 0-value transfer to the
+        # owner itself. Nodes only accept a replacement at a higher gas price.
+        tx = {
+            "from": self.owner_address,
+            "to": self.owner_address,
+            "value": 0,
+            "nonce": nonce,
+            "chainId": self._chain_id(),
+            "gas": 21000,
+            "gasPrice": self.w3.to_wei("40", "gwei"),
+        }
         signed_tx = self.w3.eth.account.sign_transaction(tx, Config.PRIVATE_KEY)
-        print(f"Transaction signed with owner key: {Config.PRIVATE_KEY[:10]}...")
+        return self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+
+    def _send_owner_transaction(self, contract_call, gas=None, attempts=3):
+        # Sign with a locally reserved nonce and broadcast without waiting for
+        # the receipt, so a turn's writes can go out back-to-back.
+        with stage("tx_send"):
+            for attempt in range(attempts):
+                nonce, signed_tx = self.sign_owner_transaction(contract_call, gas)
+                try:
+                    return self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+                except Exception as e:
+                    if not is_nonce_error(e) or attempt == attempts - 1:
+                        self.nonces.release(nonce)
+                        raise
+                    logger.warning("Nonce rejected, resyncing with node", extra={"nonce": nonce, "error": str(e)})
+                    self.nonces.resync()
+
+    def wait_for_receipts(self, tx_hashes, timeout=120):
+        # The transactions were all broadcast already, so they get mined
+        # together and waiting on them in turn costs about one confirmation.
+        receipts = []
+        with stage("tx_receipt"):
+            for tx_hash in tx_hashes:
+                try:
+                    receipts.append(self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout))
+                except TimeExhausted:
+                    # Probably dropped from the pool; don't keep counting past it
+                    self.nonces.resync()
+                    raise
+        return receipts
+
+    def _after_write(self, students, tx_hash, wait):
+        # Drop cached stats now, and again once mined in case a read re-cached
+        # the old values in between. Without wait, the event watcher does the
+        # second invalidation when it sees the mined events.
+        for student in students:
+            self.stats_cache.invalidate(student)
+        if wait:
+            receipt = self.wait_for_receipts([tx_hash])[0]
+            for student in students:
+                self.stats_cache.invalidate(student, receipt["blockNumber"])
+
+    def update_progress(self, student_address, lessons, score, path, wait=True):
+        tx_hash = self._send_owner_transaction(
+            self.contract.functions.updateProgress(student_address, lessons, score, path), gas=200000
+        )
+        self._after_write([student_address], tx_hash, wait)
+        return tx_hash
+
+    def complete_challenge(self, student_address, challenge_id, wait=True):
+        tx_hash = self._send_owner_transaction(
+            self.contract.functions.completeChallenge(student_address, challenge_id), gas=200000
+        )
+        self._after_write([student_address], tx_hash, wait)
+        return tx_hash
+
+    def store_chat_message(self, student_address, prompt, response, path, timestamp, wait=True):
+        logger.debug("Storing chat message", extra={"student": student_address, "path": path, "timestamp": timestamp})
         try:
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            print(f"Chat message tx hash: {tx_hash.hex()}, Receipt: {receipt}")
+            tx_hash = self._send_owner_transaction(
+                self.contract.functions.storeChatMessage(student_address, prompt, response, path, timestamp), gas=200000
+            )
+            if wait:
+                receipt = self.wait_for_receipts([tx_hash])[0]
+                logger.debug("Chat message mined", extra={"tx_hash": Web3.to_hex(tx_hash), "block": receipt["blockNumber"]})
+            return tx_hash
         except Exception as e:
-            print(f"Chat message storage failed: {str(e)}")
-            raise Exception(f"Chat message storage failed: {str(e)}")    
+            logger.error("Chat message storage failed", extra={"student": student_address, "error": str(e)})
+            raise Exception(f"Chat message storage failed: {str(e)}")
+
+    def record_turn(self, student_address, lessons, score, path, challenge_id, prompt, response, timestamp, wait=True):
+        # Progress, optional challenge (challenge_id 0 = none) and chat message
+        # in a single transaction
+        tx_hash = self._send_owner_transaction(
+            self.contract.functions.recordTurn(
+                student_address, lessons, score, path, challenge_id, prompt, response, timestamp
+            )
+        )
+        self._after_write([student_address], tx_hash, wait)
+        return tx_hash
+
+    def record_turns(self, turns, wait=True):
+        # turns: list of (student_address, lessons, score, path, challenge_id,
+        # prompt, response, timestamp) tuples, for any mix of students
+        tx_hash = self._send_owner_transaction(
+            self.contract.functions.recordTurns([tuple(turn) for turn in turns])
+        )
+        self._after_write([turn[0] for turn in turns], tx_hash, wait)
+        return tx_hash
+
+    def anchored_turns_call(self, turns):
+        # turns: (student, lessons, score, path, challenge_id, digest, timestamp)
+        # tuples whose messages are already in the chat store. Seals them into
+        # one Merkle root and returns the recordTurnsAnchored call.
+        root = self.chat_store.seal(turns)
+        return self.contract.functions.recordTurnsAnchored([tuple(turn[:5]) for turn in turns], root)
+
+    def contract_call(self, method, args):
+        # Contract call for a queued write. recordTurnsAnchored is queued with
+        # just the turns; its root is computed here, so merged batches anchor
+        # under a single root.
+        if method == "recordTurnsAnchored":
+            return self.anchored_turns_call(*args)
+        if method == "recordTurns":
+            return self.contract.functions.recordTurns([tuple(turn) for turn in args[0]])
+        return getattr(self.contract.functions, method)(*args)
+
+    def record_turns_anchored(self, turns, wait=True):
+        tx_hash = self._send_owner_transaction(self.anchored_turns_call(turns))
+        self._after_write([turn[0] for turn in turns], tx_hash, wait)
+        return tx_hash
 
     def get_stats(self, student_address):
-        return self.contract.functions.getStudentStats(student_address).call()
\ No newline at end of file
+        stats = self.stats_cache.get(student_address)
+        if stats is None:
+            token = self.stats_cache.begin_load()
+            with read_after(self.stats_cache.read_block(student_address)):
+                stats = self.contract.functions.getStudentStats(student_address).call()
+            self.stats_cache.put(student_address, stats, token)
+        return stats
+
+    def get_stats_many(self, addresses, chunk=200):
+        # address -> stats. Cache misses are read with getStudentsStats, one
+        # eth_call per chunk of addresses.
+        found = {}
+        missing = []
+        for address in addresses:
+            stats = self.stats_cache.get(address)
+            if stats is None:
+                missing.append(address)
+            else:
+                found[address] = stats
+        for start in range(0, len(missing), chunk):
+            batch = missing[start:start + chunk]
+            token = self.stats_cache.begin_load()
+            with read_after(self.stats_cache.read_block(*batch)):
+                results = self.contract.functions.getStudentsStats(
+                    [Web3.to_checksum_address(address) for address in batch]
+                ).call()
+            for address, stats in zip(batch, results):
+                stats = list(stats)
+                self.stats_cache.put(address, stats, token)
+                found[address] = stats
+        return found
\ No newline at end of file
@@ -0,0 +1,438 @@
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+from web3 import Web3
+
+from chat_store import chat_leaf
+from process_lock import process_lock
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student TEXT NOT NULL,
+    path INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    digest TEXT,
+    anchor_root TEXT,
+    anchor_index INTEGER
+);
+CREATE INDEX IF NOT EXISTS chat_by_student ON chat_messages (student, path, timestamp, id);
+CREATE INDEX IF NOT EXISTS chat_by_block ON chat_messages (block_number);
+CREATE TABLE IF NOT EXISTS progress_events (
+    student TEXT NOT NULL,
+    path INTEGER NOT NULL,
+    lessons INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    block_number INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS progress_by_block ON progress_events (block_number);
+CREATE TABLE IF NOT EXISTS badge_events (
+    student TEXT NOT NULL,
+    badge_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS badges_by_block ON badge_events (block_number);
+CREATE TABLE IF NOT EXISTS indexed_blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unresolved_roots (
+    root TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS unresolved_by_block ON unresolved_roots (block_number);
+CREATE TABLE IF NOT EXISTS index_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def encode_cursor(timestamp, row_id):
+    return f"{timestamp}-{row_id}"
+
+
+def decode_cursor(cursor):
+    timestamp, row_id = cursor.split("-")
+    return int(timestamp), int(row_id)
+
+
+class ChatIndexer:
+    # Follows ChatMessage events from a saved checkpoint into a local SQLite
+    # store, so /chat-history never has to scan the chain from genesis.
+    #
+    # The checkpoint is the highest row in indexed_blocks. That table also
+    # keeps the hashes of recently indexed blocks (chunk ends and blocks that
+    # held a message). Each poll first checks that the checkpoint is still on
+    # the canonical chain. If it is not, we walk back to the newest stored
+    # block that still matches and drop everything indexed above it.
+    #
+    # With a chat_store it also follows ChatRootAnchored. For each anchored
+    # root it indexes the turns sealed under that root in the store; their
+    # rows carry the digest and root instead of the text, which is read back
+    # from the store. A root whose batch isn't in the store (sealed by
+    # another server, or the store was lost) is kept in unresolved_roots and
+    # indexed by a later poll once the store has it.
+    #
+    # With a leaderboard it also stores PathProgress and BadgeEarned events
+    # and feeds them to it. The leaderboard is rebuilt from those tables at
+    # startup and after a reorg.
+    #
+    # Worker processes can share one index file. Polls take an flock on
+    # <path>.lock, so only one process indexes a block range, and each
+    # process feeds its leaderboard from the tables rather than from what it
+    # indexed itself: rows past the last rowid it applied, or everything
+    # again once index_state shows a rewind.
+
+    def __init__(self, w3, contract, path, chunk_size=2000, reorg_window=128, poll_interval=2.0, chat_store=None,
+                 leaderboard=None):
+        self.w3 = w3
+        self.contract = contract
+        self.chat_store = chat_store
+        self.leaderboard = leaderboard
+        self.lock_path = None if path == ":memory:" else f"{path}.lock"
+        if leaderboard is not None and not any(item.get("name") == "PathProgress" for item in contract.abi):
+            # Deployed before PathProgress existed; the leaderboard stays empty
+            logger.warning("Contract ABI has no PathProgress event, leaderboard disabled")
+            self.leaderboard = None
+        self.chunk_size = chunk_size
+        self.reorg_window = reorg_window
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()
+        self.last_poll = 0.0
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(chat_messages)")]
+        if columns and "digest" not in columns:
+            # Index created before anchored storage existed
+            for column in ("digest TEXT", "anchor_root TEXT", "anchor_index INTEGER"):
+                self.db.execute(f"ALTER TABLE chat_messages ADD COLUMN {column}")
+        self.db.executescript(SCHEMA)
+        self.worker = None
+        # (rewinds, last progress rowid, last badge rowid) applied to the
+        # leaderboard
+        self.leaderboard_position = None
+        self.leaderboard_lock = threading.Lock()
+        self._sync_leaderboard()
+
+    def _sync_leaderboard(self):
+        if self.leaderboard is None:
+            return
+        # Serialized, so a batch of rows is applied once
+        with self.leaderboard_lock:
+            self._sync_leaderboard_locked()
+
+    def _sync_leaderboard_locked(self):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM index_state WHERE key = 'rewinds'").fetchone()
+            rewinds = row[0] if row else 0
+            if self.leaderboard_position is None or self.leaderboard_position[0] != rewinds:
+                after_progress = after_badge = 0
+                reset = True
+            else:
+                _, after_progress, after_badge = self.leaderboard_position
+                reset = False
+            progress = self.db.execute(
+                "SELECT rowid, student, path, lessons, score FROM progress_events WHERE rowid > ? ORDER BY rowid",
+                (after_progress,),
+            ).fetchall()
+            badges = self.db.execute(
+                "SELECT rowid, student, badge_id FROM badge_events WHERE rowid > ? ORDER BY rowid", (after_badge,)
+            ).fetchall()
+        if reset:
+            self.leaderboard.reset()
+        self.leaderboard.apply([row[1:] for row in progress], [row[1:] for row in badges])
+        self.leaderboard_position = (
+            rewinds,
+            progress[-1][0] if progress else after_progress,
+            badges[-1][0] if badges else after_badge,
+        )
+
+    def _index_lock(self, blocking=True):
+        # Yields a true value while this process may index
+        if self.lock_path is None:
+            return nullcontext(True)
+        return process_lock(self.lock_path, blocking)
+
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, name="chat-indexer", daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Chat indexer poll failed", extra={"error": str(e)})
+            time.sleep(self.poll_interval)
+
+    def checkpoint(self):
+        with self.lock:
+            row = self.db.execute("SELECT number, hash FROM indexed_blocks ORDER BY number DESC LIMIT 1").fetchone()
+        return row
+
+    def poll_if_stale(self, max_age=None):
+        # Cheap catch-up for request handlers: skip if someone polled recently
+        # or a poll is already running. By default "recently" is one poll
+        # interval, so handlers only poll when the worker has fallen behind.
+        if max_age is None:
+            max_age = self.poll_interval
+        if time.time() - self.last_poll < max_age:
+            return
+        if self.poll_lock.acquire(blocking=False):
+            try:
+                with self._index_lock(blocking=False) as held:
+                    if held is not None:
+                        self._poll()
+            finally:
+                self.poll_lock.release()
+            self._sync_leaderboard()
+
+    def poll(self):
+        with self.poll_lock, self._index_lock():
+            self._poll()
+        self._sync_leaderboard()
+
+    def _poll(self):
+        self.last_poll = time.time()
+        head = self.w3.eth.block_number
+        checkpoint = self._rewind_reorged(head)
+        start = checkpoint + 1
+        while start <= head:
+            end = min(head, start + self.chunk_size - 1)
+            self._index_range(start, end)
+            start = end + 1
+        if self.chat_store is not None:
+            self._resolve_roots()
+
+    def _block_hash(self, number):
+        return Web3.to_hex(self.w3.eth.get_block(number)["hash"])
+
+    def _rewind_reorged(self, head):
+        # Returns the block number we can safely continue after (-1 = genesis)
+        with self.lock:
+            stored = self.db.execute("SELECT number, hash FROM indexed_blocks ORDER BY number DESC").fetchall()
+        for number, block_hash in stored:
+            if number <= head and self._block_hash(number) == block_hash:
+                if number != stored[0][0]:
+                    logger.warning("Chat indexer: reorg detected, rewinding", extra={"block": number})
+                    self._truncate_after(number)
+                return number
+        if stored:
+            # Fork is deeper than the hashes we kept: rebuild from scratch
+            logger.warning("Chat indexer: reorg deeper than stored window, reindexing")
+            self._truncate_after(-1)
+        return -1
+
+    def _truncate_after(self, number):
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute("DELETE FROM chat_messages WHERE block_number > ?", (number,))
+            self.db.execute("DELETE FROM progress_events WHERE block_number > ?", (number,))
+            self.db.execute("DELETE FROM badge_events WHERE block_number > ?", (number,))
+            self.db.execute("DELETE FROM unresolved_roots WHERE block_number > ?", (number,))
+            self.db.execute("DELETE FROM indexed_blocks WHERE number > ?", (number,))
+            self.db.execute(
+                "INSERT INTO index_state (key, value) VALUES ('rewinds', 1) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+            )
+            self.db.execute("COMMIT")
+
+    def _index_range(self, start, end):
+        logs = self.contract.events.ChatMessage.get_logs(fromBlock=start, toBlock=end)
+        end_hash = self._block_hash(end)
+        rows = []
+        blocks = {end: end_hash}
+        for log in logs:
+            args = log["args"]
+            rows.append((
+                args["student"].lower(),
+                args["path"],
+                args["timestamp"],
+                args["prompt"],
+                args["response"],
+                log["blockNumber"],
+                Web3.to_hex(log["transactionHash"]),
+                log["logIndex"],
+                None,
+                None,
+                None,
+            ))
+            blocks[log["blockNumber"]] = Web3.to_hex(log["blockHash"])
+        unresolved = []
+        if self.chat_store is not None:
+            for log in self.contract.events.ChatRootAnchored.get_logs(fromBlock=start, toBlock=end):
+                anchor = (
+                    Web3.to_hex(log["args"]["root"]), log["args"]["count"], log["blockNumber"],
+                    Web3.to_hex(log["transactionHash"]), log["logIndex"],
+                )
+                anchored_rows = self._anchored_rows(*anchor)
+                if anchored_rows is None:
+                    logger.warning("Chat root not in the local store, marked unresolved", extra={
+                        "root": anchor[0], "block": anchor[2], "tx_hash": anchor[3],
+                    })
+                    unresolved.append(anchor)
+                else:
+                    rows.extend(anchored_rows)
+                blocks[log["blockNumber"]] = Web3.to_hex(log["blockHash"])
+        progress, badges = [], []
+        if self.leaderboard is not None:
+            for log in self.contract.events.PathProgress.get_logs(fromBlock=start, toBlock=end):
+                args = log["args"]
+                progress.append((args["student"].lower(), args["path"], args["lessons"], args["score"], log["blockNumber"]))
+                blocks[log["blockNumber"]] = Web3.to_hex(log["blockHash"])
+            for log in self.contract.events.BadgeEarned.get_logs(fromBlock=start, toBlock=end):
+                args = log["args"]
+                badges.append((args["student"].lower(), args["badgeId"], log["blockNumber"]))
+                blocks[log["blockNumber"]] = Web3.to_hex(log["blockHash"])
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT INTO chat_messages (student, path, timestamp, prompt, response, block_number, tx_hash, log_index, "
+                "digest, anchor_root, anchor_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.db.executemany(
+                "INSERT INTO progress_events (student, path, lessons, score, block_number) VALUES (?, ?, ?, ?, ?)",
+                progress,
+            )
+            self.db.executemany("INSERT INTO badge_events (student, badge_id, block_number) VALUES (?, ?, ?)", badges)
+            self.db.executemany(
+                "INSERT INTO unresolved_roots (root, count, block_number, tx_hash, log_index) VALUES (?, ?, ?, ?, ?)",
+                unresolved,
+            )
+            self.db.executemany("INSERT OR REPLACE INTO indexed_blocks (number, hash) VALUES (?, ?)", blocks.items())
+            # Only the most recent hashes are needed for reorg detection
+            self.db.execute(
+                "DELETE FROM indexed_blocks WHERE number NOT IN "
+                "(SELECT number FROM indexed_blocks ORDER BY number DESC LIMIT ?)",
+                (self.reorg_window,),
+            )
+            self.db.execute("COMMIT")
+
+    def _anchored_rows(self, root, count, block_number, tx_hash, log_index):
+        # chat_messages rows for an anchored root, or None if the local store
+        # doesn't have its whole batch
+        batch = self.chat_store.batch(root)
+        if len(batch) != count:
+            return None
+        return [
+            (entry["student"], entry["path"], entry["timestamp"], "", "", block_number, tx_hash, log_index,
+             entry["digest"], root, position)
+            for position, entry in enumerate(batch)
+        ]
+
+    def _resolve_roots(self):
+        # Index unresolved roots whose batch has reached the store since
+        for anchor in self.unresolved_roots():
+            rows = self._anchored_rows(*anchor)
+            if rows is None:
+                continue
+            with self.lock:
+                self.db.execute("BEGIN")
+                self.db.executemany(
+                    "INSERT INTO chat_messages (student, path, timestamp, prompt, response, block_number, tx_hash, "
+                    "log_index, digest, anchor_root, anchor_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self.db.execute(
+                    "DELETE FROM unresolved_roots WHERE tx_hash = ? AND log_index = ?", (anchor[3], anchor[4])
+                )
+                self.db.execute("COMMIT")
+            logger.info("Chat root resolved", extra={"root": anchor[0], "block": anchor[2]})
+
+    def unresolved_roots(self):
+        # (root, count, block_number, tx_hash, log_index) of anchored roots
+        # whose messages aren't indexed, oldest first
+        with self.lock:
+            return self.db.execute(
+                "SELECT root, count, block_number, tx_hash, log_index FROM unresolved_roots "
+                "ORDER BY block_number, log_index"
+            ).fetchall()
+
+    def history(self, student_address, path, limit=100, cursor=None, since=None):
+        # Messages oldest first. `cursor` continues after the last page and
+        # `since` (unix seconds) returns only messages newer than that.
+        query = (
+            "SELECT id, timestamp, prompt, response, path, student, digest, anchor_root, anchor_index, tx_hash "
+            "FROM chat_messages WHERE student = ? AND path = ?"
+        )
+        params = [student_address.lower(), path]
+        if since is not None:
+            query += " AND timestamp > ?"
+            params.append(since)
+        if cursor is not None:
+            timestamp, row_id = decode_cursor(cursor)
+            query += " AND (timestamp > ? OR (timestamp = ? AND id > ?))"
+            params.extend([timestamp, timestamp, row_id])
+        query += " ORDER BY timestamp, id LIMIT ?"
+        params.append(limit + 1)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        # Pass next_cursor back to get the next page or, once has_more is
+        # false, only messages indexed after this call
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if rows else cursor
+        messages = []
+        for row_id, timestamp, prompt, response, message_path, student, digest, root, position, tx_hash in rows:
+            message = {"id": row_id, "timestamp": timestamp, "prompt": prompt, "response": response, "path": message_path}
+            if digest is not None:
+                message.update(self._anchored_message(student, message_path, timestamp, digest, root, position, tx_hash))
+            messages.append(message)
+        return messages, next_cursor, has_more
+
+    def recent_turns(self, student_address, path, limit):
+        # (timestamp, prompt, response) of the newest messages, oldest first.
+        # Anchored messages missing from the chat store are skipped.
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT timestamp, prompt, response, digest FROM chat_messages WHERE student = ? AND path = ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (student_address.lower(), path, limit),
+            ).fetchall()
+        turns = []
+        for timestamp, prompt, response, digest in reversed(rows):
+            if digest is not None:
+                content = self.chat_store.get(digest) if self.chat_store is not None else None
+                if content is None:
+                    continue
+                prompt, response = content
+            turns.append((timestamp, prompt, response))
+        return turns
+
+    def _anchored_message(self, student, path, timestamp, digest, root, position, tx_hash):
+        # Text from the chat store, plus what a caller needs to check it:
+        # keccak256 of the canonical message must equal digest, and the leaf
+        # with the proof must lead to root (verifyChat on the contract)
+        content = self.chat_store.get(digest) if self.chat_store is not None else None
+        prompt, response = content if content is not None else ("", "")
+        return {
+            "prompt": prompt,
+            "response": response,
+            "verification": {
+                "student": student,
+                "timestamp": timestamp,
+                "digest": digest,
+                "leaf": chat_leaf(student, path, timestamp, digest),
+                "proof": self.chat_store.proof(root, position) if self.chat_store is not None else [],
+                "root": root,
+                "tx_hash": tx_hash,
+                "available": content is not None,
+            },
+        }
@@ -0,0 +1,148 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from web3 import Web3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS anchored_chats (
+    root TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    student TEXT NOT NULL,
+    path INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (root, position)
+);
+"""
+
+
+def chat_payload(prompt, response):
+    # Canonical bytes a digest is taken over, independent of compression
+    return json.dumps({"prompt": prompt, "response": response}, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def chat_digest(prompt, response):
+    return Web3.to_hex(Web3.keccak(chat_payload(prompt, response)))
+
+
+def chat_leaf(student, path, timestamp, digest):
+    # Same as keccak256(abi.encodePacked(student, path, timestamp, digest))
+    return Web3.to_hex(Web3.solidity_keccak(
+        ["address", "uint256", "uint256", "bytes32"],
+        [Web3.to_checksum_address(student), path, timestamp, digest],
+    ))
+
+
+def _hash_pair(a, b):
+    # Sorted pairs, so a proof needs no left/right flags (as verifyChat does)
+    a, b = sorted([Web3.to_bytes(hexstr=a), Web3.to_bytes(hexstr=b)])
+    return Web3.to_hex(Web3.keccak(a + b))
+
+
+def _levels(leaves):
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        # An odd node out is carried up unchanged
+        levels.append([_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                       for i in range(0, len(level), 2)])
+    return levels
+
+
+def merkle_root(leaves):
+    return _levels(leaves)[-1][0]
+
+
+def merkle_proof(leaves, index):
+    proof = []
+    for level in _levels(leaves)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    node = leaf
+    for sibling in proof:
+        node = _hash_pair(node, sibling)
+    return node == root
+
+
+class ChatStore:
+    # Off-chain home of chat messages when CHAT_STORAGE=anchored. Prompt and
+    # response are stored zlib-compressed under the keccak digest of their
+    # canonical JSON, so identical turns share a blob.
+    #
+    # Turns are anchored in batches. Each turn becomes a Merkle leaf over
+    # (student, path, timestamp, digest), and only the batch root goes
+    # on-chain. anchored_chats keeps the leaves of every root sealed here,
+    # which is what the chat indexer and the proofs are built from.
+
+    def __init__(self, path, level=6):
+        self.level = level
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def put(self, prompt, response):
+        payload = chat_payload(prompt, response)
+        digest = Web3.to_hex(Web3.keccak(payload))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)", (digest, zlib.compress(payload, self.level))
+            )
+        return digest
+
+    def get(self, digest):
+        # (prompt, response), or None if the blob is missing or does not
+        # match its digest
+        with self.lock:
+            row = self.db.execute("SELECT data FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        payload = zlib.decompress(row[0])
+        if Web3.to_hex(Web3.keccak(payload)) != digest:
+            return None
+        message = json.loads(payload)
+        return message["prompt"], message["response"]
+
+    def seal(self, turns):
+        # turns: (student, lessons, score, path, challenge_id, digest, timestamp)
+        # tuples. Records their leaves and returns the Merkle root to anchor.
+        # Sealing the same turns again returns the same root.
+        leaves = [chat_leaf(turn[0], turn[3], turn[6], turn[5]) for turn in turns]
+        root = merkle_root(leaves)
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO anchored_chats (root, position, student, path, timestamp, digest, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(root, i, turn[0].lower(), turn[3], turn[6], turn[5], now) for i, turn in enumerate(turns)],
+            )
+            self.db.execute("COMMIT")
+        return root
+
+    def batch(self, root):
+        # Leaves of a sealed root in order, as dicts; [] if unknown here
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT student, path, timestamp, digest FROM anchored_chats WHERE root = ? ORDER BY position", (root,)
+            ).fetchall()
+        return [{"student": student, "path": path, "timestamp": timestamp, "digest": digest}
+                for student, path, timestamp, digest in rows]
+
+    def proof(self, root, position):
+        leaves = [chat_leaf(**entry) for entry in self.batch(root)]
+        return merkle_proof(leaves, position)
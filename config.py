@@ -1,14 +1,67 @@
+import logging
 import os
 from dotenv import load_dotenv
 
-print(f"Looking for .env at: {os.path.abspath('.env')}")
+logging.getLogger(__name__).debug("Looking for .env", extra={"path": os.path.abspath(".env")})
 load_dotenv(override=True)
 
 class Config:
-    ETH_NODE_URL = "http://127.0.0.1:8545"  # Ganache URL
+    # JSON-RPC endpoints, comma-separated (see rpc_pool.py). Transactions
+    # and nonce queries go to the first ETH_NODE_URL that is up, the others
+    # standing by; other reads go to ETH_REPLICA_URLS, if any.
+    ETH_NODE_URL = os.getenv("ETH_NODE_URL", "http://127.0.0.1:8545")  # Ganache URL
+    ETH_REPLICA_URLS = os.getenv("ETH_REPLICA_URLS", "")
+    # Keep-alive connections per endpoint; at least the threads that may
+    # call the node at once
+    RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "32"))
+    RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "10"))
+    # Seconds between health checks, and how many blocks a replica may
+    # trail the primary before reads skip it (0: no limit)
+    RPC_HEALTH_INTERVAL = float(os.getenv("RPC_HEALTH_INTERVAL", "5"))
+    RPC_MAX_LAG = int(os.getenv("RPC_MAX_LAG", "5"))
     CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS")
     PRIVATE_KEY = os.getenv("PRIVATE_KEY")
     STUDENT_PRIVATE_KEY = os.getenv("STUDENT_PRIVATE_KEY")
+    # Write-behind mode: /tutor queues its on-chain writes and returns at once
+    WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+    TX_QUEUE_PATH = os.getenv("TX_QUEUE_PATH", "tx_queue.db")
+    # File holding the owner's next nonce, shared by all worker processes.
+    # Unset: each process counts on its own (fine for a single process).
+    NONCE_COUNTER_PATH = os.getenv("NONCE_COUNTER_PATH", "")
+    # Local index of ChatMessage events served by /chat-history
+    CHAT_INDEX_PATH = os.getenv("CHAT_INDEX_PATH", "chat_index.db")
+    # "chain" puts prompt and response in ChatMessage events; "anchored" keeps
+    # them compressed in CHAT_STORE_PATH and puts only a Merkle root on-chain
+    CHAT_STORAGE = os.getenv("CHAT_STORAGE", "chain")
+    CHAT_STORE_PATH = os.getenv("CHAT_STORE_PATH", "chat_store.db")
+    # Max number of students whose getStudentStats result is cached
+    STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "10000"))
+    # Tutor answer cache; RESPONSE_CACHE_PATH adds an on-disk tier
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+    RESPONSE_CACHE_LESSON_BUCKET = int(os.getenv("RESPONSE_CACHE_LESSON_BUCKET", "5"))
+    # Earlier turns given to the LLM: at most CONVERSATION_MAX_TURNS per
+    # student and path, CONTEXT_TOKEN_BUDGET tokens per request, and
+    # CONVERSATION_MEMORY_MAX_BYTES across all conversations in a process
+    CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "20"))
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+    CONVERSATION_MEMORY_MAX_BYTES = int(os.getenv("CONVERSATION_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+    # Off: questions are asked without earlier turns, so every repeat of a
+    # question can be answered from the response cache
+    CONVERSATION_MEMORY = os.getenv("CONVERSATION_MEMORY", "true").lower() in ("1", "true", "yes")
+    # Per-student limits on /tutor (see admission.py): RATE_LIMIT_PER_MINUTE
+    # turns with bursts of RATE_LIMIT_BURST (0 turns the limit off), and at
+    # most STUDENT_LANE_TIMEOUT seconds waiting for the student's previous turn
+    RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5"))
+    STUDENT_LANE_TIMEOUT = float(os.getenv("STUDENT_LANE_TIMEOUT", "120"))
+    # SQLite file sharing the rate limits and turn order above between the
+    # worker processes of one host. Unset: each process keeps its own.
+    ADMISSION_STATE_PATH = os.getenv("ADMISSION_STATE_PATH", "")
+    # DEBUG adds per-request detail (addresses, paths, tx hashes) to the logs
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     # print(f"Loaded CONTRACT_ADDRESS: {CONTRACT_ADDRESS}")
     # print(f"Loaded PRIVATE_KEY: {PRIVATE_KEY}")
     CONTRACT_ABI = [
@@ -0,0 +1,175 @@
+import threading
+from collections import OrderedDict, deque
+
+# Longest stored reply; the tutor only needs the gist of earlier answers
+MAX_RESPONSE_CHARS = 2000
+# Rough per-record cost of the tuple and deque slot, on top of the text
+RECORD_OVERHEAD = 120
+# Older turns are cut to this many characters of question and answer
+SUMMARY_PROMPT_CHARS = 160
+SUMMARY_RESPONSE_CHARS = 240
+
+
+def estimate_tokens(text):
+    # About four characters per token for English with the Llama tokenizer
+    return (len(text) + 3) // 4
+
+
+def _clip(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+class _Conversation:
+    __slots__ = ("turns", "loaded")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)  # (timestamp, prompt bytes, response bytes)
+        self.loaded = False
+
+
+class ConversationMemory:
+    # Recent turns of each (student, path) conversation, so the tutor can
+    # follow up on what it said before. Records are (timestamp, UTF-8 prompt,
+    # UTF-8 reply clipped to MAX_RESPONSE_CHARS) and a conversation keeps its
+    # last max_turns. All conversations together stay under max_bytes; the
+    # least recently used ones are evicted first.
+    #
+    # A conversation not in memory is loaded through loader(student, path,
+    # limit), i.e. from the chat index, and merged with anything added here
+    # in the meantime. That way a restarted worker, or a different one,
+    # still picks up where the student left off.
+    #
+    # context() turns a conversation into chat messages within a token
+    # budget. The newest turns go in word for word. Once they no longer fit,
+    # older turns are cut to a line each, and the oldest are dropped, so the
+    # prompt stays about the same size however long the conversation gets.
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_turns=20, loader=None):
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.conversations = OrderedDict()  # (student, path) -> _Conversation
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(record):
+        return RECORD_OVERHEAD + len(record[1]) + len(record[2])
+
+    @staticmethod
+    def _record(timestamp, prompt, response):
+        return (timestamp, prompt.encode("utf-8"), response[:MAX_RESPONSE_CHARS].encode("utf-8"))
+
+    def _conversation(self, key):
+        # Caller must hold self.lock
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            conversation = self.conversations[key] = _Conversation(self.max_turns)
+        self.conversations.move_to_end(key)
+        return conversation
+
+    def _append(self, conversation, record):
+        # Caller must hold self.lock
+        if len(conversation.turns) == conversation.turns.maxlen:
+            self.bytes -= self._size(conversation.turns[0])
+        conversation.turns.append(record)
+        self.bytes += self._size(record)
+
+    def _evict(self):
+        # Caller must hold self.lock. The most recent conversation stays.
+        while self.bytes > self.max_bytes and len(self.conversations) > 1:
+            _, conversation = self.conversations.popitem(last=False)
+            self.bytes -= sum(self._size(record) for record in conversation.turns)
+            self.evictions += 1
+
+    def add(self, student_address, path, prompt, response, timestamp):
+        with self.lock:
+            self._append(self._conversation((student_address.lower(), path)), self._record(timestamp, prompt, response))
+            self._evict()
+
+    def _load(self, key):
+        turns = self.loader(key[0], key[1], self.max_turns)
+        with self.lock:
+            conversation = self._conversation(key)
+            if conversation.loaded:
+                return
+            existing = list(conversation.turns)
+            seen = {(record[0], record[1]) for record in existing}
+            loaded = [self._record(*turn) for turn in turns]
+            merged = sorted([record for record in loaded if (record[0], record[1]) not in seen] + existing,
+                            key=lambda record: record[0])
+            conversation.turns.clear()
+            self.bytes -= sum(self._size(record) for record in existing)
+            for record in merged:
+                self._append(conversation, record)
+            conversation.loaded = True
+            self._evict()
+
+    def turns(self, student_address, path):
+        # [{"prompt", "response", "timestamp", "path"}] oldest first, from
+        # memory only
+        with self.lock:
+            conversation = self.conversations.get((student_address.lower(), path))
+            records = list(conversation.turns) if conversation is not None else []
+        return [
+            {"prompt": prompt.decode("utf-8"), "response": response.decode("utf-8"), "timestamp": timestamp, "path": path}
+            for timestamp, prompt, response in records
+        ]
+
+    def context(self, student_address, path, max_tokens):
+        # Chat messages to put between the system prompt and the new question
+        key = (student_address.lower(), path)
+        with self.lock:
+            conversation = self.conversations.get(key)
+            loaded = conversation is not None and (conversation.loaded or self.loader is None)
+            if loaded:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not loaded and self.loader is not None:
+            self._load(key)
+        turns = self.turns(student_address, path)
+
+        budget = max_tokens
+        recent = []
+        summaries = []
+        for turn in reversed(turns):
+            if not summaries:
+                cost = estimate_tokens(turn["prompt"]) + estimate_tokens(turn["response"])
+                if cost <= budget:
+                    recent.append(turn)
+                    budget -= cost
+                    continue
+            line = (f"- Asked: {_clip(turn['prompt'], SUMMARY_PROMPT_CHARS)} | "
+                    f"Answered: {_clip(turn['response'], SUMMARY_RESPONSE_CHARS)}")
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            summaries.append(line)
+            budget -= cost
+
+        messages = []
+        if summaries:
+            messages.append({
+                "role": "system",
+                "content": "Earlier in this conversation (oldest first):\n" + "\n".join(reversed(summaries)),
+            })
+        for turn in reversed(recent):
+            messages.append({"role": "user", "content": turn["prompt"]})
+            messages.append({"role": "assistant", "content": turn["response"]})
+        return messages
+
+    def counters(self):
+        with self.lock:
+            return {
+                "conversations": len(self.conversations),
+                "turns": sum(len(conversation.turns) for conversation in self.conversations.values()),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
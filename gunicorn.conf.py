@@ -0,0 +1,54 @@
+import os
+
+# gunicorn settings for the Flask app with several worker processes:
+#   gunicorn -c gunicorn.conf.py app:app
+# The app is imported once in the master and forked (preload_app). Each
+# worker builds its own clients, stores and background threads after the
+# fork and warms them up before taking requests.
+
+# Every worker sends from the owner key, so they draw nonces from one file,
+# and a student's rate limit and turn order hold across workers. Set before
+# config.py is imported, which reads them.
+os.environ.setdefault("NONCE_COUNTER_PATH", "owner_nonce.json")
+os.environ.setdefault("ADMISSION_STATE_PATH", "admission.db")
+# Each worker writes its Prometheus metrics here, for /metrics to add up.
+# Set before prometheus_client is imported with the app.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "prometheus_metrics")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from config import Config  # noqa: E402
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+# Most of a request is spent waiting on the LLM and the node
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = True
+
+
+def on_starting(server):
+    # A new deployment counts from the node again, in case the chain was
+    # reset or the key was used elsewhere in the meantime
+    if Config.NONCE_COUNTER_PATH and os.path.exists(Config.NONCE_COUNTER_PATH):
+        os.remove(Config.NONCE_COUNTER_PATH)
+    # Lessons counts of the last deployment's turns would hide such a reset too
+    if Config.ADMISSION_STATE_PATH:
+        for suffix in ("", "-wal", "-shm", ".lanes"):
+            if os.path.exists(Config.ADMISSION_STATE_PATH + suffix):
+                os.remove(Config.ADMISSION_STATE_PATH + suffix)
+    # Metrics start from zero, as they would in a single process
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    from services import get_services
+
+    get_services().warm_up()
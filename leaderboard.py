@@ -0,0 +1,82 @@
+import threading
+from bisect import bisect_left, insort
+
+# Path 0 ranks students across all paths
+ALL_PATHS = 0
+
+
+class Leaderboard:
+    # Per-path rankings kept in sorted lists, so a top-K query is a slice
+    # instead of a scan over every student. Fed from PathProgress and
+    # BadgeEarned events by the chat indexer.
+    #
+    # A student's score on a path is the sum of the scores of their turns on
+    # that path. Ties are broken by lessons completed, then by badges.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.scores = {}   # (path, student) -> score on that path
+            self.lessons = {}  # student -> latest lessons count
+            self.badges = {}   # student -> badges earned
+            self.paths = {}    # student -> paths with a score
+            self.ranked = {}   # path -> sorted [(-score, -lessons, -badges, student)]
+
+    def apply(self, progress, badges):
+        # progress: (student, path, lessons, score) and badges: (student,
+        # badge_id) event tuples, in chain order
+        with self.lock:
+            for student, path, lessons, score in progress:
+                student = student.lower()
+                touched = self.paths.setdefault(student, set())
+                # Lessons are per student, so every path they rank on is re-keyed
+                affected = touched | {path, ALL_PATHS}
+                for ranked_path in affected:
+                    self._unrank(ranked_path, student)
+                self.lessons[student] = lessons
+                for ranked_path in (path, ALL_PATHS):
+                    self.scores[(ranked_path, student)] = self.scores.get((ranked_path, student), 0) + score
+                touched.add(path)
+                for ranked_path in affected:
+                    self._rank(ranked_path, student)
+            for student, badge_id in badges:
+                student = student.lower()
+                affected = self.paths.get(student, set()) | {ALL_PATHS}
+                for ranked_path in affected:
+                    self._unrank(ranked_path, student)
+                self.badges[student] = self.badges.get(student, 0) + 1
+                for ranked_path in affected:
+                    self._rank(ranked_path, student)
+
+    def _key(self, path, student):
+        return (-self.scores[(path, student)], -self.lessons.get(student, 0), -self.badges.get(student, 0), student)
+
+    def _rank(self, path, student):
+        # Caller must hold self.lock
+        if (path, student) in self.scores:
+            insort(self.ranked.setdefault(path, []), self._key(path, student))
+
+    def _unrank(self, path, student):
+        # Caller must hold self.lock
+        if (path, student) not in self.scores:
+            return
+        ranked = self.ranked[path]
+        key = self._key(path, student)
+        index = bisect_left(ranked, key)
+        if index < len(ranked) and ranked[index] == key:
+            del ranked[index]
+
+    def top(self, path, limit=10):
+        with self.lock:
+            entries = self.ranked.get(path, [])[:limit]
+            return [
+                {"rank": rank, "student": student, "score": -score, "lessons": -lessons, "badges": -badges}
+                for rank, (score, lessons, badges, student) in enumerate(entries, start=1)
+            ]
+
+    def size(self, path):
+        with self.lock:
+            return len(self.ranked.get(path, []))
@@ -0,0 +1,147 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# Prometheus metrics for both apps, served at /metrics. Stages are the steps
+# of a request (validate, get_stats, payment, llm, record, ...). RPC metrics
+# come from a web3 middleware, so every JSON-RPC call is counted wherever
+# it is made.
+#
+# With several worker processes, PROMETHEUS_MULTIPROC_DIR must be set before
+# prometheus_client is imported (gunicorn.conf.py does). Every worker then
+# writes its counters and histograms to files there, and whichever worker
+# answers /metrics serves their sum. The cache gauges are read at scrape
+# time and so are those of the answering worker.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "tutor_stage_seconds", "Time spent in each stage of a request", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter("tutor_stage_errors_total", "Stages that ended with an exception", ["stage"])
+REQUEST_SECONDS = Histogram(
+    "tutor_http_request_seconds", "Time to produce the response headers", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("tutor_http_requests_total", "HTTP responses by endpoint and status", ["endpoint", "status"])
+RPC_CALLS = Counter("tutor_rpc_calls_total", "JSON-RPC calls made to the Ethereum node", ["method"])
+RPC_ERRORS = Counter("tutor_rpc_errors_total", "JSON-RPC calls that failed or returned an error", ["method"])
+RPC_SECONDS = Histogram("tutor_rpc_seconds", "JSON-RPC call latency", ["method"], buckets=LATENCY_BUCKETS)
+RPC_ENDPOINT_SECONDS = Histogram(
+    "tutor_rpc_endpoint_seconds", "JSON-RPC call latency by node endpoint", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+RPC_ENDPOINT_ERRORS = Counter(
+    "tutor_rpc_endpoint_errors_total", "JSON-RPC calls that got no answer from the endpoint", ["endpoint"]
+)
+LLM_TOKENS = Counter("tutor_llm_tokens_total", "Tokens reported by the Groq API", ["kind"])
+LLM_ERRORS = Counter("tutor_llm_errors_total", "Groq calls that failed")
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def observe_request(endpoint, status, seconds):
+    REQUEST_SECONDS.labels(endpoint).observe(seconds)
+    REQUESTS.labels(endpoint, str(status)).inc()
+
+
+def observe_usage(usage):
+    # usage is a Groq CompletionUsage, or None when the API didn't send one
+    if usage is not None:
+        LLM_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+
+def observe_rpc_endpoint(endpoint, seconds, ok):
+    # Called by the provider pool for each HTTP round-trip, health checks included
+    if ok:
+        RPC_ENDPOINT_SECONDS.labels(endpoint).observe(seconds)
+    else:
+        RPC_ENDPOINT_ERRORS.labels(endpoint).inc()
+
+
+def _rpc_failed(method, response):
+    if isinstance(response, dict) and "error" in response:
+        RPC_ERRORS.labels(method).inc()
+
+
+def rpc_metrics_middleware(make_request, w3):
+    def middleware(method, params):
+        RPC_CALLS.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception:
+            RPC_ERRORS.labels(method).inc()
+            raise
+        finally:
+            RPC_SECONDS.labels(method).observe(time.perf_counter() - start)
+        _rpc_failed(method, response)
+        return response
+    return middleware
+
+
+async def async_rpc_metrics_middleware(make_request, async_w3):
+    async def middleware(method, params):
+        RPC_CALLS.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            response = await make_request(method, params)
+        except Exception:
+            RPC_ERRORS.labels(method).inc()
+            raise
+        finally:
+            RPC_SECONDS.labels(method).observe(time.perf_counter() - start)
+        _rpc_failed(method, response)
+        return response
+    return middleware
+
+
+class CacheCollector:
+    # Exports the counters() of the stats and response caches as gauges,
+    # read at scrape time
+    def __init__(self, caches):
+        self.caches = caches  # name -> object with counters()
+
+    def collect(self):
+        for name, cache in self.caches.items():
+            family = GaugeMetricFamily(f"tutor_{name}", f"{name} counters", labels=["counter"])
+            for counter, value in cache.counters().items():
+                family.add_metric([counter], float(value))
+            yield family
+
+
+_cache_collector = None
+
+
+def register_caches(**caches):
+    # Replaces the caches registered before, e.g. by the parent of a forked
+    # worker
+    global _cache_collector
+    if _cache_collector is not None:
+        REGISTRY.unregister(_cache_collector)
+    _cache_collector = CacheCollector(caches)
+    REGISTRY.register(_cache_collector)
+
+
+def render():
+    # (body, content type) for the /metrics endpoint
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _cache_collector is not None:
+        registry.register(_cache_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
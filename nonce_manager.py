@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import threading
+
+from process_lock import process_lock
+
+logger = logging.getLogger(__name__)
+
+# Fragments of node error messages that mean our idea of the next nonce is
+# wrong (another sender used it, or a transaction we thought was pending got
+# dropped). Ganache, geth and most providers use one of these phrasings.
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "already known",
+    "known transaction",
+    "replacement transaction underpriced",
+    "the tx doesn't have the correct nonce",
+    "invalid nonce",
+    "invalid transaction nonce",  # eth-tester / py-evm
+)
+
+
+def is_nonce_error(error):
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+
+class LocalNonceCounter:
+    # Next nonce for one account, kept in this process. None means unknown:
+    # the next take() must be seeded from the node.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_nonce = None
+
+    def take(self, seed=None):
+        # Reserve the next nonce. Returns None if the counter is unknown and no
+        # seed was given; a seed is ignored if someone else seeded it first.
+        with self.lock:
+            if self.next_nonce is None:
+                if seed is None:
+                    return None
+                self.next_nonce = seed
+            nonce = self.next_nonce
+            self.next_nonce += 1
+            return nonce
+
+    def release(self, nonce):
+        # Hand nonce out again if it was the last one taken. Returns whether
+        # it was; if not, the counter is left as it is.
+        with self.lock:
+            if self.next_nonce != nonce + 1:
+                return False
+            self.next_nonce = nonce
+            return True
+
+    def store(self, next_nonce):
+        with self.lock:
+            self.next_nonce = next_nonce
+
+
+class FileNonceCounter:
+    # LocalNonceCounter kept in a small JSON file under an flock, so every
+    # worker process sending from the owner key draws from one sequence.
+    # Holding the lock only covers a read and a write of the file; node
+    # round-trips happen outside it. The file names the address it counts
+    # for, and counts for any other address are treated as unknown.
+
+    def __init__(self, path, address):
+        self.path = path
+        self.address = address.lower()
+
+    def _update(self, change):
+        # change(next_nonce or None) -> (new next_nonce, result)
+        with process_lock(self.path) as handle:
+            try:
+                state = json.loads(handle.read() or "{}")
+            except ValueError:
+                state = {}
+            next_nonce = state.get("next_nonce") if state.get("address") == self.address else None
+            next_nonce, result = change(next_nonce)
+            handle.seek(0)
+            handle.truncate()
+            handle.write(json.dumps({"address": self.address, "next_nonce": next_nonce}))
+            handle.flush()
+            return result
+
+    def take(self, seed=None):
+        def change(next_nonce):
+            if next_nonce is None:
+                if seed is None:
+                    return None, None
+                next_nonce = seed
+            return next_nonce + 1, next_nonce
+        return self._update(change)
+
+    def release(self, nonce):
+        def change(next_nonce):
+            if next_nonce != nonce + 1:
+                return next_nonce, False
+            return nonce, True
+        return self._update(change)
+
+    def store(self, next_nonce):
+        self._update(lambda _: (next_nonce, None))
+
+
+class NonceManager:
+    # Hands out nonces for one sending account from a counter, so that
+    # several transactions can be signed and broadcast back-to-back without a
+    # get_transaction_count round-trip (and a receipt wait) in between.
+    # The counter is seeded from the node's pending count and re-seeded
+    # whenever the node tells us it is out of step. It is in-process by
+    # default; pass a FileNonceCounter to share it between worker processes.
+
+    def __init__(self, w3, address, counter=None):
+        self.w3 = w3
+        self.address = address
+        self.counter = counter or LocalNonceCounter()
+
+    def _pending_count(self):
+        return self.w3.eth.get_transaction_count(self.address, "pending")
+
+    def reserve(self):
+        nonce = self.counter.take()
+        if nonce is None:
+            nonce = self.counter.take(self._pending_count())
+        return nonce
+
+    def release(self, nonce):
+        # The transaction for this nonce never reached the node. If it was the
+        # most recent reservation we can simply hand it out again; otherwise
+        # later nonces are already in flight, so re-seed from the node now so
+        # the next reservation fills the gap. If the node can't be reached
+        # either, the next reservation asks it.
+        if self.counter.release(nonce):
+            return
+        try:
+            self.resync()
+        except Exception as e:
+            logger.warning("Nonce resync after release failed", extra={"nonce": nonce, "error": str(e)})
+            self.forget()
+
+    def resync(self):
+        self.counter.store(self._pending_count())
+
+    def forget(self):
+        # For when resync() can't reach the node: the next reserve() asks it
+        self.counter.store(None)
+
+
+class AsyncNonceManager:
+    # NonceManager for AsyncWeb3: same bookkeeping, but the node round-trips
+    # are awaited. Counter operations run in a thread, since a
+    # FileNonceCounter waits on an flock and the file.
+
+    def __init__(self, w3, address, counter=None):
+        self.w3 = w3
+        self.address = address
+        self.counter = counter or LocalNonceCounter()
+
+    async def _pending_count(self):
+        return await self.w3.eth.get_transaction_count(self.address, "pending")
+
+    async def reserve(self):
+        nonce = await asyncio.to_thread(self.counter.take)
+        if nonce is None:
+            nonce = await asyncio.to_thread(self.counter.take, await self._pending_count())
+        return nonce
+
+    async def release(self, nonce):
+        # See NonceManager.release
+        if await asyncio.to_thread(self.counter.release, nonce):
+            return
+        try:
+            await self.resync()
+        except Exception as e:
+            logger.warning("Nonce resync after release failed", extra={"nonce": nonce, "error": str(e)})
+            await self.forget()
+
+    async def resync(self):
+        await asyncio.to_thread(self.counter.store, await self._pending_count())
+
+    async def forget(self):
+        await asyncio.to_thread(self.counter.store, None)
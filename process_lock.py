@@ -0,0 +1,31 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, and no pre-forked workers either
+    fcntl = None
+
+
+@contextmanager
+def process_lock(path, blocking=True):
+    # Exclusive flock on path, shared by every process on the host that uses
+    # the same file, e.g. the gunicorn workers of one deployment. Yields the
+    # open file (read/write, for state kept inside it), or None if blocking
+    # is off and another process holds the lock.
+    # Each acquisition opens its own file description, so threads of one
+    # process exclude each other too, and a handle inherited across fork()
+    # is never shared.
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "r+") as handle:
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield None
+                return
+        try:
+            yield handle
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
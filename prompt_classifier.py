@@ -0,0 +1,294 @@
+import os
+import re
+
+# Keyword vocabularies for each learning path. Path 5 (Random) is the odd one
+# out: its list is what a prompt must NOT mention.
+
+DSA_KEYWORDS = [
+    "data structure", "algorithm", "binary search", "sorting", "graph", "tree", "linked list",
+    "stack", "queue", "hash", "hashing", "hashmap", "hashtable", "set", "map", "array", "matrix",
+    "dp", "dynamic programming", "greedy", "divide and conquer", "backtracking", "recursion",
+    "iterative", "bfs", "dfs", "breadth first search", "depth first search", "topological sort",
+    "shortest path", "dijkstra", "bellman-ford", "floyd-warshall", "kruskal", "prim", "mst",
+    "minimum spanning tree", "union find", "disjoint set", "trie", "segment tree", "fenwick tree",
+    "binary indexed tree", "heap", "priority queue", "binary tree", "bst", "binary search tree",
+    "avl tree", "red-black tree", "b tree", "b+ tree", "suffix tree", "suffix array", "knapsack",
+    "lcs", "longest common subsequence", "lis", "longest increasing subsequence", "edit distance",
+    "string matching", "kmp", "knuth-morris-pratt", "rabin-karp", "two pointers", "sliding window",
+    "merge sort", "quick sort", "heap sort", "bubble sort", "insertion sort", "selection sort",
+    "radix sort", "bucket sort", "counting sort", "big o", "time complexity", "space complexity",
+    "asymptotic notation", "recurrence relation", "master theorem", "floyd cycle", "tortoise hare",
+    "kadane", "maximum subarray", "n queen", "sudoku", "permutation", "combination",
+    "bit manipulation", "bitmask", "xor", "and operation", "or operation", "bitwise",
+    "graph traversal", "cycle detection", "connected components", "strongly connected components",
+    "tarjan", "kosaraju", "articulation point", "bridge edge", "eulerian path", "hamiltonian path",
+    "flow network", "max flow", "min cut", "ford-fulkerson", "bipartite graph", "matching",
+    "hungarian algorithm"
+]
+
+PROGRAMMING_KEYWORDS = [
+    "code", "coding", "programming", "debug", "debugging", "syntax", "function", "variable", "loop",
+    "class", "object", "javascript", "java", "c++", "cpp", "ruby", "sql", "html", "css", "python",
+    "go", "golang", "rust", "typescript", "php", "swift", "kotlin", "scala", "perl", "r language",
+    "matlab", "shell", "bash", "powershell", "perl", "lua", "dart", "assembly", "asm", "c#",
+    "csharp", "vb", "visual basic", "f#", "erlang", "elixir", "haskell", "clojure", "lisp",
+    "fortran", "cobol", "pascal", "delphi", "ada", "ocaml", "prolog", "script", "program",
+    "compile", "compiler", "interpret", "interpreter", "runtime", "exception", "error handling",
+    "try catch", "throw", "finally", "stack trace", "memory leak", "pointer", "reference",
+    "dereference", "memory management", "garbage collection", "heap memory", "stack memory",
+    "thread", "multithreading", "concurrency", "parallel", "async", "asynchronous", "promise",
+    "callback", "event loop", "closure", "scope", "lexical scope", "hoisting", "inheritance",
+    "polymorphism", "encapsulation", "abstraction", "interface", "abstract class", "method",
+    "constructor", "destructor", "getter", "setter", "property", "static method", "instance",
+    "singleton", "factory pattern", "observer pattern", "strategy pattern", "decorator pattern",
+    "mvc", "model view controller", "rest api", "graphql", "http request", "json", "xml", "yaml",
+    "database", "query", "orm", "object relational mapping", "crud", "create read update delete",
+    "regex", "regular expression", "unit test", "testing", "tdd", "test driven development", "mock",
+    "stub", "framework", "library", "package", "module", "import", "export", "dependency", "pip",
+    "npm", "yarn", "maven", "gradle", "docker", "container", "virtual machine", "devops", "ci cd",
+    "continuous integration", "continuous deployment", "git", "version control", "commit", "branch",
+    "merge", "pull request", "repository", "frontend", "backend", "full stack", "web development",
+    "mobile development", "app development", "cross platform", "ide",
+    "integrated development environment", "vscode", "visual studio", "eclipse", "intellij",
+    "pycharm", "sublime", "atom", "jupyter", "notebook"
+]
+
+BLOCKCHAIN_KEYWORDS = [
+    "blockchain", "ethereum", "smart contract", "crypto", "bitcoin", "decentralized", "ledger",
+    "token", "web3", "dapp"
+]
+
+NON_TECH_KEYWORDS = [
+    "aerospace", "mechanical", "electrical", "aerodynamics", "thermodynamics", "robotics",
+    "circuits", "motors", "avionics", "engineering", "aeronautical", "astronautical",
+    "flight dynamics", "lift", "drag", "thrust", "propulsion", "jet engine", "turbine", "rocket",
+    "spacecraft", "satellite", "orbit", "trajectory", "reentry", "thermal protection",
+    "guidance system", "navigation", "control system", "aerofoil", "wing", "fuselage", "empennage",
+    "stability", "control surface", "flaps", "ailerons", "rudder", "elevator", "wind tunnel",
+    "computational fluid dynamics", "cfd", "mach number", "supersonic", "hypersonic", "transonic",
+    "laminar flow", "turbulent flow", "boundary layer", "nozzle", "combustion", "fuel system",
+    "mechanical design", "cad", "computer aided design", "solidworks", "autodesk",
+    "finite element analysis", "fea", "stress analysis", "strain", "material science", "mechanics",
+    "statics", "dynamics", "kinematics", "vibration", "fatigue", "fracture mechanics",
+    "manufacturing", "cnc", "machining", "3d printing", "additive manufacturing", "welding",
+    "fabrication", "assembly", "gear", "bearing", "shaft", "lever", "pulley", "cam", "spring",
+    "piston", "crankshaft", "flywheel", "hydraulics", "pneumatics", "pump", "valve", "actuator",
+    "sensor", "control engineering", "pid controller", "feedback loop", "servo", "stepper motor",
+    "dc motor", "ac motor", "induction motor", "synchronous motor", "transformer", "capacitor",
+    "resistor", "inductor", "diode", "transistor", "mosfet", "bjt", "op amp",
+    "operational amplifier", "circuit design", "pcb", "printed circuit board", "schematic",
+    "breadboard", "multimeter", "oscilloscope", "signal processing", "filter", "amplifier",
+    "rectifier", "inverter", "converter", "power supply", "ac dc", "dc ac", "voltage", "current",
+    "resistance", "ohm's law", "kirchhoff's law", "thevenin", "norton", "superposition",
+    "maxwell's equations", "electromagnetism", "magnetic field", "electric field", "faraday's law",
+    "induction", "generator", "alternator", "battery", "solar panel", "renewable energy",
+    "power electronics", "microcontroller", "arduino", "raspberry pi", "embedded system", "iot",
+    "internet of things", "automation", "plc", "programmable logic controller", "scada",
+    "supervisory control", "relay", "switchgear", "fuse", "circuit breaker", "grounding",
+    "earthing", "lightning protection", "hvac", "heating ventilation", "air conditioning"
+]
+
+STUDY_TECH_KEYWORDS = [
+    "study", "learn", "code", "coding", "programming", "blockchain", "dsa", "data structure",
+    "algorithm", "python", "javascript", "ethereum", "java", "c++", "cpp", "ruby", "sql", "html",
+    "css", "go", "golang", "rust", "typescript", "php", "swift", "kotlin", "scala", "perl",
+    "r language", "matlab", "shell", "bash", "powershell", "lua", "dart", "assembly", "asm", "c#",
+    "csharp", "vb", "visual basic", "f#", "erlang", "elixir", "haskell", "clojure", "lisp",
+    "fortran", "cobol", "pascal", "delphi", "ada", "ocaml", "prolog", "script", "program",
+    "compile", "compiler", "interpret", "interpreter", "runtime", "exception", "error handling",
+    "debug", "debugging", "syntax", "function", "variable", "loop", "class", "object",
+    "smart contract", "crypto", "cryptocurrency", "bitcoin", "decentralized", "ledger", "token",
+    "web3", "dapp", "solidity", "vyper", "truffle", "hardhat", "ganache", "metamask", "wallet",
+    "private key", "public key", "address", "transaction", "gas", "mining", "proof of work",
+    "proof of stake", "consensus", "aerospace", "mechanical", "electrical", "aerodynamics",
+    "thermodynamics", "robotics", "circuits", "motors", "avionics", "engineering", "aeronautical",
+    "astronautical", "flight dynamics", "propulsion", "jet engine", "rocket", "spacecraft",
+    "satellite", "mechanical design", "cad", "finite element analysis", "kinematics", "vibration",
+    "manufacturing", "cnc", "hydraulics", "pneumatics", "transformer", "capacitor", "resistor",
+    "diode", "transistor", "circuit design", "power electronics", "microcontroller", "arduino",
+    "embedded system", "iot", "automation", "plc", "scada", "math", "mathematics", "algebra",
+    "calculus", "geometry", "trigonometry", "probability", "statistics", "linear algebra",
+    "differential equations", "physics", "chemistry", "biology", "science", "experiment",
+    "research", "education", "school", "university", "college", "exam", "test", "quiz", "homework",
+    "assignment", "project", "lecture", "lesson", "course", "curriculum", "syllabus", "teacher",
+    "professor", "student", "learn", "learning", "knowledge", "academic", "study material",
+    "textbook", "paper", "thesis", "dissertation", "software", "hardware", "network", "database",
+    "server", "client", "api", "rest api", "graphql", "json", "xml", "yaml", "cloud", "aws",
+    "azure", "gcp", "docker", "kubernetes", "devops", "ci cd", "git", "version control",
+    "machine learning", "ai", "artificial intelligence", "deep learning", "neural network",
+    "data science", "big data", "analytics", "cybersecurity", "hacking", " penetration testing",
+    "encryption", "security", "password", "authentication", "authorization", "oauth", "jwt",
+    "token", "frontend", "backend", "full stack", "web development", "mobile development",
+    "app development", "ide", "vscode", "visual studio", "eclipse", "intellij"
+]
+
+PATH_KEYWORDS = {
+    1: DSA_KEYWORDS,
+    2: PROGRAMMING_KEYWORDS,
+    3: BLOCKCHAIN_KEYWORDS,
+    4: NON_TECH_KEYWORDS,
+    5: STUDY_TECH_KEYWORDS,
+}
+
+# A token is a run of letters/digits, optionally followed by "+" or "#" so that
+# "c++", "c#", "f#" and "b+ tree" survive tokenization. Everything else
+# (spaces, hyphens, apostrophes, brackets, and their Unicode forms such as
+# "’" and "–") separates tokens, which is what gives us word-boundary
+# matching: "go" no longer fires inside "algorithm".
+TOKEN_RE = re.compile(r"[^\W_]+[+#]*")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _plural_forms(token):
+    # Let "graph" match "graphs" and "query" match "queries" without having
+    # to list every plural in the vocabularies above.
+    forms = [token]
+    if token[-1] in "+#":
+        return forms
+    forms.append(token + "s")
+    if token.endswith(("s", "x", "z", "ch", "sh")):
+        forms.append(token + "es")
+    elif token.endswith("y") and len(token) > 1 and token[-2] not in "aeiou":
+        forms.append(token[:-1] + "ies")
+    return forms
+
+
+# Pieces of the compiled patterns, spelling out TOKEN_RE's boundaries on the
+# raw prompt. A keyword token must not run on into a "+" or "#", nor into a
+# letter or digit unless it ends in "+" or "#" itself ("c#" is a token of
+# "c#net"). The tokens of a multi-word keyword are separated by non-token
+# characters: at least one, except after a "+" or "#" ("b+tree" is "b+"
+# "tree"), and never starting with a "+" or "#", which would belong to the
+# token. _START rejects positions inside a word with a single check, before
+# any keyword is tried.
+_START = r"(?<![^\W_])"
+_GAP = r"(?![+#])[\W_]+"
+_SYMBOL_GAP = r"(?![+#])[\W_]*"
+_END = r"(?![^\W_]|[+#])"
+_SYMBOL_END = r"(?![+#])"
+
+# A regex pass costs about as much as this many str substring searches, so a
+# vocabulary with fewer distinct leading words is first checked with those
+# (all in C) and the regex only runs when one of them occurs in the prompt
+PREFILTER_MAX = 24
+
+
+def _sequences(keyword):
+    # The keyword as pattern pieces, one list per plural form
+    tokens = tokenize(keyword)
+    if not tokens:
+        return []
+    head = []
+    for token in tokens[:-1]:
+        head.extend(token)
+        head.append(_SYMBOL_GAP if token[-1] in "+#" else _GAP)
+    sequences = []
+    for form in _plural_forms(tokens[-1]):
+        sequences.append(head + list(form) + [_SYMBOL_END if form[-1] in "+#" else _END])
+    return sequences
+
+
+def _anchor(keyword):
+    # A substring of every text the keyword can match in
+    tokens = tokenize(keyword)
+    if len(tokens) > 1:
+        return tokens[0]
+    return os.path.commonprefix(_plural_forms(tokens[0]))
+
+
+def _render(node):
+    # Character trie -> regex, sharing common prefixes between keywords
+    alternatives = []
+    for piece, child in node.items():
+        literal = re.escape(piece) if len(piece) == 1 else piece
+        alternatives.append(literal + _render(child) if child else literal)
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
+
+
+class PromptClassifier:
+    # One compiled regex per path vocabulary, built once from a character
+    # trie of its keywords (with plural forms), so a check is a single
+    # re.search over the lowered prompt that stops at the first keyword.
+    # The patterns match on the same token boundaries as tokenize(), which
+    # is what keeps "go" from firing inside "algorithm"; because they run
+    # on the raw text, no token list is ever built. Small vocabularies get a
+    # substring prefilter (PREFILTER_MAX).
+
+    def __init__(self, vocabularies):
+        self.paths = sorted(vocabularies)
+        self.patterns = {}
+        self.anchors = {}
+        for path, keywords in vocabularies.items():
+            trie = {}
+            for keyword in keywords:
+                for sequence in _sequences(keyword):
+                    node = trie
+                    for piece in sequence:
+                        node = node.setdefault(piece, {})
+            self.patterns[path] = re.compile(_START + "(?:" + _render(trie) + ")")
+            anchors = {_anchor(keyword) for keyword in keywords if tokenize(keyword)}
+            if len(anchors) <= PREFILTER_MAX:
+                self.anchors[path] = tuple(anchors)
+
+    def _search(self, text, path):
+        anchors = self.anchors.get(path)
+        if anchors is not None and not any(anchor in text for anchor in anchors):
+            return False
+        return self.patterns[path].search(text) is not None
+
+    def matches(self, prompt, path):
+        # Whether the path's vocabulary appears in the prompt
+        return self._search(prompt.lower(), path)
+
+    def classify(self, prompt):
+        # Set of path ids whose vocabulary appears in the prompt
+        text = prompt.lower()
+        return frozenset(path for path in self.paths if self._search(text, path))
+
+
+classifier = PromptClassifier(PATH_KEYWORDS)
+
+
+def matching_paths(prompt):
+    return classifier.classify(prompt)
+
+
+# Messages returned when a prompt does not fit the selected path
+PATH_ERRORS = {
+    1: "Please ask a DSA-related question (e.g., about sorting, graphs, or dynamic programming).",
+    2: "Please ask a programming-related question (e.g., about coding, debugging, or syntax).",
+    3: "Please ask a blockchain-related question (e.g., about Ethereum, smart contracts, or decentralization).",
+    4: "Please ask a question related to Aerospace, Mechanical, or Electrical fields (e.g., about aerodynamics, circuits, or robotics).",
+    5: "Please ask a casual, non-study-related question (e.g., about movies, hobbies, or fun topics).",
+}
+
+
+def validate_prompt_for_path(prompt, path):
+    if path not in PATH_ERRORS:
+        return True, ""
+
+    # Only the selected path's vocabulary is searched for
+    found = classifier.matches(prompt, path)
+
+    if path == 5:  # Random (no studies/tech)
+        if found:
+            return False, PATH_ERRORS[5]
+    elif not found:
+        return False, PATH_ERRORS[path]
+
+    return True, ""
+
+
+# Path-specific context for the tutor's system prompt
+PATH_CONTEXT = {
+    1: "DSA only - Answer questions strictly about Data Structures and Algorithms (e.g., sorting, graphs, dynamic programming). Refuse to answer non-DSA questions.",
+    2: "Programming - Answer questions strictly about programming (e.g., coding, debugging, syntax, any language). Refuse to answer non-programming questions.",
+    3: "BlockChain - Answer questions strictly about blockchain (e.g., Ethereum, smart contracts, decentralization). Refuse to answer non-blockchain questions.",
+    4: "Non Tech field - Answer questions strictly about Aerospace, Mechanical, or Electrical fields (e.g., aerodynamics, circuits, robotics). Refuse to answer questions outside these fields.",
+    5: "Random - Engage in casual conversation only (e.g., about movies, hobbies, fun topics). Refuse to answer any study-related or tech-related questions.",
+}
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import sqlite3
+import string
+import threading
+import time
+from collections import OrderedDict
+
+_PUNCTUATION = {ord(c): " " for c in string.punctuation}
+
+
+def normalize_prompt(prompt):
+    # "Explain  Binary-Search?" and "explain binary search" share an entry
+    return " ".join(prompt.lower().translate(_PUNCTUATION).split())
+
+
+def make_key(path, lessons, prompt, lesson_bucket=5):
+    # Students a few lessons apart get the same answer; the tutor context only
+    # changes meaningfully over larger steps.
+    raw = f"{path}:{lessons // lesson_bucket}:{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def history_key(cache_key, history):
+    # An answer that builds on earlier turns is only reused for the same
+    # question asked after the same turns, so the history window is part of
+    # its key. Without history the key is unchanged.
+    if not history:
+        return cache_key
+    raw = json.dumps([cache_key, history], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    # Two-tier cache of tutor answers. The memory tier is an LRU bounded both
+    # by entry count and by total response size. The optional SQLite tier
+    # (disk_path) survives restarts and is consulted on a memory miss. Both
+    # tiers expire entries after ttl seconds.
+
+    def __init__(self, max_entries=2000, max_bytes=16 * 1024 * 1024, ttl=24 * 3600, disk_path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, response, size in bytes)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.db = None
+        if disk_path:
+            self.db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, response, size = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                self._remove(key)
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self._store(key, row[0], row[1])
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self._store(key, response, expires_at)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at),
+                )
+            self.puts += 1
+        # Expired rows are otherwise only skipped, so sweep now and then
+        if self.puts % 500 == 0:
+            self.purge_expired()
+
+    def purge_expired(self):
+        now = time.time()
+        with self.lock:
+            for key in [key for key, (expires_at, _, _) in self.entries.items() if expires_at <= now]:
+                self._remove(key)
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+
+    def _store(self, key, response, expires_at):
+        # Caller must hold self.lock
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (expires_at, response, size)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+
+    def _remove(self, key):
+        # Caller must hold self.lock
+        expires_at, response, size = self.entries.pop(key)
+        self.size -= size
+
+    def counters(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,334 @@
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Calls that must see the sending node's own view: broadcasts, the pending
+# nonce, gas estimates against pending state and the receipt of a
+# transaction we just sent. Everything else is a read a replica can answer.
+PRIMARY_METHODS = frozenset({
+    "eth_sendRawTransaction",
+    "eth_sendTransaction",
+    "eth_getTransactionCount",
+    "eth_estimateGas",
+    "eth_getTransactionReceipt",
+    "eth_getTransactionByHash",
+})
+# Broadcasts are only retried on another node if the first one cannot have
+# received them: a resent transaction would be rejected as "already known",
+# which the nonce manager takes for a stale nonce and signs again.
+SEND_METHODS = frozenset({"eth_sendRawTransaction", "eth_sendTransaction"})
+# Recent calls per endpoint kept for the latency percentiles
+LATENCY_SAMPLES = 1000
+
+# Lowest block the reads of the current thread or task must see; see read_after
+_min_block = contextvars.ContextVar("rpc_min_block", default=None)
+
+
+@contextmanager
+def read_after(block):
+    # Reads made inside go only to replicas whose last health check saw at
+    # least `block`, else to the primaries, so they see a write mined there.
+    # math.inf sends them to the primaries; None lifts the restriction.
+    token = _min_block.set(block)
+    try:
+        yield
+    finally:
+        _min_block.reset(token)
+
+
+def endpoint_name(url):
+    # scheme://host:port, leaving out any credentials or API key in the URL
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.hostname}" + (f":{parts.port}" if parts.port else "")
+
+
+def split_urls(value):
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+def _percentile_ms(samples, percent):
+    # samples: sorted seconds
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(len(samples) * percent / 100))] * 1000, 2)
+
+
+class Endpoint:
+    def __init__(self, url, role):
+        self.url = url
+        self.role = role  # "primary" or "replica"
+        self.name = endpoint_name(url)
+        self.lock = threading.Lock()
+        self.down_until = 0.0  # monotonic time; skipped for requests until then
+        self.lagging = False
+        self.block = None  # head at the last health check
+        self.calls = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # seconds
+
+    def up(self, now):
+        return self.down_until <= now
+
+    def observe(self, seconds, ok):
+        metrics.observe_rpc_endpoint(self.name, seconds, ok)
+        with self.lock:
+            self.calls += 1
+            if ok:
+                self.latencies.append(seconds)
+            else:
+                self.errors += 1
+
+    def stats(self, head=None):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            calls, errors = self.calls, self.errors
+        return {
+            "endpoint": self.name,
+            "role": self.role,
+            "up": self.up(time.monotonic()),
+            "lagging": self.lagging,
+            "block": self.block,
+            "lag": head - self.block if head is not None and self.block is not None else None,
+            "calls": calls,
+            "errors": errors,
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p95_ms": _percentile_ms(latencies, 95),
+            "p99_ms": _percentile_ms(latencies, 99),
+        }
+
+
+class EndpointPool:
+    # The node endpoints of one worker process and which of them to use for
+    # a call. Sends, nonce, gas and receipt queries (PRIMARY_METHODS) go to
+    # the first primary that is up. Other reads, including eth_getLogs scans,
+    # go to the first replica that is up and in sync, then to the primaries.
+    # Reads stick to one replica rather than rotating, so a block number and
+    # the logs fetched up to it come from the same node.
+    #
+    # A failed call takes its endpoint out for down_seconds. The health
+    # thread polls eth_blockNumber on every endpoint: it brings endpoints
+    # back, takes unreachable ones out, and marks replicas more than max_lag
+    # blocks behind the primary as lagging (skipped for reads; max_lag 0
+    # turns that off). If every candidate is out, all are tried anyway.
+    #
+    # Reads inside read_after(block) skip replicas that may not have the
+    # block yet, so a read that follows a write sees it (read-your-writes).
+    #
+    # Each endpoint has one keep-alive session with up to pool_size
+    # connections, shared by all threads.
+
+    def __init__(self, primaries, replicas=(), pool_size=32, timeout=10, health_interval=5, max_lag=5):
+        if not primaries:
+            raise ValueError("At least one primary RPC endpoint is required")
+        self.primaries = [Endpoint(url, "primary") for url in primaries]
+        self.replicas = [Endpoint(url, "replica") for url in replicas]
+        self.endpoints = self.primaries + self.replicas
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.down_seconds = health_interval
+        self.max_lag = max_lag
+        self.sessions = {endpoint.url: self._session() for endpoint in self.endpoints}
+        self.lock = threading.Lock()
+        self.failovers = 0
+        self.worker = None
+
+    def _session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def candidates(self, method):
+        now = time.monotonic()
+        if method in PRIMARY_METHODS:
+            order = self.primaries
+            available = [endpoint for endpoint in order if endpoint.up(now)]
+        else:
+            min_block = _min_block.get()
+            replicas = self.replicas
+            if min_block is not None:
+                replicas = [endpoint for endpoint in replicas if endpoint.block is not None and endpoint.block >= min_block]
+            order = replicas + self.primaries
+            available = [endpoint for endpoint in order if endpoint.up(now) and not endpoint.lagging]
+        return available or order
+
+    def failed_over(self):
+        with self.lock:
+            self.failovers += 1
+
+    def mark_down(self, endpoint, error):
+        was_up = endpoint.up(time.monotonic())
+        endpoint.down_until = time.monotonic() + self.down_seconds
+        if was_up:
+            logger.warning("RPC endpoint down", extra={"endpoint": endpoint.name, "role": endpoint.role, "error": str(error)})
+
+    def mark_up(self, endpoint):
+        if not endpoint.up(time.monotonic()):
+            logger.info("RPC endpoint back up", extra={"endpoint": endpoint.name, "role": endpoint.role})
+        endpoint.down_until = 0.0
+
+    def post(self, endpoint, request_data, headers, timeout=None):
+        response = self.sessions[endpoint.url].post(
+            endpoint.url, data=request_data, headers=headers, timeout=timeout or self.timeout
+        )
+        response.raise_for_status()
+        return response.content
+
+    def start(self):
+        if self.worker is None and len(self.endpoints) > 1:
+            self.worker = threading.Thread(target=self._run, name="rpc-health", daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning("RPC health check failed", extra={"error": str(e)})
+            time.sleep(self.health_interval)
+
+    def check(self):
+        request_data = b'{"jsonrpc":"2.0","method":"eth_blockNumber","params":[],"id":0}'
+        headers = {"Content-Type": "application/json"}
+        for endpoint in self.endpoints:
+            start = time.perf_counter()
+            try:
+                raw_response = self.post(endpoint, request_data, headers, timeout=min(self.timeout, self.health_interval))
+                endpoint.block = int(json.loads(raw_response)["result"], 16)
+            except Exception as e:
+                endpoint.observe(time.perf_counter() - start, False)
+                self.mark_down(endpoint, e)
+                continue
+            endpoint.observe(time.perf_counter() - start, True)
+            self.mark_up(endpoint)
+        head = self.head()
+        for endpoint in self.replicas:
+            lagging = bool(self.max_lag) and None not in (head, endpoint.block) and head - endpoint.block > self.max_lag
+            if lagging != endpoint.lagging:
+                logger.warning("RPC replica lagging" if lagging else "RPC replica caught up", extra={
+                    "endpoint": endpoint.name, "block": endpoint.block, "head": head,
+                })
+            endpoint.lagging = lagging
+
+    def head(self):
+        # Highest block a primary reported at the last health check
+        blocks = [endpoint.block for endpoint in self.primaries if endpoint.block is not None]
+        return max(blocks) if blocks else None
+
+    def stats(self):
+        head = self.head()
+        with self.lock:
+            failovers = self.failovers
+        return {"failovers": failovers, "endpoints": [endpoint.stats(head) for endpoint in self.endpoints]}
+
+
+def _not_delivered(error):
+    # The connection itself failed, so the node never saw the request
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    # web3 provider that sends each call to an endpoint of an EndpointPool
+    # and fails over to the next candidate on connection errors and HTTP
+    # errors. JSON-RPC error responses are answers and are returned as is.
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.headers = {"Content-Type": "application/json"}
+        super().__init__()
+
+    def __str__(self):
+        return f"RPC pool {', '.join(endpoint.name for endpoint in self.pool.endpoints)}"
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        candidates = self.pool.candidates(method)
+        for index, endpoint in enumerate(candidates):
+            start = time.perf_counter()
+            try:
+                raw_response = self.pool.post(endpoint, request_data, self.headers)
+            except requests.exceptions.RequestException as e:
+                endpoint.observe(time.perf_counter() - start, False)
+                self.pool.mark_down(endpoint, e)
+                if index == len(candidates) - 1 or (method in SEND_METHODS and not _not_delivered(e)):
+                    raise
+                self.pool.failed_over()
+                continue
+            endpoint.observe(time.perf_counter() - start, True)
+            return self.decode_rpc_response(raw_response)
+
+
+class AsyncPooledHTTPProvider(AsyncJSONBaseProvider):
+    # PooledHTTPProvider for AsyncWeb3. It shares the pool's endpoints, so
+    # its health state and latency stats, but does its own I/O through one
+    # aiohttp session per endpoint, opened on first use in the running loop.
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.headers = {"Content-Type": "application/json"}
+        self.sessions = {}
+        super().__init__()
+
+    def __str__(self):
+        return f"RPC pool {', '.join(endpoint.name for endpoint in self.pool.endpoints)}"
+
+    def _session(self, endpoint):
+        session = self.sessions.get(endpoint.url)
+        if session is None or session.closed:
+            session = self.sessions[endpoint.url] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.pool.timeout),
+            )
+        return session
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+    async def _post(self, endpoint, request_data):
+        async with self._session(endpoint).post(endpoint.url, data=request_data, headers=self.headers) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        candidates = self.pool.candidates(method)
+        for index, endpoint in enumerate(candidates):
+            start = time.perf_counter()
+            try:
+                raw_response = await self._post(endpoint, request_data)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                endpoint.observe(time.perf_counter() - start, False)
+                self.pool.mark_down(endpoint, e)
+                delivered = not isinstance(e, aiohttp.ClientConnectorError)
+                if index == len(candidates) - 1 or (method in SEND_METHODS and delivered):
+                    raise
+                self.pool.failed_over()
+                continue
+            endpoint.observe(time.perf_counter() - start, True)
+            return self.decode_rpc_response(raw_response)
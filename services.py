@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+
+import web3._utils.request as web3_request
+
+import metrics
+from admission import Admission, AdmissionStore, AsyncAdmission
+from GroqClient import AsyncGroqClient, GroqClient
+from async_blockchain_client import AsyncBlockchainClient
+from blockchain_client import BlockchainClient
+from chat_indexer import ChatIndexer
+from chat_store import ChatStore
+from config import Config
+from conversation_memory import ConversationMemory
+from leaderboard import Leaderboard
+from response_cache import ResponseCache
+from stats_cache import StatsInvalidator
+from tx_queue import TxQueue
+
+logger = logging.getLogger(__name__)
+
+
+class Services:
+    # The clients, caches, local stores and background threads of one worker
+    # process. Importing the apps builds none of it: get_services() builds it
+    # on first use in each process. Pre-forked workers (gunicorn --preload)
+    # therefore never share sockets, SQLite handles or dead threads with the
+    # master, and a worker still boots while the node is down.
+
+    def __init__(self, use_async=False):
+        # Answers to repeated questions on the same path are served without the LLM
+        self.response_cache = ResponseCache(
+            Config.RESPONSE_CACHE_SIZE,
+            Config.RESPONSE_CACHE_MAX_BYTES,
+            Config.RESPONSE_CACHE_TTL,
+            Config.RESPONSE_CACHE_PATH or None,
+        )
+        self.groq_client = (AsyncGroqClient if use_async else GroqClient)(cache=self.response_cache)
+        # Off-chain chat messages, anchored on-chain by Merkle root
+        self.chat_store = ChatStore(Config.CHAT_STORE_PATH) if Config.CHAT_STORAGE == "anchored" else None
+        self.blockchain = BlockchainClient(self.chat_store)
+        # The async app sends requests through the async client, while the
+        # sync one runs the background threads. Both share one stats cache
+        # and one set of node endpoints.
+        self.async_blockchain = None
+        if use_async:
+            self.async_blockchain = AsyncBlockchainClient(
+                self.blockchain.stats_cache, self.chat_store, self.blockchain.rpc_pool
+            )
+
+        # Local index of ChatMessage events, kept up to date in the background
+        self.leaderboard = Leaderboard()
+        self.chat_indexer = ChatIndexer(
+            self.blockchain.w3, self.blockchain.contract, Config.CHAT_INDEX_PATH,
+            chat_store=self.chat_store, leaderboard=self.leaderboard,
+        )
+        # Recent turns per student and path, given to the LLM for continuity
+        self.conversation_memory = ConversationMemory(
+            Config.CONVERSATION_MEMORY_MAX_BYTES, Config.CONVERSATION_MAX_TURNS, loader=self.chat_indexer.recent_turns
+        )
+        # Evicts cached student stats when the chain reports a change for them
+        self.stats_invalidator = StatsInvalidator(
+            self.blockchain.w3, self.blockchain.checksum_address, self.blockchain.stats_cache
+        )
+        # Durable queue for on-chain writes when running in write-behind mode
+        self.tx_queue = TxQueue(self.blockchain, Config.TX_QUEUE_PATH) if Config.WRITE_BEHIND else None
+
+        # Per-student rate limit, turn ordering and coalescing of duplicate turns
+        admission_store = AdmissionStore(Config.ADMISSION_STATE_PATH) if Config.ADMISSION_STATE_PATH else None
+        self.admission = (AsyncAdmission if use_async else Admission)(
+            Config.RATE_LIMIT_PER_MINUTE / 60, Config.RATE_LIMIT_BURST, Config.STUDENT_LANE_TIMEOUT,
+            store=admission_store,
+        )
+
+        metrics.register_caches(
+            stats_cache=self.blockchain.stats_cache,
+            response_cache=self.response_cache,
+            conversation_memory=self.conversation_memory,
+            admission=self.admission,
+        )
+
+    def start(self):
+        self.blockchain.rpc_pool.start()
+        self.chat_indexer.start()
+        self.stats_invalidator.start()
+        if self.tx_queue is not None:
+            self.tx_queue.start()
+
+    def warm_up(self):
+        # Run from the server's worker hooks, so the first request doesn't pay
+        # for connection setup. A node that is down is logged, not fatal.
+        try:
+            self.blockchain.warm_up()
+        except Exception as e:
+            logger.warning("Blockchain warm-up failed", extra={"error": str(e)})
+
+    async def warm_up_async(self):
+        try:
+            await self.async_blockchain.warm_up()
+        except Exception as e:
+            logger.warning("Blockchain warm-up failed", extra={"error": str(e)})
+
+
+_lock = threading.Lock()
+_services = None
+
+
+def get_services(use_async=False):
+    # This process's Services, built and started on the first call. A process
+    # serves one app, so use_async only matters on that call.
+    global _services
+    if _services is None:
+        with _lock:
+            if _services is None:
+                services = Services(use_async)
+                services.start()
+                _services = services
+    return _services
+
+
+def _reset_after_fork():
+    # What the parent built stays with the parent: its threads did not
+    # survive the fork, and its sockets and SQLite handles must not be
+    # shared. The child builds its own on first use. web3 caches HTTP
+    # sessions by thread id, which threads in the child can reuse, so that
+    # cache is dropped too.
+    global _lock, _services
+    _lock = threading.Lock()
+    _services = None
+    web3_request._session_cache_lock = threading.Lock()
+    web3_request._session_cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
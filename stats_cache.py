@@ -0,0 +1,153 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+# Events that change what getStudentStats returns; the student is the first
+# indexed argument of each, i.e. topics[1].
+STATS_EVENTS = (
+    "ProgressUpdated(address,uint256,uint256)",
+    "SessionPaid(address,uint256)",
+    "BadgeEarned(address,uint256)",
+    "ChallengeCompleted(address,uint256)",
+)
+
+
+class StatsCache:
+    # Bounded LRU cache of decoded getStudentStats results per student.
+    #
+    # A load races with invalidation: a write can land between our eth_call
+    # and the put() of its result. Callers take a token from begin_load()
+    # before the call. put() drops the result if anything was invalidated in
+    # the meantime, so stale stats are never cached.
+    #
+    # It also remembers, for the last max_entries students written to, the
+    # block their next read must see (read_block, for rpc_pool.read_after):
+    # the block the write was mined in, or math.inf (the primary) while that
+    # is not known yet.
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.written = OrderedDict()  # address -> block
+        self.lock = threading.Lock()
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, address):
+        key = address.lower()
+        with self.lock:
+            stats = self.entries.get(key)
+            if stats is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return stats
+
+    def begin_load(self):
+        with self.lock:
+            return self.epoch
+
+    def put(self, address, stats, token=None):
+        key = address.lower()
+        with self.lock:
+            if token is not None and token != self.epoch:
+                return
+            self.entries[key] = stats
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, address, block=None):
+        # block: where the change was mined, if known. Without it (a write
+        # about to be sent, or not yet confirmed) reads go to the primary.
+        key = address.lower()
+        with self.lock:
+            self.epoch += 1
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+            previous = self.written.pop(key, None)
+            if block is None:
+                block = math.inf
+            elif previous is not None and previous != math.inf:
+                block = max(block, previous)
+            self.written[key] = block
+            while len(self.written) > self.max_entries:
+                self.written.popitem(last=False)
+
+    def read_block(self, *addresses):
+        # Lowest block a read of these students' stats must see, or None
+        with self.lock:
+            blocks = [self.written.get(address.lower()) for address in addresses]
+        blocks = [block for block in blocks if block is not None]
+        return max(blocks) if blocks else None
+
+    def counters(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class StatsInvalidator:
+    # Watches the contract for stats-changing events, including ones caused by
+    # other senders (e.g. a student paying from their own wallet). It evicts
+    # the affected students from the cache.
+
+    def __init__(self, w3, contract_address, cache, poll_interval=2.0):
+        self.w3 = w3
+        self.contract_address = contract_address
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.topics = [Web3.to_hex(Web3.keccak(text=signature)) for signature in STATS_EVENTS]
+        self.last_block = None
+        self.worker = None
+
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, name="stats-invalidator", daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Stats invalidator poll failed", extra={"error": str(e)})
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        head = self.w3.eth.block_number
+        if self.last_block is None:
+            # The cache starts empty, so there is no history to catch up on
+            self.last_block = head
+            return
+        if head <= self.last_block:
+            return
+        logs = self.w3.eth.get_logs({
+            "address": self.contract_address,
+            "fromBlock": self.last_block + 1,
+            "toBlock": head,
+            "topics": [self.topics],
+        })
+        for log in logs:
+            student = "0x" + bytes(log["topics"][1])[-20:].hex()
+            self.cache.invalidate(student, log["blockNumber"])
+        self.last_block = head
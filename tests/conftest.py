@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend modules live at the repository root and import each other by
+# plain module name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,155 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from admission import Admission, AdmissionStore, AsyncAdmission, RateLimiter, StudentLanes, flight_key
+
+STUDENT = "0xAbC"
+
+
+def turn_data(prompt="What is a graph?", student=STUDENT):
+    return {"student_address": student, "prompt": prompt, "path": "1"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AdmissionStore(str(tmp_path / "admission.db"))
+
+
+def test_flight_key_normalizes_student_and_prompt():
+    assert flight_key(turn_data("What is a graph?")) == flight_key(turn_data("  what is a GRAPH? ", "0xabc"))
+    assert flight_key(turn_data("What is a tree?")) != flight_key(turn_data())
+    assert flight_key({"prompt": "hi"}) is None
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_rate_limiter_allows_bursts_then_refills(store, shared):
+    limiter = RateLimiter(rate=10, burst=2, store=store if shared else None)
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    retry_after = limiter.acquire("a")
+    assert 0 < retry_after <= 0.1
+    # Buckets are per student
+    assert limiter.acquire("b") == 0
+    time.sleep(retry_after + 0.02)
+    assert limiter.acquire("a") == 0
+    assert (limiter.admitted, limiter.limited) == (4, 1)
+
+
+def test_rate_limit_is_shared_through_the_store(tmp_path):
+    path = str(tmp_path / "admission.db")
+    first = RateLimiter(rate=0.01, burst=1, store=AdmissionStore(path))
+    second = RateLimiter(rate=0.01, burst=1, store=AdmissionStore(path))
+    assert first.acquire("a") == 0
+    assert second.acquire("a") > 0
+
+
+def test_rate_limit_off():
+    limiter = RateLimiter(rate=0, burst=1)
+    assert all(limiter.acquire("a") == 0 for _ in range(10))
+
+
+def test_lane_runs_one_turn_at_a_time():
+    lanes = StudentLanes()
+    lane = lanes.acquire("a", timeout=1)
+    assert lanes.acquire("a", timeout=0.05) is None
+    # Other students are not held up
+    other = lanes.acquire("b", timeout=0.05)
+    assert other is not None
+    lanes.release(other)
+    lanes.release(lane)
+    assert lanes.acquire("a", timeout=0.05) is not None
+    assert lanes.counters()["timeouts"] == 1
+
+
+def hold_lane(path, address, held, done):
+    store = AdmissionStore(path)
+    assert store.try_lock(address)
+    held.set()
+    done.wait(10)
+    store.unlock(address)
+
+
+def test_lane_is_held_across_processes(tmp_path):
+    path = str(tmp_path / "admission.db")
+    lanes = StudentLanes(store=AdmissionStore(path))
+    context = multiprocessing.get_context("fork")
+    held, done = context.Event(), context.Event()
+    holder = context.Process(target=hold_lane, args=(path, "a", held, done))
+    holder.start()
+    try:
+        assert held.wait(10)
+        assert lanes.acquire("a", timeout=0.2) is None
+        assert lanes.acquire("b", timeout=0.2) is not None
+        done.set()
+        holder.join(10)
+        assert lanes.acquire("a", timeout=1) is not None
+    finally:
+        done.set()
+        holder.join(10)
+
+
+def test_lessons_count_is_shared_through_the_store(tmp_path):
+    path = str(tmp_path / "admission.db")
+    first = Admission(rate=0, burst=1, lane_timeout=1, store=AdmissionStore(path))
+    second = Admission(rate=0, burst=1, lane_timeout=1, store=AdmissionStore(path))
+    ticket = first.enter(turn_data())
+    ticket.finish(({"progress": 4}, 200))
+    ticket = second.enter(turn_data("What is a tree?"))
+    # The chain still says 3 lessons; the other process recorded the fourth
+    assert ticket.current_stats([3, 10, 0]) == [4, 10, 0]
+    assert ticket.current_stats([5, 10, 0]) == [5, 10, 0]
+    ticket.finish(({"error": "Failed"}, 500))
+
+
+def test_duplicate_turns_share_one_answer():
+    admission = Admission(rate=0, burst=1, lane_timeout=1)
+    leader = admission.enter(turn_data())
+    assert leader.result is None
+    answers = []
+    follower = threading.Thread(target=lambda: answers.append(admission.enter(turn_data(" what is a graph? ")).result))
+    follower.start()
+    while admission.counters()["coalesced"] == 0:
+        time.sleep(0.01)
+    leader.finish(({"response": "A set of vertices and edges", "progress": 1}, 200))
+    follower.join(5)
+    assert answers == [({"response": "A set of vertices and edges", "progress": 1}, 200)]
+    # Once finished, the same question is a new turn
+    ticket = admission.enter(turn_data())
+    assert ticket.result is None
+    ticket.finish(({"progress": 2}, 200))
+
+
+def test_admission_rate_limits_and_times_out_lanes():
+    admission = Admission(rate=0.01, burst=2, lane_timeout=0.05)
+    first = admission.enter(turn_data("What is a graph?"))
+    second = admission.enter(turn_data("What is a tree?"))
+    # The lane is busy with the first turn
+    assert second.result[1] == 429
+    first.finish(({"progress": 1}, 200))
+    third = admission.enter(turn_data("What is a heap?"))
+    body, status = third.result
+    assert status == 429 and body["retry_after"] > 0
+
+
+def test_async_admission_orders_turns(store):
+    async def run():
+        admission = AsyncAdmission(rate=0, burst=1, lane_timeout=1, store=store)
+        first = await admission.enter(turn_data("What is a graph?"))
+        waiting = asyncio.ensure_future(admission.enter(turn_data("What is a tree?")))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        first.finish(({"progress": 1}, 200))
+        second = await asyncio.wait_for(waiting, 5)
+        assert second.current_stats([0, 0]) == [1, 0]
+        second.finish(({"progress": 2}, 200))
+        # The shared release finishes off the event loop
+        third = await admission.enter(turn_data("What is a heap?"))
+        assert third.current_stats([0, 0]) == [2, 0]
+        third.finish(({"progress": 3}, 200))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
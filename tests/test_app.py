@@ -0,0 +1,200 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app
+import async_app
+from admission import Admission, AsyncAdmission
+from GroqClient import ERROR_PREFIX, LLMStreamError
+
+
+@pytest.mark.parametrize("route", ["/tutor", "/tutor/stream"])
+@pytest.mark.parametrize("body", ["[]", "\"prompt\"", "not json"])
+def test_tutor_rejects_bodies_that_are_not_objects(route, body):
+    response = app.app.test_client().post(route, data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Request body must be a JSON object"}
+
+
+@pytest.mark.parametrize("route", ["/tutor", "/tutor/stream"])
+@pytest.mark.parametrize("body", ["[]", "\"prompt\"", "not json"])
+def test_async_tutor_rejects_bodies_that_are_not_objects(route, body):
+    async def post():
+        response = await async_app.app.test_client().post(
+            route, data=body, headers={"Content-Type": "application/json"}
+        )
+        return response.status_code, await response.get_json()
+
+    assert asyncio.run(post()) == (400, {"error": "Request body must be a JSON object"})
+
+
+STATS = [2, 10, 0, 0, [], 1, 0]
+TURN = {"student_address": "0x1234", "prompt": "What is a graph?", "path": "1"}
+
+
+class FakeBlockchain:
+    def __init__(self):
+        self.recorded = []
+
+    def get_stats(self, student_address):
+        return STATS
+
+    def record_turn(self, *record):
+        self.recorded.append(record)
+
+
+class FakeAsyncBlockchain(FakeBlockchain):
+    async def get_stats(self, student_address):
+        return STATS
+
+    async def record_turn(self, *record):
+        self.recorded.append(record)
+
+
+class FakeMemory:
+    def __init__(self):
+        self.turns = []
+
+    def context(self, student_address, path, budget):
+        return []
+
+    def add(self, *turn):
+        self.turns.append(turn)
+
+
+class FakeGroq:
+    def __init__(self, fail):
+        self.fail = fail
+
+    def get_tutoring_response(self, prompt, context, cache_key=None, history=None):
+        if self.fail:
+            return f"{ERROR_PREFIX}connection reset"
+        return "A graph is vertices and edges."
+
+    def stream_tutoring_response(self, prompt, context, cache_key=None, history=None):
+        yield "A graph is "
+        if self.fail:
+            raise LLMStreamError("Error generating response: connection reset")
+        yield "vertices and edges."
+
+
+class FakeAsyncGroq(FakeGroq):
+    async def get_tutoring_response(self, prompt, context, cache_key=None, history=None):
+        return FakeGroq.get_tutoring_response(self, prompt, context, cache_key, history)
+
+    async def stream_tutoring_response(self, prompt, context, cache_key=None, history=None):
+        for chunk in FakeGroq.stream_tutoring_response(self, prompt, context, cache_key, history):
+            yield chunk
+
+
+def fake_services(use_async, fail):
+    blockchain = FakeBlockchain()
+    return SimpleNamespace(
+        admission=(AsyncAdmission if use_async else Admission)(rate=0, burst=1, lane_timeout=1),
+        blockchain=blockchain,
+        async_blockchain=FakeAsyncBlockchain(),
+        conversation_memory=FakeMemory(),
+        groq_client=(FakeAsyncGroq if use_async else FakeGroq)(fail),
+        chat_store=None,
+        tx_queue=None,
+    )
+
+
+def events(body):
+    return [block.split("\n")[0].removeprefix("event: ") for block in body.strip().split("\n\n")]
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_stream_records_only_complete_replies(monkeypatch, fail):
+    services = fake_services(False, fail)
+    monkeypatch.setattr(app, "get_services", lambda: services)
+    response = app.app.test_client().post("/tutor/stream", json=TURN)
+    body = response.get_data(as_text=True)
+    if fail:
+        assert events(body) == ["chunk", "error"]
+        assert "connection reset" in body
+        assert services.blockchain.recorded == []
+        assert services.conversation_memory.turns == []
+    else:
+        assert events(body) == ["chunk", "chunk", "done"]
+        assert services.blockchain.recorded[0][6] == "A graph is vertices and edges."
+        assert len(services.conversation_memory.turns) == 1
+    # The student's lane is free again
+    assert services.admission.lanes.counters()["busy"] == 0
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_async_stream_records_only_complete_replies(monkeypatch, fail):
+    services = fake_services(True, fail)
+    monkeypatch.setattr(async_app, "current_services", lambda: services)
+
+    async def post():
+        response = await async_app.app.test_client().post("/tutor/stream", json=TURN)
+        return await response.get_data(as_text=True)
+
+    body = asyncio.run(post())
+    recorded = services.async_blockchain.recorded
+    if fail:
+        assert events(body) == ["chunk", "error"]
+        assert recorded == []
+        assert services.conversation_memory.turns == []
+    else:
+        assert events(body) == ["chunk", "chunk", "done"]
+        assert recorded[0][6] == "A graph is vertices and edges."
+        assert len(services.conversation_memory.turns) == 1
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_tutor_records_only_answers(monkeypatch, fail):
+    services = fake_services(False, fail)
+    monkeypatch.setattr(app, "get_services", lambda: services)
+    response = app.app.test_client().post("/tutor", json=TURN)
+    if fail:
+        # Same as a failed stream: no record, no lesson, not remembered
+        assert response.status_code == 502
+        assert "connection reset" in response.get_json()["error"]
+        assert services.blockchain.recorded == []
+        assert services.conversation_memory.turns == []
+    else:
+        assert response.status_code == 200
+        assert response.get_json()["progress"] == STATS[0] + 1
+        assert len(services.blockchain.recorded) == 1
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_async_tutor_records_only_answers(monkeypatch, fail):
+    services = fake_services(True, fail)
+    monkeypatch.setattr(async_app, "current_services", lambda: services)
+
+    async def post():
+        response = await async_app.app.test_client().post("/tutor", json=TURN)
+        return response.status_code, await response.get_json()
+
+    status, body = asyncio.run(post())
+    recorded = services.async_blockchain.recorded
+    if fail:
+        assert status == 502
+        assert "connection reset" in body["error"]
+        assert recorded == []
+        assert services.conversation_memory.turns == []
+    else:
+        assert status == 200
+        assert len(recorded) == 1
+
+
+def test_memory_off_asks_without_history(monkeypatch):
+    services = fake_services(False, False)
+    services.conversation_memory.context = lambda *args: pytest.fail("history loaded")
+    seen = []
+
+    def stream(prompt, context, cache_key=None, history=None):
+        seen.append(history)
+        yield "An answer"
+
+    services.groq_client.stream_tutoring_response = stream
+    monkeypatch.setattr(app, "get_services", lambda: services)
+    monkeypatch.setattr(app.Config, "CONVERSATION_MEMORY", False)
+    response = app.app.test_client().post("/tutor/stream", json=TURN)
+    assert events(response.get_data(as_text=True)) == ["chunk", "done"]
+    assert seen == [[]]
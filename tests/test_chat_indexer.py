@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from web3 import Web3
+
+from chat_indexer import ChatIndexer
+from chat_store import ChatStore, chat_leaf, merkle_root
+
+STUDENT = "0x" + "ab" * 20
+
+
+def make_indexer(poll_interval):
+    # Only the state poll_if_stale reads; no node or database
+    indexer = ChatIndexer.__new__(ChatIndexer)
+    indexer.poll_interval = poll_interval
+    indexer.poll_lock = threading.Lock()
+    indexer.lock_path = None
+    indexer.leaderboard = None
+    indexer.polls = 0
+
+    def _poll():
+        indexer.last_poll = time.time()
+        indexer.polls += 1
+
+    indexer._poll = _poll
+    return indexer
+
+
+def test_handlers_skip_polls_within_the_poll_interval():
+    indexer = make_indexer(poll_interval=2.0)
+    indexer.last_poll = time.time() - 1.5
+    indexer.poll_if_stale()
+    assert indexer.polls == 0
+
+    indexer.last_poll = time.time() - 2.5
+    indexer.poll_if_stale()
+    assert indexer.polls == 1
+    indexer.poll_if_stale()
+    assert indexer.polls == 1
+
+
+def test_max_age_overrides_the_poll_interval():
+    indexer = make_indexer(poll_interval=2.0)
+    indexer.last_poll = time.time() - 1.5
+    indexer.poll_if_stale(max_age=1.0)
+    assert indexer.polls == 1
+
+
+def test_running_poll_is_not_repeated():
+    indexer = make_indexer(poll_interval=2.0)
+    indexer.last_poll = 0.0
+    with indexer.poll_lock:
+        indexer.poll_if_stale()
+    assert indexer.polls == 0
+
+
+class FakeEvent:
+    def __init__(self, chain, name):
+        self.chain = chain
+        self.name = name
+
+    def get_logs(self, fromBlock, toBlock):
+        logs = []
+        for number in range(fromBlock, toBlock + 1):
+            block = self.chain.blocks[number]
+            for index, args in enumerate(block["events"].get(self.name, [])):
+                logs.append({
+                    "args": args,
+                    "blockNumber": number,
+                    "blockHash": block["hash"],
+                    "transactionHash": block["hash"][:31] + bytes([index]),
+                    "logIndex": index,
+                })
+        return logs
+
+
+class FakeChain:
+    # A node and contract serving ChatMessage and ChatRootAnchored logs from
+    # blocks that can be replaced, as in a reorg
+    def __init__(self):
+        self.blocks = []
+        self.eth = SimpleNamespace(get_block=lambda number: {"hash": self.blocks[number]["hash"]})
+        self.abi = []
+        self.events = SimpleNamespace(
+            ChatMessage=FakeEvent(self, "ChatMessage"), ChatRootAnchored=FakeEvent(self, "ChatRootAnchored")
+        )
+
+    def mine(self, fork=0, **events):
+        number = len(self.blocks)
+        self.blocks.append({"hash": bytes([fork]) * 28 + number.to_bytes(4, "big"), "events": events})
+        self.eth.block_number = number
+
+    def reorg(self, number, fork):
+        # Replace the blocks from number on with empty ones of another fork
+        for block_number in range(number, len(self.blocks)):
+            self.blocks[block_number] = {"hash": bytes([fork]) * 28 + block_number.to_bytes(4, "big"), "events": {}}
+
+
+def message(timestamp, prompt, student=STUDENT, path=1):
+    return {"student": student, "path": path, "timestamp": timestamp, "prompt": prompt, "response": "answer"}
+
+
+@pytest.fixture
+def chain():
+    chain = FakeChain()
+    chain.mine()
+    return chain
+
+
+@pytest.fixture
+def make_db_indexer(tmp_path, chain):
+    def make(**kwargs):
+        return ChatIndexer(chain, chain, str(tmp_path / "chat_index.db"), **kwargs)
+    return make
+
+
+def prompts(indexer, **kwargs):
+    messages, _, _ = indexer.history(STUDENT, 1, **kwargs)
+    return [message["prompt"] for message in messages]
+
+
+def test_reorg_rewinds_to_the_last_matching_block(chain, make_db_indexer):
+    indexer = make_db_indexer()
+    chain.mine(ChatMessage=[message(100, "kept")])
+    chain.mine()
+    chain.mine(ChatMessage=[message(200, "orphaned")])
+    chain.mine()
+    indexer.poll()
+    assert prompts(indexer) == ["kept", "orphaned"]
+
+    chain.reorg(3, fork=1)
+    chain.blocks[3]["events"] = {"ChatMessage": [message(300, "canonical")]}
+    chain.mine(fork=1)
+    assert indexer._rewind_reorged(chain.eth.block_number) == 1
+    assert prompts(indexer) == ["kept"]
+    indexer.poll()
+    assert prompts(indexer) == ["kept", "canonical"]
+    assert indexer.checkpoint()[0] == 5
+    assert indexer.db.execute("SELECT value FROM index_state WHERE key = 'rewinds'").fetchone() == (1,)
+
+
+def test_reorg_deeper_than_the_window_reindexes(chain, make_db_indexer):
+    indexer = make_db_indexer()
+    chain.mine(ChatMessage=[message(100, "first")])
+    chain.mine(ChatMessage=[message(200, "second")])
+    indexer.poll()
+    chain.reorg(0, fork=1)
+    chain.blocks[2]["events"] = {"ChatMessage": [message(200, "second")]}
+    assert indexer._rewind_reorged(chain.eth.block_number) == -1
+    indexer.poll()
+    assert prompts(indexer) == ["second"]
+
+
+def test_truncate_after_keeps_lower_blocks(chain, make_db_indexer):
+    indexer = make_db_indexer()
+    for timestamp in (100, 200, 300):
+        chain.mine(ChatMessage=[message(timestamp, str(timestamp))])
+    indexer.poll()
+    indexer._truncate_after(2)
+    assert prompts(indexer) == ["100", "200"]
+    assert indexer.checkpoint()[0] == 2
+
+
+def test_pages_follow_timestamp_then_id(chain, make_db_indexer):
+    indexer = make_db_indexer(chunk_size=2)
+    # Several messages share a timestamp, and later blocks hold older ones
+    chain.mine(ChatMessage=[message(200, "c"), message(100, "a")])
+    chain.mine(ChatMessage=[message(200, "d"), message(100, "b")])
+    chain.mine(ChatMessage=[message(300, "e"), message(150, "other path", path=2)])
+    indexer.poll()
+    pages, cursor, has_more = [], None, True
+    while has_more:
+        messages, cursor, has_more = indexer.history(STUDENT, 1, limit=2, cursor=cursor)
+        pages.append([message["prompt"] for message in messages])
+    assert pages == [["a", "b"], ["c", "d"], ["e"]]
+    # The last cursor returns only messages indexed later
+    assert indexer.history(STUDENT, 1, cursor=cursor) == ([], cursor, False)
+    chain.mine(ChatMessage=[message(400, "f")])
+    indexer.poll()
+    assert [message["prompt"] for message in indexer.history(STUDENT, 1, cursor=cursor)[0]] == ["f"]
+
+
+def test_since_returns_newer_messages_only(chain, make_db_indexer):
+    indexer = make_db_indexer()
+    chain.mine(ChatMessage=[message(100, "old"), message(200, "at since"), message(300, "new")])
+    chain.mine(ChatMessage=[message(400, "other student", student="0x" + "cd" * 20)])
+    indexer.poll()
+    assert prompts(indexer, since=200) == ["new"]
+    assert prompts(indexer, since=400) == []
+
+
+def test_roots_missing_from_the_store_are_kept_unresolved(tmp_path, chain, make_db_indexer, caplog):
+    store = ChatStore(str(tmp_path / "chat_store.db"))
+    indexer = make_db_indexer(chat_store=store)
+    digest = store.put("What is a heap?", "A tree-shaped priority queue.")
+    turns = [[STUDENT, 1, 1, 1, 0, digest, 100]]
+    # The root a server with this store would seal, before this one has it
+    root = merkle_root([chat_leaf(STUDENT, 1, 100, digest)])
+    chain.mine(ChatRootAnchored=[{"root": Web3.to_bytes(hexstr=root), "count": 1}])
+    with caplog.at_level(logging.WARNING):
+        indexer.poll()
+    assert "Chat root not in the local store, marked unresolved" in caplog.text
+    assert [row[0] for row in indexer.unresolved_roots()] == [root]
+    assert prompts(indexer) == []
+
+    assert store.seal(turns) == root
+    indexer.poll()
+    assert indexer.unresolved_roots() == []
+    assert prompts(indexer) == ["What is a heap?"]
+
+
+def test_reorg_drops_unresolved_roots(tmp_path, chain, make_db_indexer):
+    indexer = make_db_indexer(chat_store=ChatStore(str(tmp_path / "chat_store.db")))
+    chain.mine(ChatRootAnchored=[{"root": b"\x01" * 32, "count": 1}])
+    indexer.poll()
+    assert len(indexer.unresolved_roots()) == 1
+    chain.reorg(1, fork=1)
+    indexer.poll()
+    assert indexer.unresolved_roots() == []
@@ -0,0 +1,59 @@
+import pytest
+from web3 import Web3
+
+from chat_store import ChatStore, chat_digest, chat_leaf, merkle_proof, merkle_root, verify_proof
+
+STUDENTS = ["0x" + f"{i:040x}" for i in range(1, 8)]
+
+
+def leaves(count):
+    return [chat_leaf(STUDENTS[i % len(STUDENTS)], 1, 1700000000 + i, chat_digest(f"q{i}", f"a{i}"))
+            for i in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 5, 7, 8, 13])
+def test_every_leaf_proves_against_the_root(count):
+    batch = leaves(count)
+    root = merkle_root(batch)
+    for index, leaf in enumerate(batch):
+        assert verify_proof(leaf, merkle_proof(batch, index), root)
+
+
+def test_proofs_fail_for_other_leaves_and_roots():
+    batch = leaves(5)
+    root = merkle_root(batch)
+    proof = merkle_proof(batch, 2)
+    assert not verify_proof(batch[3], proof, root)
+    assert not verify_proof(batch[2], proof, merkle_root(leaves(6)))
+    assert not verify_proof(chat_leaf(STUDENTS[0], 2, 1700000002, chat_digest("q2", "a2")), proof, root)
+
+
+def test_single_leaf_is_its_own_root():
+    batch = leaves(1)
+    assert merkle_root(batch) == batch[0]
+    assert merkle_proof(batch, 0) == []
+
+
+def test_leaf_matches_solidity_encode_packed():
+    digest = chat_digest("What is a graph?", "Vertices and edges.")
+    packed = (Web3.to_bytes(hexstr=STUDENTS[0]) + (1).to_bytes(32, "big") + (1700000000).to_bytes(32, "big")
+              + Web3.to_bytes(hexstr=digest))
+    assert chat_leaf(STUDENTS[0], 1, 1700000000, digest) == Web3.to_hex(Web3.keccak(packed))
+
+
+def test_store_round_trip_and_seal(tmp_path):
+    store = ChatStore(str(tmp_path / "chats.db"))
+    digest = store.put("What is a graph?", "Vertices and edges.")
+    assert digest == chat_digest("What is a graph?", "Vertices and edges.")
+    assert store.put("What is a graph?", "Vertices and edges.") == digest
+    assert store.get(digest) == ("What is a graph?", "Vertices and edges.")
+    assert store.get(chat_digest("unknown", "")) is None
+
+    turns = [(STUDENTS[i], i + 1, 5, 1, 0, store.put(f"q{i}", f"a{i}"), 1700000000 + i) for i in range(3)]
+    root = store.seal(turns)
+    # Sealing again (a retried write) gives the same root and no new rows
+    assert store.seal(turns) == root
+    batch = store.batch(root)
+    assert [entry["student"] for entry in batch] == [student.lower() for student in STUDENTS[:3]]
+    for position, entry in enumerate(batch):
+        assert verify_proof(chat_leaf(**entry), store.proof(root, position), root)
@@ -0,0 +1,86 @@
+import os
+import re
+
+from turns import anchored_turn, turn_record
+
+# The contract can't be compiled without solc, so these check its source
+# against what the Python side sends: argument counts, order and types.
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "blockchain", "contracts",
+                      "TutorContract.sol")
+
+TURN = {"student_address": "0x" + "ab" * 20, "lessons": 2, "prompt": "What is a graph?", "path": 1}
+
+
+def source():
+    with open(SOURCE) as f:
+        return f.read()
+
+
+def params(text):
+    # [(type, name)] of a parameter or field list, without data locations
+    result = []
+    for param in re.split(r"[,;]", text):
+        words = [word for word in param.split() if word not in ("memory", "calldata", "storage", "indexed")]
+        if words:
+            result.append((words[0], words[-1]))
+    return result
+
+
+def declaration(kind, name):
+    pattern = {
+        "struct": r"struct\s+{}\s*\{{([^}}]*)\}}",
+        "function": r"function\s+{}\s*\(([^)]*)\)",
+        "returns": r"function\s+{}\s*\([^)]*\)[^(]*returns\s*\(([^)]*)\)",
+        "event": r"event\s+{}\s*\(([^)]*)\)",
+    }[kind]
+    match = re.search(pattern.format(name), re.sub(r"//[^\n]*", "", source()))
+    assert match, f"{kind} {name} not in TutorContract.sol"
+    return params(match.group(1))
+
+
+def solidity_type(value):
+    if isinstance(value, str):
+        return "address" if value.startswith("0x") and len(value) == 42 else "string"
+    assert isinstance(value, int) and value >= 0
+    return "uint"
+
+
+def test_record_turn_takes_a_turn_record():
+    record = turn_record(TURN, "A set of vertices and edges.")
+    assert [kind for kind, name in declaration("function", "recordTurn")] == [solidity_type(value) for value in record]
+
+
+def test_turn_struct_matches_record_turn():
+    assert declaration("struct", "Turn") == declaration("function", "recordTurn")
+    assert declaration("function", "recordTurns") == [("Turn[]", "turns")]
+
+
+def test_anchored_turns_take_the_record_without_the_message():
+    record = turn_record(TURN, "A set of vertices and edges.")
+    # anchored_turns_call passes the first five fields of each anchored turn
+    fields = anchored_turn(record, "0x" + "00" * 32)[:5]
+    assert [kind for kind, name in declaration("struct", "AnchoredTurn")] == [solidity_type(value) for value in fields]
+    assert declaration("struct", "AnchoredTurn") == declaration("struct", "Turn")[:5]
+    assert declaration("function", "recordTurnsAnchored") == [("AnchoredTurn[]", "turns"), ("bytes32", "chatRoot")]
+
+
+def test_chat_root_event_and_verify_chat():
+    # chat_indexer reads root and count; /chat-history proofs are bytes32 lists
+    assert declaration("event", "ChatRootAnchored") == [("bytes32", "root"), ("uint", "count")]
+    assert declaration("function", "verifyChat") == [("bytes32", "leaf"), ("bytes32[]", "proof"), ("bytes32", "root")]
+
+
+def test_students_stats_returns_what_get_student_stats_does():
+    # get_stats_many hands each StudentStats to code written for getStudentStats
+    fields = [kind for kind, name in declaration("struct", "StudentStats")]
+    assert fields == [kind for kind, name in declaration("returns", "getStudentStats")]
+    assert declaration("returns", "getStudentsStats") == [("StudentStats[]", "stats")]
+    assert declaration("function", "getStudentsStats") == [("address[]", "students")]
+
+
+def test_leaderboard_events_carry_what_the_indexer_reads():
+    assert declaration("event", "PathProgress") == [
+        ("address", "student"), ("uint", "path"), ("uint", "lessons"), ("uint", "score"),
+    ]
+    assert declaration("event", "BadgeEarned") == [("address", "student"), ("uint", "badgeId")]
@@ -0,0 +1,63 @@
+from conversation_memory import MAX_RESPONSE_CHARS, ConversationMemory
+
+ALICE = "0x" + "aa" * 20
+BOB = "0x" + "bb" * 20
+
+
+def test_keeps_the_last_turns_per_path():
+    memory = ConversationMemory(max_turns=2)
+    for i in range(3):
+        memory.add(ALICE, 1, f"q{i}", f"a{i}", 100 + i)
+    memory.add(ALICE, 2, "other path", "answer", 200)
+    assert [turn["prompt"] for turn in memory.turns("0x" + "AA" * 20, 1)] == ["q1", "q2"]
+    assert memory.counters()["turns"] == 3
+
+
+def test_replies_are_clipped():
+    memory = ConversationMemory()
+    memory.add(ALICE, 1, "q", "x" * (MAX_RESPONSE_CHARS + 10), 100)
+    assert len(memory.turns(ALICE, 1)[0]["response"]) == MAX_RESPONSE_CHARS
+
+
+def test_least_recently_used_conversations_are_evicted():
+    memory = ConversationMemory(max_bytes=700)
+    memory.add(ALICE, 1, "q", "a" * 200, 100)
+    memory.add(BOB, 1, "q", "b" * 200, 100)
+    memory.add(ALICE, 1, "q2", "a" * 200, 101)
+    assert memory.turns(BOB, 1) == []
+    assert len(memory.turns(ALICE, 1)) == 2
+    assert memory.counters()["evictions"] == 1
+
+
+def test_context_keeps_recent_turns_and_summarizes_older_ones():
+    memory = ConversationMemory()
+    for i in range(6):
+        memory.add(ALICE, 1, f"question {i}", "word " * 100, 100 + i)
+    # Each turn costs about 128 tokens in full and 70 as a summary line
+    messages = memory.context(ALICE, 1, max_tokens=480)
+    assert messages[0]["role"] == "system"
+    assert "question 2" in messages[0]["content"]
+    # The oldest turns no longer fit at all
+    assert "question 1" not in messages[0]["content"]
+    assert [message["content"] for message in messages[1:] if message["role"] == "user"] == [
+        "question 3", "question 4", "question 5",
+    ]
+    assert messages[-1]["role"] == "assistant"
+
+
+def test_context_loads_once_and_merges_with_new_turns():
+    calls = []
+
+    def loader(student, path, limit):
+        calls.append((student, path, limit))
+        return [(100, "q0", "a0"), (101, "q1", "a1")]
+
+    memory = ConversationMemory(max_turns=5, loader=loader)
+    memory.add(ALICE, 1, "q1", "a1", 101)
+    memory.add(ALICE, 1, "q2", "a2", 102)
+    messages = memory.context(ALICE, 1, max_tokens=1000)
+    assert [message["content"] for message in messages if message["role"] == "user"] == ["q0", "q1", "q2"]
+    memory.context(ALICE, 1, max_tokens=1000)
+    assert calls == [(ALICE, 1, 5)]
+    counters = memory.counters()
+    assert (counters["hits"], counters["misses"]) == (1, 1)
@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from GroqClient import ERROR_PREFIX, AsyncGroqClient, GroqClient, LLMStreamError
+from response_cache import ResponseCache
+
+HISTORY = [{"role": "user", "content": "What is a graph?"}, {"role": "assistant", "content": "Vertices and edges."}]
+
+
+def completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+def stream_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+class FakeCompletions:
+    def __init__(self, text="An answer"):
+        self.text = text
+        self.requests = []
+        self.error = None
+
+    def create(self, **request):
+        self.requests.append(request)
+        if self.error:
+            raise self.error
+        if request["stream"]:
+            return iter([stream_chunk(self.text[:3]), stream_chunk(self.text[3:])])
+        return completion(self.text)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    client = GroqClient(cache=ResponseCache())
+    client.completions = FakeCompletions()
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=client.completions))
+    return client
+
+
+def test_answers_without_history_are_cached(client):
+    assert client.get_tutoring_response("What is a tree?", "ctx", "key") == "An answer"
+    assert client.get_tutoring_response("What is a tree?", "ctx", "key") == "An answer"
+    assert len(client.completions.requests) == 1
+
+
+def test_questions_with_history_are_cached_per_history(client):
+    client.cache.put("key", "A shared answer")
+    assert client.get_tutoring_response("And a tree?", "ctx", "key", HISTORY) == "An answer"
+    assert client.completions.requests[0]["messages"][1:3] == HISTORY
+    # The same question after the same turns is answered from the cache
+    assert client.get_tutoring_response("And a tree?", "ctx", "key", list(HISTORY)) == "An answer"
+    assert list(client.stream_tutoring_response("And a tree?", "ctx", "key", HISTORY)) == ["An answer"]
+    assert len(client.completions.requests) == 1
+    # but not after other turns, nor without any
+    assert list(client.stream_tutoring_response("And a tree?", "ctx", "key", HISTORY[:1])) == ["An ", "answer"]
+    assert client.get_tutoring_response("And a tree?", "ctx", "key") == "A shared answer"
+    assert len(client.completions.requests) == 2
+
+
+def test_failed_answers_are_not_cached(client):
+    client.completions.error = RuntimeError("rate limited")
+    assert client.get_tutoring_response("What is a tree?", "ctx", "key") == f"{ERROR_PREFIX}rate limited"
+    assert client.cache.get("key") is None
+
+
+def test_streamed_answers_are_cached_whole(client):
+    assert list(client.stream_tutoring_response("What is a tree?", "ctx", "key")) == ["An ", "answer"]
+    assert list(client.stream_tutoring_response("What is a tree?", "ctx", "key")) == ["An answer"]
+    assert len(client.completions.requests) == 1
+
+
+def test_async_client_caches_per_history(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    client = AsyncGroqClient(cache=ResponseCache())
+    calls = []
+
+    async def create(**request):
+        calls.append(request)
+        return completion("An answer")
+
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    client.cache.put("key", "A shared answer")
+
+    async def ask():
+        return (
+            await client.get_tutoring_response("And a tree?", "ctx", "key", HISTORY),
+            await client.get_tutoring_response("And a tree?", "ctx", "key", HISTORY),
+            await client.get_tutoring_response("And a tree?", "ctx", "key"),
+        )
+
+    assert asyncio.run(ask()) == ("An answer", "An answer", "A shared answer")
+    assert len(calls) == 1
+
+
+def test_failed_streams_raise_and_are_not_cached(client):
+    client.completions.error = RuntimeError("connection reset")
+    with pytest.raises(LLMStreamError, match="connection reset"):
+        list(client.stream_tutoring_response("What is a tree?", "ctx", "key"))
+    assert client.cache.get("key") is None
@@ -0,0 +1,49 @@
+from leaderboard import ALL_PATHS, Leaderboard
+
+ALICE = "0x" + "aa" * 20
+BOB = "0x" + "bb" * 20
+CAROL = "0x" + "cc" * 20
+
+
+def students(entries):
+    return [entry["student"] for entry in entries]
+
+
+def test_scores_add_up_per_path_and_across_paths():
+    board = Leaderboard()
+    board.apply([(ALICE, 1, 1, 5), (BOB, 1, 1, 8), (ALICE, 2, 2, 6)], [])
+    assert students(board.top(1)) == [BOB, ALICE]
+    assert students(board.top(ALL_PATHS)) == [ALICE, BOB]
+    assert board.top(ALL_PATHS)[0] == {"rank": 1, "student": ALICE, "score": 11, "lessons": 2, "badges": 0}
+    assert board.size(1) == 2 and board.size(2) == 1
+
+
+def test_ties_break_on_lessons_then_badges():
+    board = Leaderboard()
+    board.apply([(ALICE, 1, 3, 5), (BOB, 1, 4, 5), (CAROL, 1, 4, 5)], [(CAROL, 1)])
+    assert students(board.top(1)) == [CAROL, BOB, ALICE]
+
+
+def test_lessons_rerank_every_path_of_the_student():
+    board = Leaderboard()
+    board.apply([(ALICE, 1, 1, 5), (BOB, 1, 2, 5), (ALICE, 2, 1, 1)], [])
+    assert students(board.top(1)) == [BOB, ALICE]
+    # ALICE's lessons count goes up from a turn on path 2
+    board.apply([("0x" + "AA" * 20, 2, 3, 0)], [])
+    assert students(board.top(1)) == [ALICE, BOB]
+    assert board.size(1) == 2
+
+
+def test_badges_before_any_score_count_once_ranked():
+    board = Leaderboard()
+    board.apply([], [(ALICE, 1)])
+    assert board.size(ALL_PATHS) == 0
+    board.apply([(ALICE, 1, 1, 5), (BOB, 1, 1, 5)], [])
+    assert board.top(1, limit=1)[0]["student"] == ALICE
+
+
+def test_reset():
+    board = Leaderboard()
+    board.apply([(ALICE, 1, 1, 5)], [(ALICE, 1)])
+    board.reset()
+    assert board.top(1) == [] and board.top(ALL_PATHS) == []
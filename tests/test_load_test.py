@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import local_chain  # noqa: E402
+
+
+def contract_available():
+    try:
+        local_chain.load_contract_interface()
+    except (RuntimeError, ImportError):
+        return False
+    return True
+
+
+def test_contract_artifact_from_the_environment(tmp_path, monkeypatch):
+    artifact = tmp_path / "TutorContract.json"
+    artifact.write_text(json.dumps({"abi": [{"type": "constructor", "inputs": []}], "bytecode": "0x00"}))
+    monkeypatch.setenv("CONTRACT_ARTIFACT", str(artifact))
+    assert local_chain.load_contract_interface() == ([{"type": "constructor", "inputs": []}], "0x00")
+
+
+@pytest.mark.skipif(not contract_available(), reason=local_chain.NO_COMPILER)
+@pytest.mark.parametrize("app", ["flask", "async"])
+def test_load_test_runs_end_to_end(app):
+    # A few turns through the real app, chain and (fake) Groq API
+    result = subprocess.run(
+        [sys.executable, "benchmarks/load_test.py", "--app", app, "--students", "2", "--turns", "2",
+         "--llm-latency", "0", "--llm-token-delay", "0", "--llm-tokens", "10", "--check"],
+        cwd=ROOT, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "/tutor" in result.stdout
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code, env):
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def test_stage_records_time_and_errors():
+    import metrics
+
+    before = metrics.STAGE_ERRORS.labels("test_stage")._value.get()
+    with pytest.raises(ValueError):
+        with metrics.stage("test_stage"):
+            raise ValueError
+    assert metrics.STAGE_ERRORS.labels("test_stage")._value.get() == before + 1
+    assert b'tutor_stage_seconds_count{stage="test_stage"}' in metrics.render()[0]
+
+
+def test_metrics_add_up_across_worker_processes(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    for _ in range(2):
+        run("import metrics; metrics.LLM_ERRORS.inc(); metrics.observe_request('/tutor', 200, 0.1)", env)
+    body = run("import metrics; print(metrics.render()[0].decode())", env)
+    assert "tutor_llm_errors_total 2.0" in body
+    assert 'tutor_http_requests_total{endpoint="/tutor",status="200"} 2.0' in body
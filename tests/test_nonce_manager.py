@@ -0,0 +1,162 @@
+import asyncio
+import threading
+
+import pytest
+
+from nonce_manager import AsyncNonceManager, FileNonceCounter, LocalNonceCounter, NonceManager, is_nonce_error
+
+OWNER = "0x" + "ab" * 20
+
+
+class FakeEth:
+    def __init__(self, pending):
+        self.pending = pending
+        self.calls = 0
+        self.down = False
+
+    def get_transaction_count(self, address, block_identifier):
+        assert block_identifier == "pending"
+        if self.down:
+            raise ConnectionError("node unreachable")
+        self.calls += 1
+        return self.pending
+
+
+class FakeAsyncEth(FakeEth):
+    async def get_transaction_count(self, address, block_identifier):
+        return super().get_transaction_count(address, block_identifier)
+
+
+class FakeWeb3:
+    def __init__(self, pending):
+        self.eth = FakeEth(pending)
+
+
+class FakeAsyncWeb3:
+    def __init__(self, pending):
+        self.eth = FakeAsyncEth(pending)
+
+
+@pytest.fixture(params=["local", "file"])
+def counter(request, tmp_path):
+    if request.param == "local":
+        return LocalNonceCounter()
+    return FileNonceCounter(str(tmp_path / "nonce.json"), OWNER)
+
+
+def test_reserve_seeds_once_then_counts_locally(counter):
+    w3 = FakeWeb3(pending=7)
+    nonces = NonceManager(w3, OWNER, counter)
+    assert [nonces.reserve() for _ in range(3)] == [7, 8, 9]
+    assert w3.eth.calls == 1
+
+
+def test_release_of_the_last_nonce_hands_it_out_again(counter):
+    w3 = FakeWeb3(pending=3)
+    nonces = NonceManager(w3, OWNER, counter)
+    nonce = nonces.reserve()
+    nonces.release(nonce)
+    assert nonces.reserve() == nonce
+    assert w3.eth.calls == 1
+
+
+def test_release_behind_later_nonces_asks_the_node(counter):
+    w3 = FakeWeb3(pending=3)
+    nonces = NonceManager(w3, OWNER, counter)
+    first = nonces.reserve()
+    nonces.reserve()
+    w3.eth.pending = 4
+    nonces.release(first)
+    # Re-seeded right away, not on the next reservation
+    assert w3.eth.calls == 2
+    assert nonces.reserve() == 4
+    assert w3.eth.calls == 2
+
+
+def test_release_with_the_node_down_asks_it_later(counter):
+    w3 = FakeWeb3(pending=3)
+    nonces = NonceManager(w3, OWNER, counter)
+    first = nonces.reserve()
+    nonces.reserve()
+    w3.eth.down = True
+    nonces.release(first)
+    w3.eth.down = False
+    w3.eth.pending = 4
+    assert nonces.reserve() == 4
+    assert w3.eth.calls == 2
+
+
+def test_async_manager_releases_and_resyncs(counter):
+    w3 = FakeAsyncWeb3(pending=3)
+    nonces = AsyncNonceManager(w3, OWNER, counter)
+
+    async def scenario():
+        first = await nonces.reserve()
+        second = await nonces.reserve()
+        await nonces.release(second)
+        assert await nonces.reserve() == second
+        w3.eth.pending = 5
+        await nonces.release(first)
+        return await nonces.reserve()
+
+    assert asyncio.run(scenario()) == 5
+    assert w3.eth.calls == 2
+
+
+def test_resync_and_forget(counter):
+    w3 = FakeWeb3(pending=0)
+    nonces = NonceManager(w3, OWNER, counter)
+    nonces.reserve()
+    w3.eth.pending = 10
+    nonces.resync()
+    assert nonces.reserve() == 10
+    nonces.forget()
+    w3.eth.pending = 20
+    assert nonces.reserve() == 20
+    assert w3.eth.calls == 3
+
+
+def test_file_counter_is_shared_and_scoped_to_its_address(tmp_path):
+    path = str(tmp_path / "nonce.json")
+    first = NonceManager(FakeWeb3(pending=5), OWNER, FileNonceCounter(path, OWNER))
+    second_w3 = FakeWeb3(pending=5)
+    second = NonceManager(second_w3, OWNER, FileNonceCounter(path, OWNER))
+    assert first.reserve() == 5
+    assert second.reserve() == 6
+    assert second_w3.eth.calls == 0
+
+    other_w3 = FakeWeb3(pending=0)
+    other = NonceManager(other_w3, "0x" + "cd" * 20, FileNonceCounter(path, "0x" + "cd" * 20))
+    assert other.reserve() == 0
+    assert other_w3.eth.calls == 1
+
+
+def test_concurrent_reservations_are_unique(tmp_path):
+    path = str(tmp_path / "nonce.json")
+    managers = [NonceManager(FakeWeb3(pending=0), OWNER, FileNonceCounter(path, OWNER)) for _ in range(4)]
+    reserved = []
+    lock = threading.Lock()
+
+    def reserve(nonces):
+        for _ in range(25):
+            nonce = nonces.reserve()
+            with lock:
+                reserved.append(nonce)
+
+    threads = [threading.Thread(target=reserve, args=(nonces,)) for nonces in managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(reserved) == list(range(100))
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("nonce too low", True),
+    ("Nonce too high", True),
+    ("Invalid transaction nonce: Expected 3, but got 2", True),
+    ("{'message': 'already known'}", True),
+    ("execution reverted", False),
+])
+def test_is_nonce_error(message, expected):
+    assert is_nonce_error(ValueError(message)) is expected
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from prompt_classifier import (
+    PATH_KEYWORDS, PromptClassifier, _plural_forms, classifier, matching_paths, tokenize, validate_prompt_for_path,
+)
+
+
+@pytest.mark.parametrize("prompt, path", [
+    ("graph’s edges", 1),
+    ("explain Bellman–Ford", 1),
+    ("explain bellman-ford", 1),
+    ("ohm’s law explained", 4),
+    ("kirchhoff's law for circuits", 4),
+    ("how do c++ templates work", 2),
+    ("what is a b+ tree", 1),
+])
+def test_typographic_punctuation_separates_tokens(prompt, path):
+    assert path in matching_paths(prompt)
+    assert validate_prompt_for_path(prompt, path) == (True, "")
+
+
+def test_keywords_match_on_word_boundaries_only():
+    # "go" and "algo..." used to fire inside longer words
+    assert 2 not in matching_paths("what is a good algorithm")
+    assert 1 in matching_paths("what is a good algorithm")
+
+
+def test_plurals_match():
+    assert 1 in matching_paths("how many graphs are there")
+    assert 2 in matching_paths("sql queries")
+
+
+def test_random_path_rejects_study_topics():
+    ok, error = validate_prompt_for_path("help me with my calculus homework", 5)
+    assert not ok and error
+    assert validate_prompt_for_path("which movies should I watch", 5) == (True, "")
+
+
+def test_tokenize_keeps_plus_and_hash_suffixes():
+    assert tokenize("C# and F# vs C++!") == ["c#", "and", "f#", "vs", "c++"]
+    assert tokenize("don’t–stop") == ["don", "t", "stop"]
+
+
+def _token_reference(prompt, keywords):
+    # The matching rule spelled out on tokens: some plural form of the
+    # keyword appears as a run of whole tokens
+    tokens = tokenize(prompt)
+    runs = {tuple(tokens[i:j]) for i in range(len(tokens)) for j in range(i + 1, min(i + 5, len(tokens)) + 1)}
+    for keyword in keywords:
+        keyword_tokens = tokenize(keyword)
+        for form in _plural_forms(keyword_tokens[-1]):
+            if (*keyword_tokens[:-1], form) in runs:
+                return True
+    return False
+
+
+def test_patterns_agree_with_token_matching():
+    rng = random.Random(7)
+    words = sorted({word for keywords in PATH_KEYWORDS.values() for keyword in keywords for word in tokenize(keyword)})
+    words += ["algo", "asset", "Graph", "ÉTÉ", "x"]
+    separators = [" ", "-", "–", "’", "_", "+", "#", "\n", "(", "", "é", "1"]
+    for _ in range(1000):
+        parts = []
+        for _ in range(rng.randint(1, 6)):
+            word = rng.choice(words)
+            if rng.random() < 0.2:
+                word += rng.choice(["s", "es", "ies", "+", "#", "ing"])
+            parts.append(word.upper() if rng.random() < 0.2 else word)
+            parts.append(rng.choice(separators))
+        prompt = "".join(parts)
+        for path, keywords in PATH_KEYWORDS.items():
+            assert classifier.matches(prompt, path) == _token_reference(prompt, keywords), (prompt, path)
+
+
+def test_symbol_tokens_end_at_letters():
+    custom = PromptClassifier({1: ["c#"], 2: ["b+ tree"], 3: ["net"]})
+    assert custom.classify("c#net") == {1, 3}
+    assert custom.classify("b+tree") == {2}
+    assert custom.classify("c##, b++ tree") == frozenset()
@@ -0,0 +1,73 @@
+import time
+
+from response_cache import ResponseCache, history_key, make_key, normalize_prompt
+
+
+def test_keys_ignore_case_punctuation_and_nearby_lessons():
+    assert normalize_prompt("Explain  Binary-Search?") == "explain binary search"
+    assert make_key(1, 10, "Explain Binary-Search?") == make_key(1, 14, "explain binary search")
+    assert make_key(1, 10, "explain binary search") != make_key(1, 15, "explain binary search")
+    assert make_key(1, 10, "explain binary search") != make_key(2, 10, "explain binary search")
+
+
+def test_history_key_depends_on_the_whole_window():
+    key = make_key(1, 10, "and a tree?")
+    history = [{"role": "user", "content": "What is a graph?"}, {"role": "assistant", "content": "Vertices and edges."}]
+    assert history_key(key, []) == history_key(key, None) == key
+    assert history_key(key, history) == history_key(key, [dict(message) for message in history])
+    assert history_key(key, history) != history_key(key, history[:1])
+    assert history_key(key, history) != key
+
+
+def test_lru_evicts_by_count():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_lru_evicts_by_size():
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+    cache.put("c", "z" * 11)
+    assert cache.get("c") is None
+    assert cache.counters()["bytes"] == 6
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = ResponseCache(ttl=60)
+    cache.put("a", "A")
+    now[0] += 59
+    assert cache.get("a") == "A"
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.counters()["entries"] == 0
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "responses.db")
+    ResponseCache(disk_path=path).put("a", "A")
+    cache = ResponseCache(disk_path=path)
+    assert cache.get("a") == "A"
+    assert cache.get("a") == "A"
+    counters = cache.counters()
+    assert (counters["disk_hits"], counters["hits"], counters["misses"]) == (1, 1, 0)
+
+
+def test_purge_drops_expired_disk_rows(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = ResponseCache(ttl=60, disk_path=str(tmp_path / "responses.db"))
+    cache.put("a", "A")
+    now[0] += 61
+    cache.purge_expired()
+    assert cache.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import math
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from rpc_pool import AsyncPooledHTTPProvider, EndpointPool, PooledHTTPProvider, read_after
+from stats_cache import StatsCache
+
+
+class FakeNode:
+    # JSON-RPC server answering eth_blockNumber with `block` and anything
+    # else with its own name, recording the methods it was asked
+    def __init__(self, name, block=10, status=200):
+        self.name = name
+        self.block = block
+        self.status = status
+        self.methods = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                node.methods.append(request["method"])
+                result = hex(node.block) if request["method"] == "eth_blockNumber" else node.name
+                body = json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": result}).encode()
+                self.send_response(node.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def closed_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+@pytest.fixture
+def nodes():
+    started = []
+
+    def start(*args, **kwargs):
+        node = FakeNode(*args, **kwargs)
+        started.append(node)
+        return node
+
+    yield start
+    for node in started:
+        node.close()
+
+
+def test_reads_go_to_replicas_and_sends_to_the_primary(nodes):
+    primary, replica = nodes("primary"), nodes("replica")
+    provider = PooledHTTPProvider(EndpointPool([primary.url], [replica.url], timeout=2))
+    assert provider.make_request("eth_call", [])["result"] == "replica"
+    assert provider.make_request("eth_getTransactionCount", [])["result"] == "primary"
+    assert provider.make_request("eth_sendRawTransaction", [])["result"] == "primary"
+
+
+def test_reads_after_a_write_wait_for_the_replica_to_have_its_block(nodes):
+    primary, replica = nodes("primary", block=12), nodes("replica", block=10)
+    pool = EndpointPool([primary.url], [replica.url], timeout=2)
+    pool.check()
+    provider = PooledHTTPProvider(pool)
+    with read_after(11):
+        assert provider.make_request("eth_call", [])["result"] == "primary"
+    with read_after(math.inf):
+        assert provider.make_request("eth_call", [])["result"] == "primary"
+    with read_after(10):
+        assert provider.make_request("eth_call", [])["result"] == "replica"
+    replica.block = 12
+    pool.check()
+    with read_after(11):
+        assert provider.make_request("eth_call", [])["result"] == "replica"
+    assert provider.make_request("eth_call", [])["result"] == "replica"
+
+
+def test_unreachable_replica_fails_over_to_the_primary(nodes):
+    primary = nodes("primary")
+    pool = EndpointPool([primary.url], [closed_url()], timeout=2)
+    provider = PooledHTTPProvider(pool)
+    assert provider.make_request("eth_call", [])["result"] == "primary"
+    stats = pool.stats()
+    assert stats["failovers"] == 1
+    assert [endpoint["up"] for endpoint in stats["endpoints"]] == [True, False]
+    # The replica is skipped until a health check finds it working again
+    assert provider.make_request("eth_call", [])["result"] == "primary"
+    assert pool.stats()["failovers"] == 1
+
+
+def test_sends_fail_over_only_if_never_delivered(nodes):
+    standby = nodes("standby")
+    provider = PooledHTTPProvider(EndpointPool([closed_url(), standby.url], timeout=2))
+    assert provider.make_request("eth_sendRawTransaction", [])["result"] == "standby"
+
+    failing, standby = nodes("failing", status=500), nodes("standby")
+    provider = PooledHTTPProvider(EndpointPool([failing.url, standby.url], timeout=2))
+    with pytest.raises(requests.exceptions.HTTPError):
+        provider.make_request("eth_sendRawTransaction", [])
+    assert standby.methods == []
+
+
+def test_failovers_are_counted_across_threads(nodes):
+    primary = nodes("primary")
+    pool = EndpointPool([primary.url], [closed_url()], timeout=2)
+    pool.down_seconds = 0  # keep trying the replica
+    provider = PooledHTTPProvider(pool)
+    threads = [threading.Thread(target=lambda: [provider.make_request("eth_call", []) for _ in range(10)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.stats()["failovers"] == 80
+
+
+def test_health_check_marks_lagging_replicas(nodes):
+    primary, replica = nodes("primary", block=20), nodes("replica", block=10)
+    pool = EndpointPool([primary.url], [replica.url], max_lag=5)
+    pool.check()
+    assert pool.stats()["endpoints"][1]["lagging"]
+    assert PooledHTTPProvider(pool).make_request("eth_call", [])["result"] == "primary"
+
+
+def test_async_provider_follows_the_same_routing(nodes):
+    primary = nodes("primary", block=12)
+    pool = EndpointPool([primary.url], [closed_url()], timeout=2)
+    provider = AsyncPooledHTTPProvider(pool)
+
+    async def calls():
+        try:
+            first = await provider.make_request("eth_call", [])
+            with read_after(math.inf):
+                second = await provider.make_request("eth_call", [])
+            return first["result"], second["result"]
+        finally:
+            await provider.close()
+
+    assert asyncio.run(calls()) == ("primary", "primary")
+    assert pool.stats()["failovers"] == 1
+
+
+def test_stats_cache_read_block():
+    cache = StatsCache()
+    assert cache.read_block("0xA") is None
+    # Sent but not mined: only the primary is safe
+    cache.invalidate("0xA")
+    assert cache.read_block("0xa") == math.inf
+    cache.invalidate("0xA", 7)
+    cache.invalidate("0xB", 9)
+    assert cache.read_block("0xA") == 7
+    assert cache.read_block("0xA", "0xB", "0xC") == 9
+    # An older event never lowers the block a read must see
+    cache.invalidate("0xB", 8)
+    assert cache.read_block("0xB") == 9
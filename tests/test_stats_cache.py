@@ -0,0 +1,83 @@
+import math
+
+from stats_cache import StatsCache, StatsInvalidator
+
+ALICE = "0x" + "aa" * 20
+BOB = "0x" + "bb" * 20
+
+
+def test_lru_is_bounded_and_case_insensitive():
+    cache = StatsCache(max_entries=2)
+    cache.put("0x" + "AA" * 20, (1,))
+    cache.put(BOB, (2,))
+    assert cache.get(ALICE) == (1,)
+    cache.put("0x" + "cc" * 20, (3,))
+    assert cache.get(BOB) is None
+    counters = cache.counters()
+    assert (counters["size"], counters["evictions"], counters["hits"], counters["misses"]) == (2, 1, 1, 1)
+
+
+def test_load_racing_an_invalidation_is_dropped():
+    cache = StatsCache()
+    token = cache.begin_load()
+    cache.invalidate(ALICE)
+    cache.put(ALICE, (1,), token)
+    assert cache.get(ALICE) is None
+    cache.put(ALICE, (2,), cache.begin_load())
+    assert cache.get(ALICE) == (2,)
+
+
+def test_read_block_follows_writes():
+    cache = StatsCache()
+    assert cache.read_block(ALICE) is None
+    cache.invalidate(ALICE)
+    assert cache.read_block(ALICE) == math.inf
+    cache.invalidate(ALICE, 12)
+    assert cache.read_block(ALICE) == 12
+    # An older event does not lower the block a read must see
+    cache.invalidate(ALICE, 10)
+    assert cache.read_block(ALICE) == 12
+    cache.invalidate(BOB, 15)
+    assert cache.read_block(ALICE, BOB) == 15
+
+
+def test_written_blocks_are_bounded():
+    cache = StatsCache(max_entries=1)
+    cache.invalidate(ALICE, 1)
+    cache.invalidate(BOB, 2)
+    assert cache.read_block(ALICE) is None
+    assert cache.read_block(BOB) == 2
+
+
+class FakeEth:
+    def __init__(self):
+        self.block_number = 5
+        self.logs = []
+        self.queries = []
+
+    def get_logs(self, query):
+        self.queries.append(query)
+        return self.logs
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+def test_invalidator_evicts_students_from_new_events():
+    w3 = FakeWeb3()
+    cache = StatsCache()
+    invalidator = StatsInvalidator(w3, "0x" + "11" * 20, cache)
+    invalidator.poll()
+    assert w3.eth.queries == []
+
+    cache.put(ALICE, (1,))
+    cache.put(BOB, (2,))
+    w3.eth.block_number = 7
+    w3.eth.logs = [{"topics": [b"\x00" * 32, b"\x00" * 12 + bytes.fromhex("aa" * 20)], "blockNumber": 6}]
+    invalidator.poll()
+    assert w3.eth.queries[0]["fromBlock"] == 6 and w3.eth.queries[0]["toBlock"] == 7
+    assert cache.get(ALICE) is None
+    assert cache.get(BOB) == (2,)
+    assert cache.read_block(ALICE) == 6
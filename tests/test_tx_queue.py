@@ -0,0 +1,236 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from blockchain_client import BlockchainClient
+from turns import turn_writes
+from tx_queue import FAILED, MINED, PENDING, TxQueue
+
+
+class StubNonces:
+    def __init__(self, chain):
+        self.chain = chain
+        self.next_nonce = 0
+        self.forgotten = 0
+
+    def resync(self):
+        if self.chain.down:
+            raise ConnectionError("node unreachable")
+
+    def forget(self):
+        self.forgotten += 1
+
+
+class StubEth:
+    def __init__(self, chain):
+        self.chain = chain
+
+    def send_raw_transaction(self, raw_tx):
+        if self.chain.down:
+            raise ConnectionError("node unreachable")
+        self.chain.sent.append(raw_tx)
+
+    def wait_for_transaction_receipt(self, tx_hash, timeout):
+        if self.chain.down:
+            raise ConnectionError("node unreachable")
+        if self.chain.stuck and tx_hash not in self.chain.cancelled.values():
+            raise TimeExhausted(tx_hash)
+        return {"status": 1, "blockNumber": 1}
+
+    def get_transaction_receipt(self, tx_hash):
+        if self.chain.down:
+            raise ConnectionError("node unreachable")
+        if self.chain.stuck:
+            raise TransactionNotFound(tx_hash)
+        return {"status": 1, "blockNumber": 2}
+
+
+class StubChain:
+    # Just enough of BlockchainClient for the queue, with a node that can go down
+    def __init__(self, down=False):
+        self.down = down
+        # Transactions are never mined (only cancels are)
+        self.stuck = False
+        self.cancelled = {}
+        self.sent = []
+        self.calls = []
+        self.nonces = StubNonces(self)
+        self.w3 = SimpleNamespace(eth=StubEth(self))
+        self.invalidated = []
+        self.stats_cache = SimpleNamespace(invalidate=lambda student, block=None: self.invalidated.append((student, block)))
+
+    def contract_call(self, method, args):
+        return method, args
+
+    def sign_owner_transaction(self, contract_call):
+        if self.down:
+            raise ConnectionError("node unreachable")
+        self.calls.append(contract_call)
+        nonce = self.nonces.next_nonce
+        self.nonces.next_nonce += 1
+        return nonce, SimpleNamespace(raw_transaction=bytes([nonce + 1]), hash=bytes([nonce + 1]) * 32)
+
+    def cancel_owner_transaction(self, nonce):
+        self.cancelled[nonce] = f"cancel-{nonce}"
+        return self.cancelled[nonce]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(chain, **kwargs):
+        return TxQueue(chain, str(tmp_path / "tx_queue.db"), poll_interval=0.001, **kwargs)
+    return make
+
+
+def turn(student):
+    return [student, 1, 1, 1, 0, "prompt", "response", 0]
+
+
+def test_jobs_are_mined_in_order(make_queue):
+    chain = StubChain()
+    queue = make_queue(chain)
+    first = queue.enqueue([["recordTurn", turn("0xa")]])
+    second = queue.enqueue([["recordTurn", turn("0xb")]])
+    queue.start()
+    wait_for(lambda: queue.status(second)["status"] == MINED)
+    assert queue.status(first)["status"] == MINED
+    assert [call[1][0] for call in chain.calls] == ["0xa", "0xb"]
+    assert set(chain.invalidated) == {("0xa", 1), ("0xb", 1)}
+
+
+def test_mergeable_jobs_share_one_transaction(make_queue):
+    chain = StubChain()
+    queue = make_queue(chain)
+    jobs = [queue.enqueue([["recordTurns", [[turn(student)]]]]) for student in ("0xa", "0xb", "0xc")]
+    queue.start()
+    wait_for(lambda: all(queue.status(job)["status"] == MINED for job in jobs))
+    assert chain.calls == [("recordTurns", [[turn("0xa"), turn("0xb"), turn("0xc")]])]
+
+
+def test_worker_survives_node_outage(make_queue):
+    chain = StubChain(down=True)
+    queue = make_queue(chain, max_attempts=2)
+    job = queue.enqueue([["recordTurn", turn("0xa")]])
+    queue.start()
+    wait_for(lambda: queue.status(job)["error"] is not None)
+    time.sleep(0.1)
+    assert queue.worker.is_alive()
+    status = queue.status(job)
+    # Unreachable node: the job keeps waiting instead of using up its attempts
+    assert status["status"] == PENDING
+    assert status["attempts"] == 0
+    assert chain.nonces.forgotten
+    chain.down = False
+    wait_for(lambda: queue.status(job)["status"] == MINED, timeout=10)
+
+
+def test_recovery_waits_for_the_node(make_queue):
+    chain = StubChain()
+    queue = make_queue(chain)
+    job = queue.enqueue([["recordTurn", turn("0xa")]])
+    # A job signed and persisted by a process that died before its receipt
+    queue._sign(queue._next_batch())
+    restarted = make_queue(chain)
+    chain.down = True
+    restarted.start()
+    time.sleep(0.1)
+    assert restarted.worker.is_alive()
+    assert chain.sent == []
+    chain.down = False
+    wait_for(lambda: restarted.status(job)["status"] == MINED, timeout=10)
+    # Re-broadcast the saved transaction, never signed a second one
+    assert len(chain.calls) == 1
+    assert chain.sent
+
+
+def test_failed_attempts_end_in_failed(make_queue):
+    chain = StubChain()
+    chain.contract_call = lambda method, args: (_ for _ in ()).throw(ValueError("bad arguments"))
+    queue = make_queue(chain, max_attempts=2)
+    job = queue.enqueue([["recordTurn", turn("0xa")]])
+    queue.start()
+    wait_for(lambda: queue.status(job)["status"] == FAILED)
+    assert queue.status(job)["attempts"] == 2
+    assert queue.worker.is_alive()
+
+
+def test_queued_turns_are_merged(make_queue):
+    chain = StubChain()
+    queue = make_queue(chain)
+    jobs = [queue.enqueue(turn_writes(turn(student))) for student in ("0xa", "0xb")]
+    jobs.append(queue.enqueue(turn_writes(turn("0xc"), anchored=["0xc", 1, 1, 1, 0, "0x" + "00" * 32, 0])))
+    queue.start()
+    wait_for(lambda: all(queue.status(job)["status"] == MINED for job in jobs))
+    # Plain and anchored turns don't share a transaction
+    assert [method for method, args in chain.calls] == ["recordTurns", "recordTurnsAnchored"]
+    assert chain.calls[0][1] == [[turn("0xa"), turn("0xb")]]
+
+
+def test_contract_call_passes_queued_turns_as_tuples():
+    calls = []
+    client = SimpleNamespace(contract=SimpleNamespace(functions=SimpleNamespace(recordTurns=calls.append)))
+    BlockchainClient.contract_call(client, "recordTurns", [[turn("0xa"), turn("0xb")]])
+    assert calls == [[tuple(turn("0xa")), tuple(turn("0xb"))]]
+
+
+def test_stuck_job_is_cancelled_before_it_fails(make_queue):
+    chain = StubChain()
+    chain.stuck = True
+    queue = make_queue(chain, max_attempts=2)
+    job = queue.enqueue([["recordTurn", turn("0xa")]])
+    queue.start()
+    wait_for(lambda: queue.status(job)["status"] == FAILED)
+    assert queue.status(job)["attempts"] == 2
+    # Its nonce is taken by a 0-value replacement, so it can't be mined later
+    assert list(chain.cancelled) == [0]
+    assert "cancelled at nonces [0]" in queue.status(job)["error"]
+
+
+def test_job_mined_after_its_last_timeout_is_not_cancelled(make_queue):
+    chain = StubChain()
+    queue = make_queue(chain, max_attempts=1)
+    job = queue.enqueue([["recordTurn", turn("0xa")]])
+    batch = queue._next_batch()
+    queue._sign(batch)
+    queue._fail_attempt(batch, TimeExhausted("timed out"))
+    assert queue.status(job)["status"] == MINED
+    assert chain.cancelled == {}
+    assert chain.invalidated == [("0xa", 2)]
+
+
+def test_batches_are_limited_by_size(make_queue):
+    chain = StubChain()
+    queue = make_queue(chain, max_batch_bytes=100)
+    jobs = [queue.enqueue([["recordTurns", [[turn(student)]]]]) for student in ("0xa", "0xb", "0xc")]
+    queue.start()
+    wait_for(lambda: all(queue.status(job)["status"] == MINED for job in jobs))
+    # Each turn is about 45 bytes, so two fit in a batch
+    assert [len(args[0]) for method, args in chain.calls] == [2, 1]
+
+
+def test_batch_is_split_when_it_cannot_be_signed(make_queue):
+    chain = StubChain()
+    sign = chain.sign_owner_transaction
+
+    def sign_small(contract_call):
+        if len(contract_call[1][0]) > 1:
+            raise ValueError("gas required exceeds allowance")
+        return sign(contract_call)
+
+    chain.sign_owner_transaction = sign_small
+    queue = make_queue(chain, max_attempts=1)
+    jobs = [queue.enqueue([["recordTurns", [[turn(student)]]]]) for student in ("0xa", "0xb", "0xc")]
+    queue.start()
+    wait_for(lambda: all(queue.status(job)["status"] == MINED for job in jobs))
+    assert [args[0][0][0] for method, args in chain.calls] == ["0xa", "0xb", "0xc"]
+    assert all(queue.status(job)["attempts"] == 0 for job in jobs)
@@ -0,0 +1,178 @@
+import datetime
+import logging
+
+from web3 import Web3
+
+from config import Config
+from GroqClient import ERROR_PREFIX
+from prompt_classifier import PATH_CONTEXT, validate_prompt_for_path
+from response_cache import make_key
+
+logger = logging.getLogger(__name__)
+
+# Most addresses one POST /stats/batch may ask for
+MAX_STATS_BATCH = 500
+
+# The blocking-free parts of a tutoring turn, shared by the Flask app and the
+# asyncio app: request parsing and validation, the LLM context, the on-chain
+# record and the JSON body sent back to the client.
+
+
+def request_error(data):
+    # (error_body, status) for a /tutor body that isn't a JSON object, else None
+    if not isinstance(data, dict):
+        return {"error": "Request body must be a JSON object"}, 400
+    return None
+
+
+def parse_turn_request(data):
+    # Returns (fields, None) or (None, (error_body, status))
+    student_address = data.get("student_address")
+    prompt = data.get("prompt")
+    eth_amount_raw = data.get("eth_amount", "0")
+    eth_amount = int(eth_amount_raw) if eth_amount_raw else 0
+    path = int(data.get("path", "0"))  # Default to "0" as string, then convert
+    if path not in [1, 2, 3, 4, 5]:  # Updated path validation
+        path = 1  # Default to No Path if invalid
+    logger.debug("Parsed turn request", extra={
+        "student": student_address, "path": path, "eth_amount": eth_amount, "prompt_chars": len(prompt or ""),
+    })
+
+    if not student_address or not prompt:
+        return None, ({"error": "Missing student address or prompt"}, 400)
+
+    # Validate prompt against path rules
+    is_valid, error_message = validate_prompt_for_path(prompt, path)
+    if not is_valid:
+        return None, ({"custom error": error_message}, 400)
+
+    return {"student_address": student_address, "prompt": prompt, "eth_amount": eth_amount, "path": path}, None
+
+
+def build_turn(fields, stats, history=None):
+    lessons, score, sessions, balance, badge_ids, current_path, challenges = stats
+    logger.debug("Current stats", extra={
+        "student": fields["student_address"], "lessons": lessons, "score": score, "sessions": sessions,
+        "challenges": challenges,
+    })
+    path = fields["path"]
+    return dict(
+        fields,
+        lessons=lessons,
+        score=score,
+        sessions=sessions,
+        balance=balance,
+        badge_ids=badge_ids,
+        challenges=challenges,
+        # Get AI response with path-specific context
+        context=f"Lessons completed: {lessons}, Path: {PATH_CONTEXT[path]}",
+        cache_key=make_key(path, lessons, fields["prompt"], Config.RESPONSE_CACHE_LESSON_BUCKET),
+        # Earlier turns of this student's conversation on the path, as chat messages
+        history=history or [],
+    )
+
+
+def turn_record(turn, response):
+    # Arguments for recordTurn, in contract order
+    lessons = turn["lessons"]
+    question_complexity = min(len(turn["prompt"]) // 10, 10)
+    timestamp = int(datetime.datetime.now().timestamp())
+    # Simulate a challenge (e.g., every 3rd lesson); 0 means no challenge
+    challenge_id = (lessons + 1) // 3 if (lessons + 1) % 3 == 0 else 0
+    return [
+        turn["student_address"], lessons + 1, question_complexity, turn["path"],
+        challenge_id, turn["prompt"], response, timestamp,
+    ]
+
+
+def anchored_turn(record, digest):
+    # recordTurnsAnchored entry for a turn whose message is in the chat store:
+    # the record with prompt and response replaced by their digest
+    student, lessons, score, path, challenge_id, prompt, response, timestamp = record
+    return [student, lessons, score, path, challenge_id, digest, timestamp]
+
+
+def llm_error(response):
+    # (error_body, 502) if the LLM call failed, else None. A failed call is
+    # not a turn: nothing is recorded on-chain, no lesson is counted and it
+    # is not remembered, for /tutor and /tutor/stream alike.
+    if response.startswith(ERROR_PREFIX):
+        return {"error": response}, 502
+    return None
+
+
+def remember_turn(memory, turn, record):
+    # Adds a recorded turn to the ConversationMemory
+    memory.add(turn["student_address"], turn["path"], turn["prompt"], record[6], record[7])
+
+
+def turn_writes(record, anchored=None):
+    # Write-behind queue entry for a turn: a one-turn recordTurns, or
+    # recordTurnsAnchored for anchored turns, which the queue merges with
+    # the turns queued behind it
+    if anchored is not None:
+        return [["recordTurnsAnchored", [[anchored]]]]
+    return [["recordTurns", [[record]]]]
+
+
+def turn_result(turn, record, job_id=None):
+    # JSON body for /tutor; with a job_id (write-behind) the stats are optimistic
+    eth_amount = turn["eth_amount"]
+    result = {
+        "response": record[6],
+        "progress": record[1],
+        "score": turn["score"] + record[2],
+        "sessions": turn["sessions"] + 1 if eth_amount > 0 else turn["sessions"],
+        "balance": (turn["balance"] + (eth_amount if eth_amount > 0 else 0)) / 10**18,
+        "badges": turn["badge_ids"],
+        "path": turn["path"],
+        "challenges": turn["challenges"]
+    }
+    if job_id is not None:
+        result["challenges"] = turn["challenges"] + 1 if record[4] else turn["challenges"]
+        result["job_id"] = job_id
+        result["tx_status"] = "pending"
+    return result
+
+
+def stats_result(stats):
+    lessons, score, sessions, balance, badge_ids, path, challenges = stats
+    return {
+        "lessons": lessons,
+        "score": score,
+        "sessions": sessions,
+        "balance": balance / 10**18,
+        "badges": badge_ids,
+        "path": path,
+        "challenges": challenges,
+    }
+
+
+def parse_stats_batch(data):
+    # Returns (addresses, None) or (None, (error_body, status))
+    addresses = data.get("addresses")
+    if not isinstance(addresses, list) or not addresses:
+        return None, ({"error": "Missing addresses"}, 400)
+    if len(addresses) > MAX_STATS_BATCH:
+        return None, ({"error": f"At most {MAX_STATS_BATCH} addresses per request"}, 400)
+    invalid = [address for address in addresses if not isinstance(address, str) or not Web3.is_address(address)]
+    if invalid:
+        return None, ({"error": f"Invalid address: {invalid[0]}"}, 400)
+    # Duplicates are read once
+    return list(dict.fromkeys(addresses)), None
+
+
+def history_result(messages):
+    history = []
+    for message in messages:
+        entry = {
+            "prompt": message["prompt"],
+            "response": message["response"],
+            "timestamp": datetime.datetime.fromtimestamp(message["timestamp"]).strftime('%Y-%m-%d %H:%M:%S'),
+            "path": message["path"]
+        }
+        # Anchored messages: digest, leaf, Merkle proof and root to check them
+        if "verification" in message:
+            entry["verification"] = message["verification"]
+        history.append(entry)
+    return history
@@ -0,0 +1,394 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from web3 import Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from nonce_manager import is_nonce_error
+from process_lock import process_lock
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT UNIQUE NOT NULL,
+    writes TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    signed_txs TEXT,
+    tx_hashes TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+"""
+
+# Writes whose only argument is a list of turns. Consecutive pending jobs made
+# of one such write are merged into a single transaction.
+MERGEABLE = ("recordTurns", "recordTurnsAnchored")
+
+# pending -> sent -> mined, or failed after too many attempts
+PENDING, SENT, MINED, FAILED = "pending", "sent", "mined", "failed"
+
+# Turn data (JSON-encoded prompts, replies and fields) in one merged
+# transaction. Each byte costs calldata and event-log gas, so this keeps a
+# batch of long chat messages well under a block's gas limit.
+MAX_BATCH_BYTES = 64 * 1024
+
+
+class TxQueue:
+    # Durable write-behind queue for owner transactions, backed by SQLite.
+    #
+    # A job is the list of contract writes for one tutoring turn, e.g.
+    # [["recordTurns", [[[student, lessons, score, path, ...]]]]]. The worker
+    # drains jobs strictly in enqueue order. Before a job's transactions are
+    # broadcast for the first time, the signed raw transactions are written to
+    # the database. After a crash or retry we only ever re-broadcast those
+    # exact bytes. Each one carries a fixed nonce, so it can be mined at most
+    # once. That is why a restart cannot duplicate a write.
+    #
+    # Jobs that each hold a single MERGEABLE write are batched: the worker
+    # takes up to max_batch of them from the head of the queue and sends
+    # their turns as one transaction. They share signed_txs and a batch_id
+    # (the first job's id) and move through the states together. Under load
+    # the batches grow on their own; when idle a batch is a single job. A
+    # batch also stops at max_batch_bytes of turn data, and one that can't be
+    # signed (e.g. its gas estimate fails) is halved until it can, down to a
+    # single job that then uses up its own attempts.
+    #
+    # Any process can enqueue, but only one drains a given queue file: the
+    # worker holds an flock on <path>.lock while it runs, and the workers of
+    # other processes wait on it to take over.
+    #
+    # The worker outlives node outages. A job that fails because the node
+    # can't be reached (an OSError, e.g. a refused connection or timeout)
+    # stays at its attempt count and is retried with backoff, so queued
+    # turns are written once the node is back.
+    #
+    # A sent job that runs out of attempts may still sit in a node's pool
+    # and be mined once a later nonce fills the gap before it. So before it
+    # is marked failed, a receipt found for it counts as the result, and
+    # transactions without one are replaced by a 0-value self-transfer at the
+    # same nonce.
+
+    def __init__(self, blockchain, path, max_attempts=5, poll_interval=0.5, receipt_timeout=120, max_batch=50,
+                 max_batch_bytes=MAX_BATCH_BYTES):
+        self.blockchain = blockchain
+        self.path = path
+        self.max_attempts = max_attempts
+        self.max_batch = max_batch
+        self.max_batch_bytes = max_batch_bytes
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(jobs)")]
+        if "batch_id" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        if "nonces" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN nonces TEXT")
+        self.worker = None
+
+    def enqueue(self, writes):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO jobs (job_id, writes, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, json.dumps(writes), PENDING, now, now),
+            )
+        self.wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT status, attempts, tx_hashes, error, created_at, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, attempts, tx_hashes, error, created_at, updated_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "attempts": attempts,
+            "tx_hashes": json.loads(tx_hashes) if tx_hashes else [],
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, name="tx-queue", daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        with process_lock(f"{self.path}.lock"):
+            recovered = False
+            failures = 0  # in a row, for the backoff
+            while True:
+                try:
+                    if not recovered:
+                        self._recover()
+                        recovered = True
+                    jobs = self._next_batch()
+                    if not jobs:
+                        self.wakeup.wait(self.poll_interval)
+                        self.wakeup.clear()
+                        continue
+                    if self._process(jobs):
+                        failures = 0
+                        continue
+                except Exception:
+                    logger.exception("Write-behind worker error")
+                # Back off before retrying the head of the queue
+                failures += 1
+                time.sleep(min(2 ** failures, 60) * self.poll_interval)
+
+    def _recover(self):
+        # Jobs left in "sent" by a previous process get their saved transactions
+        # re-broadcast before anything new is signed. Then the nonce counter
+        # is re-seeded from the node. Raises if the node can't be reached;
+        # _run retries it before taking any job.
+        with self.lock:
+            rows = self.db.execute("SELECT signed_txs FROM jobs WHERE status = ? ORDER BY seq", (SENT,)).fetchall()
+        # Jobs of one batch share their transactions; send those once
+        for signed_txs in dict.fromkeys(signed_txs for (signed_txs,) in rows):
+            self._broadcast(json.loads(signed_txs))
+        if rows:
+            self.blockchain.nonces.resync()
+
+    def _resync(self):
+        # Re-seed the nonce counter from the node, or if the node is down
+        # leave it unknown so the next reservation asks the node
+        try:
+            self.blockchain.nonces.resync()
+        except Exception as e:
+            logger.warning("Nonce resync failed", extra={"error": str(e)})
+            self.blockchain.nonces.forget()
+
+    def _select_jobs(self, where, params, limit):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT job_id, writes, status, attempts, signed_txs, tx_hashes, batch_id, nonces FROM jobs "
+                f"WHERE {where} ORDER BY seq LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [
+            {
+                "job_id": job_id,
+                "writes": json.loads(writes),
+                "status": status,
+                "attempts": attempts,
+                "signed_txs": json.loads(signed_txs) if signed_txs else None,
+                "tx_hashes": json.loads(tx_hashes) if tx_hashes else None,
+                "batch_id": batch_id,
+                "nonces": json.loads(nonces) if nonces else None,
+            }
+            for job_id, writes, status, attempts, signed_txs, tx_hashes, batch_id, nonces in rows
+        ]
+
+    def _next_batch(self):
+        # The head of the queue plus, for a pending mergeable job, the pending
+        # jobs right behind it that can share its transaction
+        head = self._select_jobs("status IN (?, ?)", (PENDING, SENT), 1)
+        if not head:
+            return []
+        job = head[0]
+        if job["status"] == SENT:
+            if job["batch_id"] is None:
+                return head
+            return self._select_jobs("batch_id = ? AND status = ?", (job["batch_id"], SENT), self.max_batch)
+        method = self._mergeable(job)
+        if method is None:
+            return head
+        jobs = []
+        size = 0
+        for candidate in self._select_jobs("status = ?", (PENDING,), self.max_batch):
+            if self._mergeable(candidate) != method:
+                break
+            size += len(json.dumps(candidate["writes"][0][1][0]))
+            if jobs and size > self.max_batch_bytes:
+                break
+            jobs.append(candidate)
+        return jobs
+
+    def _mergeable(self, job):
+        if len(job["writes"]) == 1 and job["writes"][0][0] in MERGEABLE:
+            return job["writes"][0][0]
+        return None
+
+    def _merged_writes(self, jobs):
+        if len(jobs) == 1:
+            return jobs[0]["writes"]
+        method = jobs[0]["writes"][0][0]
+        return [[method, [[turn for job in jobs for turn in job["writes"][0][1][0]]]]]
+
+    def _update(self, jobs, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                f"UPDATE jobs SET {columns} WHERE job_id = ?", [(*fields.values(), job["job_id"]) for job in jobs]
+            )
+            self.db.execute("COMMIT")
+
+    def _fail_attempt(self, jobs, error):
+        attempts = jobs[0]["attempts"] + 1
+        sent = jobs[0]["signed_txs"] is not None
+        status = FAILED if attempts >= self.max_attempts and not sent else jobs[0]["status"]
+        logger.warning("Write-behind job attempt failed", extra={
+            "job_id": jobs[0]["job_id"], "batch_size": len(jobs), "attempt": attempts, "error": str(error),
+        })
+        self._update(jobs, attempts=attempts, status=status, error=str(error))
+        for job in jobs:
+            job["attempts"] = attempts
+        if attempts >= self.max_attempts and sent:
+            self._give_up(jobs, error)
+
+    def _receipt(self, tx_hash):
+        try:
+            return self.blockchain.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+
+    def _give_up(self, jobs, error):
+        # Settle a sent job that is out of attempts: by its receipts if it was
+        # mined after all, or else by cancelling what is still unmined. Raises
+        # if the node can't be reached, leaving the job sent for the next try.
+        job = jobs[0]
+        receipts = [self._receipt(tx_hash) for tx_hash in job["tx_hashes"]]
+        if all(receipts):
+            self._finish(jobs, receipts)
+            return
+        if job["nonces"] is None:
+            # Signed before nonces were saved; nothing to replace it with
+            logger.warning("Write-behind job failed without cancelling its transactions", extra={
+                "job_id": job["job_id"],
+            })
+            self._update(jobs, status=FAILED)
+            return
+        for nonce, receipt in zip(job["nonces"], receipts):
+            if receipt is not None:
+                continue
+            try:
+                cancel_hash = self.blockchain.cancel_owner_transaction(nonce)
+            except Exception as e:
+                # The nonce is taken after all, e.g. by the original
+                if not is_nonce_error(e):
+                    raise
+                continue
+            self.blockchain.w3.eth.wait_for_transaction_receipt(cancel_hash, timeout=self.receipt_timeout)
+        receipts = [self._receipt(tx_hash) for tx_hash in job["tx_hashes"]]
+        if all(receipts):
+            self._finish(jobs, receipts)
+            return
+        cancelled = [nonce for nonce, receipt in zip(job["nonces"], receipts) if receipt is None]
+        logger.warning("Write-behind job failed, transactions cancelled", extra={
+            "job_id": job["job_id"], "nonces": cancelled,
+        })
+        self._update(jobs, status=FAILED, error=f"{error} (cancelled at nonces {cancelled})")
+        self._invalidate(jobs, [receipt for receipt in receipts if receipt is not None])
+
+    def _sign(self, jobs):
+        signed_txs, tx_hashes, nonces = [], [], []
+        for method, args in self._merged_writes(jobs):
+            contract_call = self.blockchain.contract_call(method, args)
+            nonce, signed_tx = self.blockchain.sign_owner_transaction(contract_call)
+            signed_txs.append(Web3.to_hex(signed_tx.raw_transaction))
+            tx_hashes.append(Web3.to_hex(signed_tx.hash))
+            nonces.append(nonce)
+        # Persist before the first broadcast; from here on the jobs are pinned
+        # to these transactions.
+        batch_id = jobs[0]["job_id"] if len(jobs) > 1 else None
+        self._update(
+            jobs, status=SENT, signed_txs=json.dumps(signed_txs), tx_hashes=json.dumps(tx_hashes),
+            nonces=json.dumps(nonces), batch_id=batch_id,
+        )
+        for job in jobs:
+            job.update(status=SENT, signed_txs=signed_txs, tx_hashes=tx_hashes, nonces=nonces, batch_id=batch_id)
+
+    def _broadcast(self, signed_txs):
+        for raw_tx in signed_txs:
+            try:
+                self.blockchain.w3.eth.send_raw_transaction(raw_tx)
+            except Exception as e:
+                # Already in the pool or already mined: that is what we want
+                if not is_nonce_error(e):
+                    raise
+
+    def _process(self, jobs):
+        job = jobs[0]
+        try:
+            if job["signed_txs"] is None:
+                self._sign(jobs)
+            self._broadcast(job["signed_txs"])
+            receipts = [
+                self.blockchain.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.receipt_timeout)
+                for tx_hash in job["tx_hashes"]
+            ]
+        except TimeExhausted as e:
+            self._resync()
+            self._fail_attempt(jobs, e)
+            return False
+        except Exception as e:
+            if job["signed_txs"] is None:
+                # Nothing was persisted, so the reserved nonces are free again
+                self._resync()
+                if len(jobs) > 1 and not isinstance(e, OSError):
+                    # Likely too big for a block; send the first half alone
+                    logger.warning("Write-behind batch could not be signed, splitting it", extra={
+                        "job_id": job["job_id"], "batch_size": len(jobs), "error": str(e),
+                    })
+                    return self._process(jobs[:len(jobs) // 2])
+            if isinstance(e, OSError):
+                # Node unreachable: not the job's fault, so not an attempt
+                logger.warning("Node unreachable, write-behind job waits", extra={
+                    "job_id": job["job_id"], "error": str(e),
+                })
+                self._update(jobs, error=str(e))
+            else:
+                self._fail_attempt(jobs, e)
+            return False
+
+        self._finish(jobs, receipts)
+        return True
+
+    def _finish(self, jobs, receipts):
+        reverted = [tx_hash for tx_hash, receipt in zip(jobs[0]["tx_hashes"], receipts) if receipt["status"] != 1]
+        if reverted:
+            self._update(jobs, status=FAILED, error=f"Reverted: {', '.join(reverted)}")
+        else:
+            self._update(jobs, status=MINED, error=None)
+        self._invalidate(jobs, receipts)
+
+    def _invalidate(self, jobs, receipts):
+        if not receipts:
+            return
+        block = max(receipt["blockNumber"] for receipt in receipts)
+        for student in self._students(jobs):
+            self.blockchain.stats_cache.invalidate(student, block)
+
+    def _students(self, jobs):
+        # Owner writes take the student as their first argument; merged
+        # writes take a list of turns that each start with the student
+        students = set()
+        for job in jobs:
+            for method, args in job["writes"]:
+                if method in MERGEABLE:
+                    students.update(turn[0] for turn in args[0])
+                else:
+                    students.add(args[0])
+        return students